@@ -4,14 +4,20 @@
 核心设计：
 - 使用 deepagents.create_deep_agent（同时支持 middleware + checkpoint）
 - Skills 由 deepagents.middleware.skills.SkillsMiddleware 自动管理
-- Checkpoint 由 LangGraph MemorySaver 提供
+- 同一步的多个工具调用并发执行，并发数由 app.middleware.ToolFanoutMiddleware 限制
+- Checkpoint：对话路径使用 app.checkpoint 的共享 SQLite checkpointer（get_agent 单独调用时默认 MemorySaver）
 - 工具从 app.tools 统一注册
+- 编译好的 agent 按 (model, base_url, api_key 摘要, 工具集, checkpointer) 进程级缓存，
+  模型配置变更时由 set_llm_config 调用 invalidate_agent_cache 失效
 """
 
 from __future__ import annotations
 
+import hashlib
+import threading
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 from deepagents import create_deep_agent
 from deepagents.backends import LocalShellBackend
@@ -19,6 +25,7 @@ from deepagents.middleware.skills import SkillsMiddleware
 from langchain_core.tools import BaseTool
 from langgraph.checkpoint.memory import MemorySaver
 
+from app.middleware import ToolFanoutMiddleware
 from app.tools import build_vuln_scan_tools
 
 
@@ -35,6 +42,9 @@ BASE_SYSTEM_PROMPT = """
 
 使用工具时：
 - 优先用 tcp_port_scan 识别开放端口，再针对性用 http_get 分析 Web 服务。
+- 需要扫描多台主机或整个网段时，用 tcp_batch_scan 一次完成，不要逐台调用 tcp_port_scan。
+- 需要探测多个 Web 端口或 URL 时，用 http_batch_probe 一次完成，再对可疑目标用 http_get 查看细节。
+- 互不依赖的工具调用（如对多个 URL 分别 http_get）请在同一条回复中一次发出，它们会并发执行。
 - 技能知识会根据上下文自动注入，请结合技能说明和工具验证。
 - 当用户需要执行某技能的脚本时，使用 execute 运行脚本。execute 的工作目录是项目根，请用**相对路径**直接执行脚本（不要用 cd，不要用 /app 等绝对路径），例如：SKILL_CONTEXT='{"target":"example.com"}' python3 app/skills/scan-report/scripts/generate_template.py
 """
@@ -88,10 +98,70 @@ def get_agent(
         model=model_arg,
         tools=all_tools,
         system_prompt=final_system_prompt,
-        middleware=[skills_middleware],
+        middleware=[skills_middleware, ToolFanoutMiddleware()],
         checkpointer=checkpointer,
         backend=backend,
     )
     return agent
 
 
+# (model, base_url, api_key 摘要, 工具名元组, id(checkpointer)) -> 编译好的 agent
+_AgentCacheKey = Tuple[str, str, str, Tuple[str, ...], int]
+_agent_cache: Dict[_AgentCacheKey, Any] = {}
+_agent_cache_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def _default_tool_names() -> Tuple[str, ...]:
+    return tuple(t.name for t in build_vuln_scan_tools())
+
+
+def _api_key_digest(api_key: Optional[str]) -> str:
+    if not api_key:
+        return ""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def get_cached_agent(
+    llm_model: Optional[str] = None,
+    api_key: Optional[str] = None,
+    base_url: Optional[str] = None,
+    tools: Optional[List[Any]] = None,
+    checkpointer: Optional[Any] = None,
+) -> Any:
+    """
+    获取进程级缓存的 agent，命中时只是一次字典查找；未命中才调用 get_agent 构建。
+    缓存的 agent 在请求间共享（含模型客户端的 HTTP 连接池），checkpointer 须为共享实例
+    （如 app.checkpoint.get_checkpointer()）；不传时编译为无 checkpoint 的 agent。
+    """
+    tool_names = _default_tool_names() + tuple(
+        getattr(t, "name", repr(t)) for t in (tools or [])
+    )
+    key: _AgentCacheKey = (
+        llm_model or "gpt-4.1-mini",
+        (base_url or "").rstrip("/"),
+        _api_key_digest(api_key),
+        tool_names,
+        id(checkpointer) if checkpointer is not None else 0,
+    )
+    agent = _agent_cache.get(key)
+    if agent is not None:
+        return agent
+    with _agent_cache_lock:
+        agent = _agent_cache.get(key)
+        if agent is None:
+            agent = get_agent(
+                llm_model=llm_model,
+                api_key=api_key,
+                base_url=base_url,
+                tools=tools,
+                checkpointer=checkpointer if checkpointer is not None else False,
+            )
+            _agent_cache[key] = agent
+    return agent
+
+
+def invalidate_agent_cache() -> None:
+    """清空 agent 缓存（模型配置变更时调用）。"""
+    with _agent_cache_lock:
+        _agent_cache.clear()
@@ -0,0 +1,138 @@
+"""
+LangGraph checkpoint 持久化：进程内共享一个 checkpointer。
+
+- SQLite：AsyncSqliteSaver，单独的 checkpoints.db
+- PostgreSQL（DATABASE_URL 为 postgresql://）：AsyncPostgresSaver + psycopg 连接池，与业务表同库，
+  多个节点共享对话状态（需安装 langgraph-checkpoint-postgres）
+- thread_id = session_id，会话状态跨请求、跨进程重启保留
+- 每轮对话后检查该 thread 的 checkpoint 数，超过 CHECKPOINT_PRUNE_AFTER 时压缩为一个完整快照
+- 删除会话时同步删除对应 thread 的全部 checkpoint
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sys
+from typing import Any, Optional
+
+import aiosqlite
+from langgraph.channels import DeltaChannel
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+from app.config import (
+    CHECKPOINT_DB_PATH,
+    CHECKPOINT_PRUNE_AFTER,
+    DATABASE_DIALECT,
+    DATABASE_URL,
+    STORAGE_POOL_SIZE,
+)
+from app.db import sqlite_pragmas
+
+_saver: Optional[BaseCheckpointSaver] = None
+_saver_lock = asyncio.Lock()
+
+
+async def get_checkpointer() -> BaseCheckpointSaver:
+    """获取共享 checkpointer，首次调用时打开数据库并建表。"""
+    global _saver
+    if _saver is not None:
+        return _saver
+    async with _saver_lock:
+        if _saver is None:
+            if DATABASE_DIALECT == "postgresql":
+                saver = await _open_postgres_saver()
+            else:
+                conn = await aiosqlite.connect(str(CHECKPOINT_DB_PATH))
+                for pragma in sqlite_pragmas():
+                    await conn.execute(pragma)
+                saver = AsyncSqliteSaver(conn)
+            await saver.setup()
+            _saver = saver
+    return _saver
+
+
+async def _open_postgres_saver() -> BaseCheckpointSaver:
+    from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+    from psycopg.rows import dict_row
+    from psycopg_pool import AsyncConnectionPool
+    from sqlalchemy.engine import make_url
+
+    # DATABASE_URL 带 SQLAlchemy 驱动名（postgresql+psycopg），psycopg 需要普通的 libpq 地址
+    conninfo = make_url(DATABASE_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+    pool = AsyncConnectionPool(
+        conninfo,
+        max_size=STORAGE_POOL_SIZE,
+        kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row},
+        open=False,
+    )
+    await pool.open()
+    return AsyncPostgresSaver(pool)
+
+
+async def close_checkpointer() -> None:
+    """应用退出时关闭 checkpoint 数据库连接。"""
+    global _saver
+    async with _saver_lock:
+        if _saver is not None:
+            await _saver.conn.close()
+            _saver = None
+    # 缓存的 agent 引用了已关闭的 checkpointer（未加载过 agent 模块时无需处理，也避免退出时才去导入）
+    agent_module = sys.modules.get("app.agent_vuln")
+    if agent_module is not None:
+        agent_module.invalidate_agent_cache()
+
+
+async def prune_thread(graph: Any, thread_id: str) -> None:
+    """
+    thread 的 checkpoint（含子 agent 命名空间）超过 CHECKPOINT_PRUNE_AFTER 个时压缩为一个。
+
+    messages 等 DeltaChannel 只在快照点保存完整值，其余 checkpoint 依赖祖先链上的 writes 重建，
+    不能只删祖先。这里读出根命名空间最新 checkpoint 与完整状态，adelete_thread 删除整个 thread，
+    再用 aput 写回一个无父节点、DeltaChannel 为完整值的 checkpoint（from_checkpoint 按完整值读取）。
+    只用 checkpointer 的公开接口；删除与写回之间进程退出时 thread 为空，下一轮从 storage 回放历史。
+    """
+    saver = await get_checkpointer()
+    thread = {"configurable": {"thread_id": thread_id}}
+    count = 0
+    async for _ in saver.alist(thread, limit=CHECKPOINT_PRUNE_AFTER + 1):
+        count += 1
+    if count <= CHECKPOINT_PRUNE_AFTER:
+        return
+
+    root = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    latest = await saver.aget_tuple(root)
+    if latest is None:
+        return
+    checkpoint = latest.checkpoint
+    channel_values = dict(checkpoint["channel_values"])
+    delta_keys = [
+        k for k, ch in graph.channels.items()
+        if isinstance(ch, DeltaChannel) and k not in channel_values
+    ]
+    if delta_keys:
+        state = await graph.aget_state(thread)
+        for k in delta_keys:
+            if k in state.values:
+                channel_values[k] = state.values[k]
+            elif k in checkpoint["channel_versions"]:
+                # 写过但读不出完整值，无法安全生成快照，本次不裁剪
+                return
+
+    # 读取期间有新的 checkpoint 写入（同一会话的另一轮对话）时放弃，下一轮再裁剪
+    current = await saver.aget_tuple(root)
+    if current is None or current.checkpoint["id"] != checkpoint["id"]:
+        return
+    await saver.adelete_thread(thread_id)
+    await saver.aput(
+        root,
+        {**checkpoint, "channel_values": channel_values},
+        latest.metadata,
+        dict(checkpoint["channel_versions"]),
+    )
+
+
+async def delete_thread(thread_id: str) -> None:
+    """删除 thread 的全部 checkpoint（删除会话时调用）。"""
+    saver = await get_checkpointer()
+    await saver.adelete_thread(thread_id)
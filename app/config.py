@@ -1,7 +1,44 @@
+import os
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
-# 默认使用本地 SQLite 数据库，方便 demo 和开发
-DATABASE_URL = f"sqlite:///{BASE_DIR / 'data.db'}"
 
+def _database_urls(url: str) -> tuple[str, str, str]:
+    """返回 (同步驱动地址, 异步驱动地址, 方言)；PostgreSQL 未指定驱动时使用 psycopg（同步与异步共用）。"""
+    from sqlalchemy.engine import make_url
+
+    parsed = make_url(url.replace("postgres://", "postgresql://", 1))
+    dialect = parsed.get_backend_name()
+    if dialect == "sqlite":
+        return str(parsed), str(parsed.set(drivername="sqlite+aiosqlite")), dialect
+    if dialect == "postgresql":
+        if parsed.drivername == "postgresql":
+            parsed = parsed.set(drivername="postgresql+psycopg")
+        rendered = parsed.render_as_string(hide_password=False)
+        return rendered, rendered, dialect
+    raise ValueError(f"不支持的 DATABASE_URL 方言: {dialect}（可选 sqlite / postgresql）")
+
+
+# 默认使用本地 SQLite 数据库，方便 demo 和开发；多节点部署时设置 DATABASE_URL=postgresql://... 共享状态
+DATABASE_URL, ASYNC_DATABASE_URL, DATABASE_DIALECT = _database_urls(
+    os.environ.get("DATABASE_URL") or f"sqlite:///{BASE_DIR / 'data.db'}"
+)
+
+# 会话存储后端：async（异步引擎 + 连接池，默认）/ sync（同步 ORM 经线程池执行）；PostgreSQL 固定使用异步引擎
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "async").strip().lower()
+STORAGE_POOL_SIZE = int(os.environ.get("STORAGE_POOL_SIZE", "5"))
+
+# SQLite 性能模式：WAL + synchronous=NORMAL + busy_timeout + mmap（设为 0 恢复 SQLite 默认的回滚日志）
+SQLITE_PERFORMANCE_MODE = os.environ.get("SQLITE_PERFORMANCE_MODE", "1") not in ("0", "false", "False", "")
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+# 消息写入合并：并发写入的消息合并为一个事务提交（调用方仍等待提交完成并拿到消息 id）
+STORAGE_WRITE_BEHIND = os.environ.get("STORAGE_WRITE_BEHIND", "1") not in ("0", "false", "False", "")
+STORAGE_WRITE_BATCH = int(os.environ.get("STORAGE_WRITE_BATCH", "200"))
+
+# LangGraph checkpoint（对话状态）：SQLite 时单独存放，避免与业务表争用写锁；PostgreSQL 时与业务表同库
+CHECKPOINT_DB_PATH = Path(os.environ.get("CHECKPOINT_DB_PATH") or BASE_DIR / "checkpoints.db")
+# thread 的 checkpoint（含子 agent 命名空间）超过该数量时压缩为一个，见 app.checkpoint.prune_thread
+CHECKPOINT_PRUNE_AFTER = int(os.environ.get("CHECKPOINT_PRUNE_AFTER", "100"))
@@ -1,29 +1,371 @@
+import logging
+import re
 from contextlib import contextmanager
-from typing import Generator
+from typing import TYPE_CHECKING, Generator, Optional
 
-from sqlalchemy import create_engine
+from sqlalchemy import Engine, create_engine, event, inspect
 from sqlalchemy.orm import DeclarativeBase, Session, sessionmaker
 
-from .config import DATABASE_URL
+from .config import (
+    ASYNC_DATABASE_URL,
+    DATABASE_DIALECT,
+    DATABASE_URL,
+    SQLITE_BUSY_TIMEOUT_MS,
+    SQLITE_MMAP_SIZE,
+    SQLITE_PERFORMANCE_MODE,
+    STORAGE_POOL_SIZE,
+)
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+logger = logging.getLogger(__name__)
 
 
 class Base(DeclarativeBase):
     pass
 
 
+def sqlite_pragmas() -> list[str]:
+    """每个新连接执行的 PRAGMA；WAL 下读写互不阻塞，synchronous=NORMAL 只在 checkpoint 时 fsync。"""
+    pragmas = [f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}"]
+    if SQLITE_PERFORMANCE_MODE:
+        pragmas += [
+            "PRAGMA journal_mode=WAL",
+            "PRAGMA synchronous=NORMAL",
+            f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+            "PRAGMA temp_store=MEMORY",
+        ]
+    return pragmas
+
+
+def _install_sqlite_pragmas(sync_engine: Engine) -> None:
+    if sync_engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(sync_engine, "connect")
+    def _on_connect(dbapi_connection, _record) -> None:
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in sqlite_pragmas():
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+
+def _engine_options() -> dict:
+    """网络数据库的连接池参数：取出连接前探活，数据库重启或连接被中间设备断开后自动重连。"""
+    if DATABASE_DIALECT == "sqlite":
+        return {}
+    return {"pool_pre_ping": True, "pool_recycle": 1800}
+
+
 engine = create_engine(
     DATABASE_URL,
     future=True,
+    **_engine_options(),
 )
+_install_sqlite_pragmas(engine)
 
 SessionLocal = sessionmaker(bind=engine, class_=Session, autoflush=False, autocommit=False, future=True)
 
+# 异步引擎按需创建（依赖 aiosqlite + greenlet），只在使用异步存储后端时初始化
+_async_engine: Optional["AsyncEngine"] = None
+_async_session_factory: Optional["async_sessionmaker[AsyncSession]"] = None
+
+
+def get_async_session_factory() -> "async_sessionmaker[AsyncSession]":
+    """异步 Session 工厂（连接池大小 STORAGE_POOL_SIZE）。"""
+    global _async_engine, _async_session_factory
+    if _async_session_factory is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+        _async_engine = create_async_engine(
+            ASYNC_DATABASE_URL,
+            pool_size=STORAGE_POOL_SIZE,
+            max_overflow=STORAGE_POOL_SIZE,
+            **_engine_options(),
+        )
+        _install_sqlite_pragmas(_async_engine.sync_engine)
+        _async_session_factory = async_sessionmaker(
+            _async_engine,
+            autoflush=False,
+            expire_on_commit=False,
+        )
+    return _async_session_factory
+
+
+async def dispose_async_engine() -> None:
+    """关闭异步引擎的连接池（应用退出时调用）。"""
+    global _async_engine, _async_session_factory
+    if _async_engine is not None:
+        await _async_engine.dispose()
+    _async_engine = None
+    _async_session_factory = None
+
+
+# 删除会话时级联删除其消息、删除消息时级联删除其工具调用、删除工具调用时释放其引用的 blob（引用计数归零即删除）：
+# 删除会话只需一条 DELETE（表结构由 create_all 建立，不便加外键约束）。
+# BEFORE DELETE：删除消息时会话行仍在，全文索引触发器据此取得 owner（旧库中的 AFTER 版本由 SQLITE_REPLACED_TRIGGERS 重建）
+SQLITE_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_conversation_messages_delete_tool_calls
+    AFTER DELETE ON conversation_messages
+    BEGIN
+        DELETE FROM message_tool_calls WHERE message_id = OLD.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_message_tool_calls_release_blob
+    AFTER DELETE ON message_tool_calls
+    WHEN OLD.output_hash IS NOT NULL
+    BEGIN
+        UPDATE blobs SET refcount = refcount - 1 WHERE hash = OLD.output_hash;
+        DELETE FROM blobs WHERE hash = OLD.output_hash AND refcount <= 0;
+    END
+    """,
+]
+
+# 定义改过的触发器：与 sqlite_master 中保存的 SQL 不同时才删除重建（见 _replace_sqlite_trigger）
+SQLITE_REPLACED_TRIGGERS = {
+    "trg_sessions_delete_messages": """
+    CREATE TRIGGER trg_sessions_delete_messages
+    BEFORE DELETE ON sessions
+    BEGIN
+        DELETE FROM conversation_messages WHERE session_id = OLD.session_id;
+    END
+    """,
+}
+
+# 全文检索（app.storage.search）：FTS5（trigram 分词）外部内容表，随消息插入 / 删除 / 修改由触发器增量维护。
+# owner 列为每个用户随机生成的 4 个 CJK 字符（search_owners），查询时与关键词一起 MATCH，
+# 在索引内按用户过滤：代价取决于该用户的消息数，而不是全库命中数。
+SQLITE_FTS_TABLE = "conversation_messages_fts"
+_RANDOM_CJK = "19968 + abs(random() % 20000)"
+_OWNER_KEY_SQL = f"char({_RANDOM_CJK}, {_RANDOM_CJK}, {_RANDOM_CJK}, {_RANDOM_CJK})"
+_OWNER_OF_MESSAGE = (
+    "SELECT o.owner_key FROM sessions s JOIN search_owners o ON o.user_id = s.user_id "
+    "WHERE s.session_id = {ref}.session_id"
+)
+SQLITE_FTS = [
+    "CREATE TABLE IF NOT EXISTS search_owners (user_id VARCHAR(64) PRIMARY KEY, owner_key TEXT NOT NULL)",
+    """
+    CREATE VIEW IF NOT EXISTS conversation_messages_search AS
+    SELECT m.id AS id, m.content AS content, o.owner_key AS owner
+    FROM conversation_messages m
+    JOIN sessions s ON s.session_id = m.session_id
+    JOIN search_owners o ON o.user_id = s.user_id
+    """,
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_FTS_TABLE} USING fts5(
+        content, owner,
+        content='conversation_messages_search', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_sessions_search_owner
+    AFTER INSERT ON sessions
+    BEGIN
+        INSERT OR IGNORE INTO search_owners (user_id, owner_key) VALUES (NEW.user_id, {_OWNER_KEY_SQL});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_conversation_messages_fts_insert
+    AFTER INSERT ON conversation_messages
+    BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}(rowid, content, owner)
+        SELECT NEW.id, NEW.content, ({_OWNER_OF_MESSAGE.format(ref="NEW")});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_conversation_messages_fts_delete
+    AFTER DELETE ON conversation_messages
+    BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, content, owner)
+        SELECT 'delete', OLD.id, OLD.content, ({_OWNER_OF_MESSAGE.format(ref="OLD")});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_conversation_messages_fts_update
+    AFTER UPDATE OF content ON conversation_messages
+    BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, content, owner)
+        SELECT 'delete', OLD.id, OLD.content, ({_OWNER_OF_MESSAGE.format(ref="OLD")});
+        INSERT INTO {SQLITE_FTS_TABLE}(rowid, content, owner)
+        SELECT NEW.id, NEW.content, ({_OWNER_OF_MESSAGE.format(ref="NEW")});
+    END
+    """,
+]
+# 新建索引时：为已有用户生成 owner_key 并为已有消息补建索引
+SQLITE_FTS_BACKFILL = [
+    f"INSERT OR IGNORE INTO search_owners (user_id, owner_key) SELECT user_id, {_OWNER_KEY_SQL} FROM sessions GROUP BY user_id",
+    f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}) VALUES ('rebuild')",
+]
+
+# PostgreSQL 14+（CREATE OR REPLACE TRIGGER）
+POSTGRES_TRIGGERS = [
+    """
+    CREATE OR REPLACE FUNCTION trg_sessions_delete_messages() RETURNS trigger AS $$
+    BEGIN
+        DELETE FROM conversation_messages WHERE session_id = OLD.session_id;
+        RETURN OLD;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE TRIGGER trg_sessions_delete_messages
+    AFTER DELETE ON sessions
+    FOR EACH ROW EXECUTE FUNCTION trg_sessions_delete_messages()
+    """,
+    """
+    CREATE OR REPLACE FUNCTION trg_conversation_messages_delete_tool_calls() RETURNS trigger AS $$
+    BEGIN
+        DELETE FROM message_tool_calls WHERE message_id = OLD.id;
+        RETURN OLD;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE TRIGGER trg_conversation_messages_delete_tool_calls
+    AFTER DELETE ON conversation_messages
+    FOR EACH ROW EXECUTE FUNCTION trg_conversation_messages_delete_tool_calls()
+    """,
+    """
+    CREATE OR REPLACE FUNCTION trg_message_tool_calls_release_blob() RETURNS trigger AS $$
+    BEGIN
+        IF OLD.output_hash IS NOT NULL THEN
+            UPDATE blobs SET refcount = refcount - 1 WHERE hash = OLD.output_hash;
+            DELETE FROM blobs WHERE hash = OLD.output_hash AND refcount <= 0;
+        END IF;
+        RETURN OLD;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE TRIGGER trg_message_tool_calls_release_blob
+    AFTER DELETE ON message_tool_calls
+    FOR EACH ROW EXECUTE FUNCTION trg_message_tool_calls_release_blob()
+    """,
+]
+
+# 全文检索：pg_trgm GIN 索引加速 ILIKE（需要创建扩展的权限，或由 DBA 预先创建 pg_trgm）；
+# 服务器未安装 pg_trgm（contrib）时跳过，搜索退化为不走索引的 ILIKE
+POSTGRES_FTS = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    CREATE INDEX IF NOT EXISTS ix_conversation_messages_content_trgm
+    ON conversation_messages USING gin (content gin_trgm_ops)
+    """,
+]
+
+# pg_trigger.tgtype 的位：FOR EACH ROW = 1，BEFORE = 2，各事件见下
+_PG_TRIGGER_ROW, _PG_TRIGGER_BEFORE = 1, 2
+_PG_TRIGGER_EVENTS = {"INSERT": 4, "DELETE": 8, "UPDATE": 16}
+
+_DIALECT_DDL = {
+    "sqlite": SQLITE_TRIGGERS + SQLITE_FTS,
+    "postgresql": POSTGRES_TRIGGERS,
+}
+
+# 多个节点同时启动时用该 advisory lock 串行执行建表（任意固定值）
+_INIT_DB_LOCK_ID = 7_215_001
+
+
+def _add_missing_columns(conn) -> None:
+    """已存在的表补加后来新增的列（create_all 不修改已有表；新增列均可为空）。"""
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                col_type = column.type.compile(dialect=conn.dialect)
+                conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}")
+
+
+def _replace_sqlite_trigger(conn, name: str, ddl: str) -> None:
+    """
+    已有同名触发器且定义一致时不执行任何 DDL：每条 DDL 都会递增 schema_version，
+    使所有连接上的预编译语句失效。
+    """
+    stored = conn.exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?", (name,)
+    ).scalar()
+    if stored is not None and stored.strip() == ddl.strip():
+        return
+    conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+    conn.exec_driver_sql(ddl)
+
+
+def _postgres_triggers_current(conn) -> bool:
+    """
+    POSTGRES_TRIGGERS 中的函数体与触发器（表、时机、事件、函数）都与库中一致时返回 True。
+    CREATE OR REPLACE TRIGGER 会锁住会话 / 消息表，只在定义变化（升级后首次启动）时执行。
+    """
+    functions, triggers = {}, {}
+    for ddl in POSTGRES_TRIGGERS:
+        kind, name = re.search(r"CREATE OR REPLACE (FUNCTION|TRIGGER) (\w+)", ddl).groups()
+        if kind == "FUNCTION":
+            functions[name] = ddl.split("$$")[1]
+            continue
+        timing, event_name, table = re.search(r"(BEFORE|AFTER) (\w+) ON (\w+)", ddl).groups()
+        tgtype = _PG_TRIGGER_ROW | _PG_TRIGGER_EVENTS[event_name]
+        if timing == "BEFORE":
+            tgtype |= _PG_TRIGGER_BEFORE
+        triggers[name] = (table, tgtype, re.search(r"EXECUTE FUNCTION (\w+)", ddl).group(1))
+    stored_functions = dict(conn.exec_driver_sql(
+        "SELECT proname, prosrc FROM pg_proc WHERE proname = ANY(%s)", (list(functions),)
+    ).all())
+    stored_triggers = {
+        r.tgname: (r.relname, r.tgtype, r.proname)
+        for r in conn.exec_driver_sql(
+            "SELECT t.tgname, c.relname, t.tgtype, p.proname FROM pg_trigger t "
+            "JOIN pg_class c ON c.oid = t.tgrelid JOIN pg_proc p ON p.oid = t.tgfoid "
+            "WHERE NOT t.tgisinternal AND t.tgname = ANY(%s)",
+            (list(triggers),),
+        )
+    }
+    return stored_functions == functions and stored_triggers == triggers
+
 
 def init_db() -> None:
-    """创建所有 ORM 表结构。"""
+    """
+    创建所有 ORM 表结构；已存在的表补加后来新增的列与索引（create_all 只处理新表），
+    以及各方言的触发器与全文检索索引。
+    """
     from . import models  # noqa: F401
 
-    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            conn.exec_driver_sql(f"SELECT pg_advisory_xact_lock({_INIT_DB_LOCK_ID})")
+        Base.metadata.create_all(bind=conn)
+        _add_missing_columns(conn)
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+        fts_missing = engine.dialect.name == "sqlite" and not conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE name = ?", (SQLITE_FTS_TABLE,)
+        ).first()
+        if engine.dialect.name == "sqlite":
+            for name, ddl in SQLITE_REPLACED_TRIGGERS.items():
+                _replace_sqlite_trigger(conn, name, ddl)
+        dialect_ddl = _DIALECT_DDL.get(engine.dialect.name, [])
+        if engine.dialect.name == "postgresql" and _postgres_triggers_current(conn):
+            dialect_ddl = []
+        for ddl in dialect_ddl:
+            conn.exec_driver_sql(ddl)
+        if fts_missing:
+            for ddl in SQLITE_FTS_BACKFILL:
+                conn.exec_driver_sql(ddl)
+        if engine.dialect.name == "postgresql" and not conn.exec_driver_sql(
+            "SELECT 1 FROM pg_indexes WHERE indexname = 'ix_conversation_messages_content_trgm'"
+        ).first():
+            if conn.exec_driver_sql("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'").first():
+                for ddl in POSTGRES_FTS:
+                    conn.exec_driver_sql(ddl)
+            else:
+                logger.warning("PostgreSQL 未安装 pg_trgm 扩展，消息搜索将不使用 trigram 索引")
 
 
 @contextmanager
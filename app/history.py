@@ -0,0 +1,233 @@
+"""
+对话历史窗口：按 token 预算裁剪送给模型的历史，较早的轮次压缩进滚动摘要。
+
+- 历史（摘要 + 保留的原始消息）超过 HISTORY_TOKEN_BUDGET 时触发压缩，
+  按整轮（从用户消息开始，含其后的工具调用与结果）从最早处淘汰，直到剩余不超过 HISTORY_KEEP_TOKENS
+- 摘要增量更新：只把「旧摘要 + 本次淘汰的轮次」交给模型合并，不重新通读全部历史
+- 摘要存于会话 metadata（history_summary / summary_turns），checkpoint 丢失时回放 storage 也能复用
+- token 数用 langchain 的近似计数估算，不依赖具体模型的分词器
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    SystemMessage,
+    ToolMessage,
+)
+from langchain_core.messages.utils import count_tokens_approximately
+
+logger = logging.getLogger(__name__)
+
+HISTORY_TOKEN_BUDGET = int(os.environ.get("HISTORY_TOKEN_BUDGET", "8000"))
+# 压缩后保留的原始历史上限，低于预算留出余量，避免每轮都触发一次摘要
+HISTORY_KEEP_TOKENS = int(os.environ.get("HISTORY_KEEP_TOKENS", str(HISTORY_TOKEN_BUDGET // 2)))
+SUMMARY_MAX_CHARS = int(os.environ.get("HISTORY_SUMMARY_MAX_CHARS", "2000"))
+# 交给摘要模型时单条消息的截断长度（扫描结果等工具输出可能很长）
+SUMMARY_ITEM_MAX_CHARS = 1500
+
+SUMMARY_META_KEY = "history_summary"
+SUMMARY_TURNS_META_KEY = "summary_turns"
+_SUMMARY_MARKER = "history_summary"
+
+SUMMARY_PROMPT = """你负责维护一段安全测试对话的滚动摘要。
+下面给出「已有摘要」和「新增对话」，请输出合并后的新摘要：
+- 保留测试目标与授权范围、已扫描的资产（主机 / 端口 / URL）、关键发现与结论、尚未完成的事项
+- 删除寒暄和重复信息，工具原始输出只保留结论性数据
+- 使用中文，不超过 {max_chars} 字，直接输出摘要正文
+
+已有摘要：
+{summary}
+
+新增对话：
+{transcript}
+"""
+
+
+@dataclass
+class HistoryWindow:
+    """压缩结果：summary 为合并后的摘要，kept 为保留的原始消息，evicted_turns 为本次折叠的轮数。"""
+
+    summary: str
+    kept: List[BaseMessage]
+    evicted: List[BaseMessage] = field(default_factory=list)
+    evicted_turns: int = 0
+
+    @property
+    def compacted(self) -> bool:
+        return bool(self.evicted)
+
+
+def estimate_tokens(messages: Sequence[BaseMessage]) -> int:
+    if not messages:
+        return 0
+    return count_tokens_approximately(messages)
+
+
+def is_summary_message(msg: BaseMessage) -> bool:
+    return bool(msg.additional_kwargs.get(_SUMMARY_MARKER))
+
+
+def summary_message(summary: str) -> HumanMessage:
+    """摘要以一条带标记的用户消息放在历史最前面（部分模型不接受中途的 system 消息）。"""
+    return HumanMessage(
+        content=f"以下是此前对话的摘要，供继续对话参考：\n{summary}",
+        additional_kwargs={_SUMMARY_MARKER: True},
+    )
+
+
+def _split_turns(messages: Sequence[BaseMessage]) -> List[List[BaseMessage]]:
+    """按用户消息切分为轮次；开头不以用户消息起始的零散消息并入第一轮。"""
+    turns: List[List[BaseMessage]] = []
+    seen_user = False
+    for msg in messages:
+        is_user = isinstance(msg, HumanMessage)
+        if not turns or (is_user and seen_user):
+            turns.append([msg])
+        else:
+            turns[-1].append(msg)
+        seen_user = seen_user or is_user
+    return turns
+
+
+def split_for_budget(
+    messages: Sequence[BaseMessage],
+    keep_tokens: int,
+) -> Tuple[List[List[BaseMessage]], List[BaseMessage]]:
+    """
+    从最新一轮往前累加，保留总量不超过 keep_tokens 的整轮；至少保留最近一轮。
+    返回 (淘汰的轮次, 保留的消息)。
+    """
+    turns = _split_turns(messages)
+    kept_turns: List[List[BaseMessage]] = []
+    used = 0
+    for turn in reversed(turns):
+        cost = estimate_tokens(turn)
+        if kept_turns and used + cost > keep_tokens:
+            break
+        kept_turns.append(turn)
+        used += cost
+    kept_turns.reverse()
+    evicted = turns[: len(turns) - len(kept_turns)]
+    return evicted, [m for turn in kept_turns for m in turn]
+
+
+def _clip(text: str, limit: int = SUMMARY_ITEM_MAX_CHARS) -> str:
+    text = text.strip()
+    return text if len(text) <= limit else f"{text[:limit]}…（已截断 {len(text) - limit} 字符）"
+
+
+def _content_text(msg: BaseMessage) -> str:
+    content = msg.content
+    if isinstance(content, str):
+        return content
+    parts = [p.get("text", "") if isinstance(p, dict) else str(p) for p in content]
+    return "".join(parts)
+
+
+def render_transcript(messages: Sequence[BaseMessage]) -> str:
+    lines: List[str] = []
+    for msg in messages:
+        text = _content_text(msg)
+        if isinstance(msg, HumanMessage):
+            lines.append(f"用户: {_clip(text)}")
+        elif isinstance(msg, AIMessage):
+            if text.strip():
+                lines.append(f"助手: {_clip(text)}")
+            for tc in msg.tool_calls:
+                lines.append(f"助手调用工具 {tc.get('name')}: {_clip(str(tc.get('args')), 300)}")
+        elif isinstance(msg, ToolMessage):
+            lines.append(f"工具结果[{msg.name or ''}]: {_clip(text)}")
+        elif isinstance(msg, SystemMessage):
+            continue
+        else:
+            lines.append(f"{msg.type}: {_clip(text)}")
+    return "\n".join(lines)
+
+
+async def summarize(model: Any, previous: str, evicted: Sequence[BaseMessage]) -> str:
+    """把新淘汰的消息合并进已有摘要。"""
+    prompt = SUMMARY_PROMPT.format(
+        max_chars=SUMMARY_MAX_CHARS,
+        summary=previous or "（无）",
+        transcript=render_transcript(evicted),
+    )
+    resp = await model.ainvoke([HumanMessage(content=prompt)])
+    return _content_text(resp).strip()[:SUMMARY_MAX_CHARS]
+
+
+async def build_window(
+    messages: Sequence[BaseMessage],
+    summary: str,
+    model_factory: Callable[[], Any],
+    *,
+    budget: int = HISTORY_TOKEN_BUDGET,
+    keep_tokens: int = HISTORY_KEEP_TOKENS,
+) -> HistoryWindow:
+    """
+    messages 为既往历史（不含本轮用户输入），开头的旧摘要消息会被忽略，以 summary 为准。
+    未超预算时原样返回；超出时淘汰最早的轮次并增量更新摘要。
+    model_factory 只在需要生成摘要时调用，多数轮次不创建摘要模型。
+    摘要模型调用失败时本轮不压缩，下一轮再试。
+    """
+    history = [m for m in messages if not is_summary_message(m)]
+    head = [summary_message(summary)] if summary else []
+    if estimate_tokens(head + history) <= budget:
+        return HistoryWindow(summary=summary, kept=history)
+
+    evicted_turns, kept = split_for_budget(history, keep_tokens)
+    if not evicted_turns:
+        return HistoryWindow(summary=summary, kept=history)
+    evicted = [m for turn in evicted_turns for m in turn]
+    try:
+        new_summary = await summarize(model_factory(), summary, evicted)
+    except Exception as e:
+        logger.warning("历史摘要生成失败，本轮不压缩：%s", e)
+        return HistoryWindow(summary=summary, kept=history)
+    if not new_summary:
+        return HistoryWindow(summary=summary, kept=history)
+    return HistoryWindow(
+        summary=new_summary,
+        kept=kept,
+        evicted=evicted,
+        evicted_turns=len(evicted_turns),
+    )
+
+
+def messages_from_storage(
+    history: Sequence[Dict[str, Any]],
+    skip_turns: int = 0,
+) -> List[BaseMessage]:
+    """把 storage 中的消息记录转为 langchain 消息，跳过已折叠进摘要的前 skip_turns 轮。"""
+    out: List[BaseMessage] = []
+    turns = 0
+    for m in history:
+        role = m.get("role")
+        if role == "user":
+            turns += 1
+        if turns <= skip_turns:
+            continue
+        if role == "user":
+            out.append(HumanMessage(content=m.get("content") or ""))
+        elif role == "assistant":
+            out.append(AIMessage(content=m.get("content") or ""))
+    return out
+
+
+def get_summary_model(llm_model: str, api_key: Optional[str], base_url: Optional[str]) -> Any:
+    """摘要使用与对话相同的模型配置，温度置 0。"""
+    from langchain_openai import ChatOpenAI
+
+    kwargs: Dict[str, Any] = {"model": llm_model, "temperature": 0}
+    if api_key:
+        kwargs["api_key"] = api_key
+    if base_url:
+        kwargs["base_url"] = base_url.rstrip("/")
+    return ChatOpenAI(**kwargs)
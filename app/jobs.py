@@ -0,0 +1,514 @@
+"""
+后台任务：长耗时的工具调用（批量扫描等）与整轮 agent 对话在工作池中执行，HTTP 请求只负责提交与查询。
+
+- 任务持久化在 jobs 表，结果写回数据库，客户端断开或重连后都可按 job_id 取回
+- 工作池是进程内的一组 asyncio worker，数量由 JOB_WORKERS 配置；
+  Web 进程设 JOB_WORKERS=0 并单独运行 `uv run worker`（run_worker.py），即可与 Web 分开扩缩
+- 认领任务用条件 UPDATE（status='queued' 才能改为 running，并在同一条语句中检查用户并发配额与会话串行），
+  多个工作进程共享同一张表也不会重复执行或越过限制
+- 配额：每个用户同时运行的任务数 ≤ JOB_PER_USER_CONCURRENCY，排队 + 运行中的任务数 ≤ JOB_PER_USER_PENDING；
+  同一会话的 agent 任务串行执行
+- 运行中的任务定期写心跳；进程崩溃或重启后，心跳超时的任务重新排队（超过 JOB_MAX_ATTEMPTS 次则置为失败），
+  正常退出时本进程的运行中任务直接重新排队
+- agent 任务不重试：中断时用户消息与部分回复可能已写入会话，重跑会重复追加，因此直接置为失败；
+  提交时即分配 session_id，失败的任务也能找到已保存的内容
+- 取消：排队中的任务直接取消；运行中的任务标记 cancel_requested，执行它的进程取消对应的 asyncio 任务
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import exists, func, insert, literal, or_, select, update
+from sqlalchemy.orm import aliased
+
+from app.db import get_session
+from app.models import JobModel
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+JOB_PER_USER_CONCURRENCY = int(os.environ.get("JOB_PER_USER_CONCURRENCY", "2"))
+JOB_PER_USER_PENDING = int(os.environ.get("JOB_PER_USER_PENDING", "20"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "1.0"))
+JOB_HEARTBEAT_INTERVAL = 5.0
+JOB_STALE_AFTER = 60.0
+
+AGENT_JOB_NAME = "agent"
+
+
+class JobKind(str, Enum):
+    TOOL = "tool"
+    AGENT = "agent"
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+FINISHED_STATUSES = frozenset({JobStatus.SUCCEEDED, JobStatus.FAILED, JobStatus.CANCELLED})
+
+
+class JobQuotaError(Exception):
+    """用户排队中的任务数已达上限。"""
+
+
+def _job_tools() -> Dict[str, Any]:
+    from app.tools import build_vuln_scan_tools
+    return {t.name: t for t in build_vuln_scan_tools()}
+
+
+def _job_to_dict(row: JobModel, include_result: bool = False) -> Dict[str, Any]:
+    out: Dict[str, Any] = {
+        "job_id": row.job_id,
+        "user_id": row.user_id,
+        "kind": row.kind,
+        "name": row.name,
+        "status": row.status,
+        "session_id": row.session_id,
+        "attempts": row.attempts,
+        "cancel_requested": bool(row.cancel_requested),
+        "error": row.error,
+        "created_at": row.created_at,
+        "started_at": row.started_at,
+        "finished_at": row.finished_at,
+    }
+    if include_result:
+        out["params"] = json.loads(row.params or "{}")
+        out["result"] = json.loads(row.result) if row.result else None
+    return out
+
+
+# ---------- 同步数据库操作（经 asyncio.to_thread 调用） ----------
+
+def _insert_job_sync(
+    user_id: str,
+    kind: str,
+    name: str,
+    params: Dict[str, Any],
+    session_id: Optional[str],
+    pending_limit: int,
+) -> Dict[str, Any]:
+    """
+    插入任务；配额检查与插入在同一条 INSERT ... SELECT 中完成，并发提交不会越过上限。
+    PostgreSQL 的 READ COMMITTED 下两条语句仍可能看到同一快照，先按用户取事务级 advisory 锁串行化。
+    """
+    pending = select(func.count()).select_from(JobModel).where(
+        JobModel.user_id == user_id,
+        JobModel.status.in_([JobStatus.QUEUED.value, JobStatus.RUNNING.value]),
+    ).scalar_subquery()
+    values = {
+        "job_id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "kind": kind,
+        "name": name,
+        "params": json.dumps(params, ensure_ascii=False),
+        "session_id": session_id,
+        "status": JobStatus.QUEUED.value,
+        "attempts": 0,
+        "cancel_requested": False,
+        "created_at": datetime.utcnow(),
+    }
+    columns = [getattr(JobModel, k) for k in values]
+    source = select(*(literal(v, type_=c.type) for v, c in zip(values.values(), columns))).where(
+        pending < pending_limit
+    )
+    with get_session() as session:
+        if session.get_bind().dialect.name == "postgresql":
+            session.execute(select(func.pg_advisory_xact_lock(func.hashtext(f"jobs:{user_id}"))))
+        inserted = session.scalar(
+            insert(JobModel).from_select(columns, source).returning(JobModel.job_id)
+        )
+        if inserted is None:
+            raise JobQuotaError(f"未完成的任务已达上限 {pending_limit}，请等待或取消已有任务")
+        return _job_to_dict(session.get(JobModel, values["job_id"]))
+
+
+def _claim_next_sync(worker_id: str, per_user_limit: int) -> Optional[Dict[str, Any]]:
+    """认领最早的可运行任务：跳过已达并发配额的用户，以及已有 agent 任务在运行的会话。"""
+    running = JobModel.status == JobStatus.RUNNING.value
+    saturated_users = (
+        select(JobModel.user_id).where(running).group_by(JobModel.user_id)
+        .having(func.count() >= per_user_limit)
+    )
+    busy_sessions = select(JobModel.session_id).where(
+        running, JobModel.kind == JobKind.AGENT.value, JobModel.session_id.is_not(None)
+    )
+    with get_session() as session:
+        candidates = session.execute(
+            select(JobModel.job_id, JobModel.user_id).where(
+                JobModel.status == JobStatus.QUEUED.value,
+                JobModel.user_id.not_in(saturated_users),
+                or_(
+                    JobModel.kind != JobKind.AGENT.value,
+                    JobModel.session_id.is_(None),
+                    JobModel.session_id.not_in(busy_sessions),
+                ),
+            ).order_by(JobModel.created_at).limit(8)
+        ).all()
+    # 上面的筛选只是预选；配额与会话串行的判断在认领的条件 UPDATE 中重新做，每个候选一个事务
+    for job_id, user_id in candidates:
+        job = _try_claim_sync(worker_id, job_id, user_id, per_user_limit)
+        if job is not None:
+            return job
+    return None
+
+
+def _try_claim_sync(worker_id: str, job_id: str, user_id: str, per_user_limit: int) -> Optional[Dict[str, Any]]:
+    """
+    条件 UPDATE 认领一个任务：仍在排队、该用户运行中的任务数未达上限、同一会话没有运行中的 agent 任务。
+    SQLite 的 UPDATE 在写锁下执行，条件与写入是原子的；PostgreSQL 的 READ COMMITTED 下并发 UPDATE
+    看不到彼此未提交的认领，先取与提交相同的用户级 advisory 锁串行化。
+    """
+    other = aliased(JobModel)
+    other_running = other.status == JobStatus.RUNNING.value
+    user_running = (
+        select(func.count()).select_from(other)
+        .where(other_running, other.user_id == JobModel.user_id)
+        .scalar_subquery()
+    )
+    session_busy = exists().where(
+        other_running, other.kind == JobKind.AGENT.value, other.session_id == JobModel.session_id
+    )
+    now = datetime.utcnow()
+    with get_session() as session:
+        if session.get_bind().dialect.name == "postgresql":
+            session.execute(select(func.pg_advisory_xact_lock(func.hashtext(f"jobs:{user_id}"))))
+        claimed = session.scalar(
+            update(JobModel)
+            .where(
+                JobModel.job_id == job_id,
+                JobModel.status == JobStatus.QUEUED.value,
+                user_running < per_user_limit,
+                or_(
+                    JobModel.kind != JobKind.AGENT.value,
+                    JobModel.session_id.is_(None),
+                    ~session_busy,
+                ),
+            )
+            .values(
+                status=JobStatus.RUNNING.value,
+                worker_id=worker_id,
+                started_at=now,
+                heartbeat_at=now,
+                attempts=JobModel.attempts + 1,
+            )
+            .returning(JobModel.job_id)
+            .execution_options(synchronize_session=False)
+        )
+        if claimed is None:
+            return None
+        return _job_to_dict(session.get(JobModel, job_id), include_result=True)
+
+
+def _finish_job_sync(
+    job_id: str,
+    worker_id: str,
+    status: JobStatus,
+    result: Optional[Dict[str, Any]] = None,
+    error: Optional[str] = None,
+    session_id: Optional[str] = None,
+) -> None:
+    values: Dict[str, Any] = {
+        "status": status.value,
+        "finished_at": datetime.utcnow(),
+        "result": json.dumps(result, ensure_ascii=False, default=str) if result is not None else None,
+        "error": error,
+    }
+    if session_id:
+        values["session_id"] = session_id
+    with get_session() as session:
+        session.execute(
+            update(JobModel)
+            .where(
+                JobModel.job_id == job_id,
+                JobModel.worker_id == worker_id,
+                JobModel.status == JobStatus.RUNNING.value,
+            )
+            .values(**values)
+        )
+
+
+def _heartbeat_sync(worker_id: str, job_ids: List[str]) -> List[str]:
+    """刷新本进程运行中任务的心跳，返回其中被请求取消的任务。"""
+    if not job_ids:
+        return []
+    with get_session() as session:
+        session.execute(
+            update(JobModel)
+            .where(JobModel.job_id.in_(job_ids), JobModel.worker_id == worker_id)
+            .values(heartbeat_at=datetime.utcnow())
+        )
+        return list(session.scalars(
+            select(JobModel.job_id).where(JobModel.job_id.in_(job_ids), JobModel.cancel_requested.is_(True))
+        ).all())
+
+
+def _recover_jobs_sync(worker_id: Optional[str], stale_before: Optional[datetime], max_attempts: int) -> int:
+    """
+    让中断的运行中任务重新排队：worker_id 给定时处理本进程的任务（正常退出），
+    否则处理心跳早于 stale_before 的任务（进程崩溃）。重试次数用尽或已请求取消的直接结束；
+    agent 任务不重新排队（重跑会重复写入用户消息），直接置为失败。
+    """
+    cond = [JobModel.status == JobStatus.RUNNING.value]
+    if worker_id is not None:
+        cond.append(JobModel.worker_id == worker_id)
+    else:
+        cond.append(or_(JobModel.heartbeat_at.is_(None), JobModel.heartbeat_at < stale_before))
+    now = datetime.utcnow()
+    with get_session() as session:
+        rows = session.scalars(select(JobModel).where(*cond)).all()
+        for row in rows:
+            if row.cancel_requested:
+                row.status = JobStatus.CANCELLED.value
+                row.finished_at = now
+            elif row.kind == JobKind.AGENT.value:
+                row.status = JobStatus.FAILED.value
+                row.error = "执行中断，会话中可能已保存部分回复，请查看会话后重新提交"
+                row.finished_at = now
+            elif row.attempts >= max_attempts:
+                row.status = JobStatus.FAILED.value
+                row.error = f"执行中断次数超过上限 {max_attempts}"
+                row.finished_at = now
+            else:
+                row.status = JobStatus.QUEUED.value
+            row.worker_id = None
+            row.heartbeat_at = None
+        return len(rows)
+
+
+def _get_job_sync(job_id: str, user_id: str, include_result: bool) -> Optional[Dict[str, Any]]:
+    with get_session() as session:
+        row = session.get(JobModel, job_id)
+        if row is None or row.user_id != user_id:
+            return None
+        return _job_to_dict(row, include_result=include_result)
+
+
+def _list_jobs_sync(user_id: str, limit: int, offset: int) -> tuple[List[Dict[str, Any]], int]:
+    with get_session() as session:
+        base = select(JobModel).where(JobModel.user_id == user_id)
+        total = session.scalar(select(func.count()).select_from(base.subquery())) or 0
+        rows = session.scalars(base.order_by(JobModel.created_at.desc()).offset(offset).limit(limit)).all()
+        return [_job_to_dict(r) for r in rows], total
+
+
+def _cancel_job_sync(job_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+    with get_session() as session:
+        row = session.get(JobModel, job_id)
+        if row is None or row.user_id != user_id:
+            return None
+        if row.status == JobStatus.QUEUED.value:
+            row.status = JobStatus.CANCELLED.value
+            row.finished_at = datetime.utcnow()
+        elif row.status == JobStatus.RUNNING.value:
+            row.cancel_requested = True
+        session.flush()
+        return _job_to_dict(row)
+
+
+# ---------- 工作池 ----------
+
+class JobQueue:
+    """进程内工作池：workers 个 asyncio worker 从 jobs 表认领并执行任务。"""
+
+    def __init__(
+        self,
+        workers: int = JOB_WORKERS,
+        per_user_concurrency: int = JOB_PER_USER_CONCURRENCY,
+        per_user_pending: int = JOB_PER_USER_PENDING,
+    ) -> None:
+        self.workers = max(0, workers)
+        self.per_user_concurrency = max(1, per_user_concurrency)
+        self.per_user_pending = max(1, per_user_pending)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._tasks: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._wakeup = asyncio.Event()
+        self._claim_lock = asyncio.Lock()
+        self._stopping = False
+
+    @staticmethod
+    async def _db(fn, *args):
+        return await asyncio.to_thread(fn, *args)
+
+    async def start(self) -> None:
+        if self._tasks or self.workers == 0:
+            return
+        self._stopping = False
+        recovered = await self._db(_recover_jobs_sync, None, self._stale_before(), JOB_MAX_ATTEMPTS)
+        if recovered:
+            logger.info("恢复了 %d 个中断的任务", recovered)
+        self._tasks = [asyncio.create_task(self._worker_loop()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._monitor_loop()))
+        logger.info("任务工作池已启动：%d 个 worker（%s）", self.workers, self.worker_id)
+
+    async def stop(self) -> None:
+        """停止工作池；本进程运行中的工具任务重新排队，下次启动（或其他工作进程）继续执行。"""
+        self._stopping = True
+        running = list(self._running.values())
+        for t in running + self._tasks:
+            t.cancel()
+        await asyncio.gather(*running, *self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._running.clear()
+        if self.workers:
+            await self._db(_recover_jobs_sync, self.worker_id, None, JOB_MAX_ATTEMPTS)
+
+    # ----- 对外接口 -----
+
+    async def submit(
+        self,
+        user_id: str,
+        kind: JobKind,
+        name: str,
+        params: Dict[str, Any],
+        session_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """提交任务；工具不存在时抛 ValueError，超出排队配额时抛 JobQuotaError。"""
+        if kind == JobKind.TOOL and name not in _job_tools():
+            raise ValueError(f"未知工具: {name}")
+        if kind == JobKind.AGENT:
+            name = AGENT_JOB_NAME
+            if not str(params.get("message") or "").strip():
+                raise ValueError("message 不能为空")
+            # 新会话的 id 提交时即确定（run 按该 id 创建会话），任务行从一开始就指向它
+            session_id = session_id or str(uuid.uuid4())
+        job = await self._db(
+            _insert_job_sync, user_id, kind.value, name, params, session_id, self.per_user_pending
+        )
+        self._notify()
+        return job
+
+    async def get(self, job_id: str, user_id: str, include_result: bool = False) -> Optional[Dict[str, Any]]:
+        return await self._db(_get_job_sync, job_id, user_id, include_result)
+
+    async def list(self, user_id: str, limit: int = 20, offset: int = 0) -> tuple[List[Dict[str, Any]], int]:
+        return await self._db(_list_jobs_sync, user_id, limit, offset)
+
+    async def cancel(self, job_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        job = await self._db(_cancel_job_sync, job_id, user_id)
+        if job is not None:
+            task = self._running.get(job_id)
+            if task is not None:
+                task.cancel()
+        return job
+
+    # ----- 内部 -----
+
+    def _notify(self) -> None:
+        """唤醒所有等待中的 worker：置位当前事件并换上新事件，worker 之间不会互相清除通知。"""
+        self._wakeup.set()
+        self._wakeup = asyncio.Event()
+
+    @staticmethod
+    def _stale_before() -> datetime:
+        return datetime.utcnow() - timedelta(seconds=JOB_STALE_AFTER)
+
+    async def _worker_loop(self) -> None:
+        while True:
+            # 认领前取下当前事件：认领期间到达的通知会置位它，随后的等待立即返回
+            wakeup = self._wakeup
+            async with self._claim_lock:
+                job = await self._db(_claim_next_sync, self.worker_id, self.per_user_concurrency)
+            if job is None:
+                try:
+                    await asyncio.wait_for(wakeup.wait(), JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run_job(job)
+            # 一个任务结束可能解除其他任务的配额限制
+            self._notify()
+
+    async def _run_job(self, job: Dict[str, Any]) -> None:
+        job_id = job["job_id"]
+        task = asyncio.create_task(self._execute(job))
+        self._running[job_id] = task
+        try:
+            await asyncio.wait({task})
+        finally:
+            self._running.pop(job_id, None)
+        if self._stopping:
+            return  # stop() 负责重新排队
+
+        if task.cancelled():
+            status, result, error = JobStatus.CANCELLED, None, None
+        elif task.exception() is not None:
+            exc = task.exception()
+            logger.warning("任务 %s 执行失败：%s", job_id, exc)
+            status, result, error = JobStatus.FAILED, None, str(exc) or type(exc).__name__
+        else:
+            status, result, error = JobStatus.SUCCEEDED, task.result(), None
+        await self._db(
+            _finish_job_sync, job_id, self.worker_id, status, result, error,
+            (result or {}).get("session_id"),
+        )
+
+    async def _execute(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        params = job.get("params") or {}
+        if job["kind"] == JobKind.AGENT.value:
+            from app.run import run
+            session_id, reply, tool_calls = await run(
+                str(params.get("message") or ""),
+                {"session_id": job.get("session_id"), "user_id": job["user_id"]},
+            )
+            return {"session_id": session_id, "reply": reply, "tool_calls": tool_calls}
+
+        tool = _job_tools().get(job["name"])
+        if tool is None:
+            raise ValueError(f"未知工具: {job['name']}")
+        output = await tool.ainvoke(params)
+        return {"output": output if isinstance(output, str) else str(output)}
+
+    async def _monitor_loop(self) -> None:
+        """心跳、跨进程取消与崩溃任务回收。"""
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+            try:
+                cancelled = await self._db(_heartbeat_sync, self.worker_id, list(self._running))
+                for job_id in cancelled:
+                    task = self._running.get(job_id)
+                    if task is not None:
+                        task.cancel()
+                if await self._db(_recover_jobs_sync, None, self._stale_before(), JOB_MAX_ATTEMPTS):
+                    self._notify()
+            except Exception as e:
+                logger.warning("任务心跳失败：%s", e)
+
+
+_queue: Optional[JobQueue] = None
+
+
+def get_job_queue() -> JobQueue:
+    """进程内共享的任务队列（JOB_WORKERS=0 时只提交与查询，不执行）。"""
+    global _queue
+    if _queue is None:
+        _queue = JobQueue()
+    return _queue
+
+
+async def start_job_queue() -> JobQueue:
+    queue = get_job_queue()
+    await queue.start()
+    return queue
+
+
+async def stop_job_queue() -> None:
+    global _queue
+    if _queue is not None:
+        await _queue.stop()
+        _queue = None
@@ -70,12 +70,17 @@ def set_llm_config(
         if base_url is not None:
             row.base_url = base_url.strip()
         session.flush()
-        return LlmConfig(
+        cfg = LlmConfig(
             model=row.model or DEFAULT_MODEL,
             api_key=row.api_key or "",
             base_url=(row.base_url or "").strip(),
         )
 
+    # 已缓存的 agent 绑定了旧的模型客户端，配置提交后立即失效
+    from app.agent_vuln import invalidate_agent_cache
+    invalidate_agent_cache()
+    return cfg
+
 
 def fetch_models_from_provider(
     base_url: Optional[str] = None,
@@ -0,0 +1,71 @@
+"""
+项目自定义的 agent middleware。
+
+- ToolFanoutMiddleware：同一步（同一条 AI 消息）发出的多个工具调用由 ToolNode 并发执行，
+  这里限制其并发数（TOOL_FANOUT_LIMIT），避免模型一次发出大量扫描时同时压向目标与本机
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from langchain.agents.middleware import AgentMiddleware
+from langchain.agents.middleware.types import ToolCallRequest
+from langchain_core.messages import AIMessage, ToolMessage
+from langgraph.types import Command
+
+# 每步最多同时执行的工具调用数，0 表示不限制
+TOOL_FANOUT_LIMIT = int(os.environ.get("TOOL_FANOUT_LIMIT", "4"))
+
+
+class _StepGate:
+    """一步内共享的信号量；users 为仍在使用的调用数，归零时移除。"""
+
+    def __init__(self, limit: int) -> None:
+        self.semaphore = asyncio.Semaphore(limit)
+        self.users = 0
+
+
+def _step_key(request: ToolCallRequest) -> Optional[str]:
+    """发出该工具调用的 AI 消息 id；找不到时返回 None（不限流）。"""
+    state = request.state
+    messages: List[Any] = (state.get("messages") if isinstance(state, dict) else getattr(state, "messages", None)) or []
+    call_id = request.tool_call.get("id")
+    for msg in reversed(messages):
+        if isinstance(msg, AIMessage) and any(tc.get("id") == call_id for tc in msg.tool_calls):
+            return msg.id or call_id
+    return None
+
+
+class ToolFanoutMiddleware(AgentMiddleware):
+    """
+    按步限制工具调用并发。信号量以发出调用的 AI 消息区分，而不是按会话：
+    task 子 agent 在父步骤的工具调用内部执行自己的工具，按会话共享信号量会互相等待。
+    """
+
+    def __init__(self, limit: int = TOOL_FANOUT_LIMIT) -> None:
+        super().__init__()
+        self.limit = limit
+        self._gates: Dict[str, _StepGate] = {}
+
+    async def awrap_tool_call(
+        self,
+        request: ToolCallRequest,
+        handler: Callable[[ToolCallRequest], Awaitable[ToolMessage | Command]],
+    ) -> ToolMessage | Command:
+        key = _step_key(request) if self.limit > 0 else None
+        if key is None:
+            return await handler(request)
+        gate = self._gates.get(key)
+        if gate is None:
+            gate = self._gates[key] = _StepGate(self.limit)
+        gate.users += 1
+        try:
+            async with gate.semaphore:
+                return await handler(request)
+        finally:
+            gate.users -= 1
+            if gate.users == 0:
+                self._gates.pop(key, None)
@@ -1,8 +1,9 @@
 from __future__ import annotations
 
 from datetime import datetime
+from typing import Optional
 
-from sqlalchemy import DateTime, Integer, String, Text
+from sqlalchemy import Boolean, DateTime, Index, Integer, LargeBinary, String, Text
 from sqlalchemy.orm import Mapped, mapped_column
 
 from .db import Base
@@ -20,18 +21,26 @@ class SkillModel(Base):
 
 
 class SessionModel(Base):
-    """会话表。"""
+    """会话表。archive_path 非空时为存根：消息已归档到文件（app.retention），打开时恢复。"""
     __tablename__ = "sessions"
+    # 保留任务按 (updated_at, session_id) 分批扫描空闲会话
+    __table_args__ = (Index("ix_sessions_updated_at_session_id", "updated_at", "session_id"),)
 
     session_id: Mapped[str] = mapped_column(String(64), primary_key=True)
     user_id: Mapped[str] = mapped_column(String(64), index=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(), default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(DateTime(), default=datetime.utcnow, onupdate=datetime.utcnow)
     metadata_: Mapped[str] = mapped_column("metadata", Text(), default="{}")
+    archive_path: Mapped[Optional[str]] = mapped_column(String(512), nullable=True)  # 相对 ARCHIVE_DIR
+    archived_at: Mapped[Optional[datetime]] = mapped_column(DateTime(), nullable=True)
+    archived_messages: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)  # 会话列表显示的消息数
+    archived_preview: Mapped[Optional[str]] = mapped_column(Text(), nullable=True)  # 最后一条消息预览（JSON）
 
 
 class ConversationMessageModel(Base):
     __tablename__ = "conversation_messages"
+    # 按会话分页读取历史（WHERE session_id = ? AND id < ? ORDER BY id DESC LIMIT ?）
+    __table_args__ = (Index("ix_conversation_messages_session_id_id", "session_id", "id"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     session_id: Mapped[str] = mapped_column(String(64), index=True)
@@ -40,6 +49,38 @@ class ConversationMessageModel(Base):
     created_at: Mapped[datetime] = mapped_column(DateTime(), default=datetime.utcnow)
 
 
+class ToolCallModel(Base):
+    """
+    消息关联的工具调用（assistant 回复产生的调用，按 seq 排序）。
+    小输出存在 output；超过阈值的输出按内容哈希存入 blobs（output_hash），相同输出只存一份。
+    """
+    __tablename__ = "message_tool_calls"
+    __table_args__ = (Index("ix_message_tool_calls_message_id_seq", "message_id", "seq"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    message_id: Mapped[int] = mapped_column(Integer)
+    seq: Mapped[int] = mapped_column(Integer, default=0)
+    tool: Mapped[str] = mapped_column(String(64))
+    input: Mapped[str] = mapped_column(Text(), default="{}")
+    output: Mapped[Optional[bytes]] = mapped_column(LargeBinary(), nullable=True)
+    output_codec: Mapped[str] = mapped_column(String(8), default="")  # "" / zlib / zstd
+    output_size: Mapped[int] = mapped_column(Integer, default=0)  # 原始输出的 UTF-8 字节数
+    output_hash: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)  # blobs.hash
+    created_at: Mapped[datetime] = mapped_column(DateTime(), default=datetime.utcnow)
+
+
+class BlobModel(Base):
+    """内容寻址的载荷存储：hash 为原始内容的 SHA-256，refcount 为引用行数，归零时由触发器删除。"""
+    __tablename__ = "blobs"
+
+    hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    data: Mapped[bytes] = mapped_column(LargeBinary())
+    codec: Mapped[str] = mapped_column(String(8), default="")  # 见 app.storage.payload
+    size: Mapped[int] = mapped_column(Integer, default=0)  # 原始内容的 UTF-8 字节数
+    refcount: Mapped[int] = mapped_column(Integer, default=0)
+    created_at: Mapped[datetime] = mapped_column(DateTime(), default=datetime.utcnow)
+
+
 class LlmConfigModel(Base):
     """模型配置表，单行存储（id=1）。"""
     __tablename__ = "llm_config"
@@ -71,3 +112,25 @@ class UserSessionModel(Base):
     created_at: Mapped[datetime] = mapped_column(DateTime(), default=datetime.utcnow)
     expires_at: Mapped[datetime] = mapped_column(DateTime(), default=datetime.utcnow)
 
+
+
+class JobModel(Base):
+    """后台任务表：工具调用或整轮 agent 对话，由 app.jobs 的工作池执行。"""
+    __tablename__ = "jobs"
+
+    job_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    user_id: Mapped[str] = mapped_column(String(64), index=True)
+    kind: Mapped[str] = mapped_column(String(16))  # tool / agent
+    name: Mapped[str] = mapped_column(String(64))  # 工具名；agent 任务为 "agent"
+    params: Mapped[str] = mapped_column(Text(), default="{}")
+    session_id: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    status: Mapped[str] = mapped_column(String(16), index=True, default="queued")
+    cancel_requested: Mapped[bool] = mapped_column(Boolean(), default=False)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    worker_id: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    heartbeat_at: Mapped[Optional[datetime]] = mapped_column(DateTime(), nullable=True)
+    result: Mapped[Optional[str]] = mapped_column(Text(), nullable=True)
+    error: Mapped[Optional[str]] = mapped_column(Text(), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(), default=datetime.utcnow, index=True)
+    started_at: Mapped[Optional[datetime]] = mapped_column(DateTime(), nullable=True)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime(), nullable=True)
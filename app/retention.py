@@ -0,0 +1,120 @@
+"""
+分层保留：空闲超过 ARCHIVE_AFTER_DAYS 天的会话移出数据库，消息与工具调用归档为 gzip 压缩的 JSONL 文件
+（app.storage.archive，存于 ARCHIVE_DIR），会话行保留为存根，会话列表照常显示（消息数与最后一条预览）。
+
+- 打开存根会话（读取历史或继续对话）时自动从文件恢复，之后与普通会话相同；对话状态从恢复的历史回放
+- 后台任务每 ARCHIVE_INTERVAL 秒扫描一轮：按 (updated_at, session_id) 分批（每批 ≤ ARCHIVE_BATCH_SIZE），
+  逐个会话归档，会话之间让出事件循环；每个会话在各自的短事务中完成，文件读写在线程中执行，不阻塞对话请求
+- 归档时会话仍有新消息或元数据更新则放弃本次归档；同时删除该会话的 checkpoint
+- 归档会话的消息不在全文检索范围内，恢复后重新可搜
+- 只在 Web 进程中运行（会话缓存在进程内）；多节点共享 PostgreSQL 时 ARCHIVE_DIR 须为各节点共享的目录
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from app.checkpoint import delete_thread
+from app.storage import get_storage_manager
+
+logger = logging.getLogger(__name__)
+
+# 0 表示不归档
+ARCHIVE_AFTER_DAYS = float(os.environ.get("ARCHIVE_AFTER_DAYS", "0"))
+ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", "20"))
+ARCHIVE_INTERVAL = float(os.environ.get("ARCHIVE_INTERVAL", "3600"))
+# 相邻两个会话归档之间的间隔（秒）
+ARCHIVE_PAUSE = 0.05
+
+
+class RetentionWorker:
+    """后台归档任务：start() 后每 interval 秒执行一轮 run_once()。"""
+
+    def __init__(
+        self,
+        after_days: float = ARCHIVE_AFTER_DAYS,
+        batch_size: int = ARCHIVE_BATCH_SIZE,
+        interval: float = ARCHIVE_INTERVAL,
+    ) -> None:
+        self.after_days = after_days
+        self.batch_size = max(1, batch_size)
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.after_days > 0
+
+    async def run_once(self) -> int:
+        """扫描一轮并归档空闲会话，返回归档的会话数。"""
+        storage = get_storage_manager()
+        idle_before = datetime.utcnow() - timedelta(days=self.after_days)
+        archived = 0
+        after = None
+        while True:
+            batch = await storage.backend.list_idle_sessions(idle_before, after=after, limit=self.batch_size)
+            for row in batch:
+                if not row["idle"]:
+                    continue
+                session_id = row["session_id"]
+                try:
+                    if await storage.context.archive_session(session_id, idle_before):
+                        archived += 1
+                        await delete_thread(session_id)
+                except Exception:
+                    logger.exception("归档会话失败 session=%s", session_id[:12])
+                await asyncio.sleep(ARCHIVE_PAUSE)
+            if len(batch) < self.batch_size:
+                return archived
+            after = (batch[-1]["updated_at"], batch[-1]["session_id"])
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                archived = await self.run_once()
+                if archived:
+                    logger.info("已归档 %d 个空闲超过 %g 天的会话", archived, self.after_days)
+            except Exception:
+                logger.exception("会话归档任务失败")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._loop(), name="session-retention")
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+
+_worker: Optional[RetentionWorker] = None
+
+
+def get_retention_worker() -> RetentionWorker:
+    global _worker
+    if _worker is None:
+        _worker = RetentionWorker()
+    return _worker
+
+
+async def start_retention() -> RetentionWorker:
+    worker = get_retention_worker()
+    worker.start()
+    return worker
+
+
+async def stop_retention() -> None:
+    global _worker
+    if _worker is not None:
+        await _worker.stop()
+        _worker = None
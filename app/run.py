@@ -3,19 +3,45 @@ Agent 主流程。
 
 流程：
 1. init_storage → get/create session
-2. 加载历史消息
-3. add_message 用户输入
-4. 调用 agent (checkpoint 自动恢复状态)
-5. add_message assistant 回复
-6. 返回 (session_id, reply, tool_calls)
+2. add_message 用户输入
+3. 读取 checkpoint（thread_id = session_id）；无状态（新会话或旧会话首次接入 checkpoint）
+   时从 storage 回放既往历史（跳过已折叠进摘要的轮次）
+4. 按 token 预算裁剪历史（app.history）：超出时较早轮次增量合并进滚动摘要，
+   摘要写回会话 metadata，checkpoint 中的消息替换为「摘要 + 最近轮次」
+5. 调用 agent (checkpoint 自动恢复状态)，结束后裁剪旧 checkpoint
+6. add_message assistant 回复，本轮工具调用（入参与输出）随之写入 message_tool_calls
+7. 返回 (session_id, reply, tool_calls)
+
+run_stream() 走同样的流程，但以 astream_events 驱动 agent，边执行边产出 token / 工具事件。
 """
 
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional
+import asyncio
+import logging
+from contextlib import aclosing
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from langchain_core.messages import HumanMessage, RemoveMessage
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
 
-from app.agent_vuln import get_agent
+from app.agent_vuln import get_cached_agent
+from app.checkpoint import get_checkpointer, prune_thread
+from app.history import (
+    SUMMARY_META_KEY,
+    SUMMARY_TURNS_META_KEY,
+    build_window,
+    get_summary_model,
+    messages_from_storage,
+    summary_message,
+)
 from app.storage import get_storage_manager
+from app.tools.progress import TOOL_PROGRESS_EVENT
+
+logger = logging.getLogger("app.run")
+
+CANCELLED_NOTE = "（对话已取消：客户端断开或任务被取消，以上为中断前的部分结果）"
 
 
 def _extract_tool_calls(messages: List[Any]) -> List[Dict[str, Any]]:
@@ -40,48 +66,44 @@ def _extract_tool_calls(messages: List[Any]) -> List[Dict[str, Any]]:
     return out
 
 
-async def run(user_message: str, metadata: Dict[str, Any]) -> tuple[str, str, List[Dict[str, Any]]]:
-    """
-    单次对话执行。
-    
-    - metadata 需含 session_id（可选）、user_id
-    - 若未提供 session_id 则创建新会话
-    - 使用 LangGraph checkpoint 持久化对话状态
-    - 返回 (session_id, reply)
-    """
-    from app.db import init_db
-    init_db()
+@dataclass
+class _Turn:
+    """一轮对话调用 agent 前准备好的上下文。"""
+
+    session_id: str
+    graph: Any
+    config: Dict[str, Any]
+    input: Dict[str, Any]
+    prior_messages: List[Any]
+
 
+async def _prepare_turn(user_message: str, metadata: Dict[str, Any]) -> _Turn:
+    """获取/创建会话、写入用户消息、取缓存的 agent，并按 token 预算组装本轮输入。"""
     storage = get_storage_manager()
     session_id: Optional[str] = metadata.get("session_id")
     user_id: str = metadata.get("user_id") or "default"
 
-    ctx = await storage.context.get_or_create_session(
-        session_id=session_id,
-        user_id=user_id,
-    )
+    # 只取会话元数据；消息仅在无 checkpoint 需要回放时才加载
+    ctx = await storage.context.get_session_info(session_id) if session_id else None
+    if ctx is None:
+        ctx = await storage.context.create_session(user_id=user_id, session_id=session_id)
+    elif ctx.archive_path:
+        # 先恢复归档再写入本轮输入：原 id 被占用时恢复的消息会分配新 id，会排到本轮输入之后
+        await storage.context.restore_session(ctx.session_id)
     session_id = ctx.session_id
 
-    await storage.context.add_message(session_id, "user", user_message)
+    user_message_id = await storage.context.add_message(session_id, "user", user_message)
 
-    # 从「模型配置」表读取配置，构建 agent
+    # 从「模型配置」表读取配置，取缓存的 agent（未命中才构建）
     from app.llm_config import get_llm_config
     cfg = get_llm_config()
-    graph = get_agent(
+    graph = get_cached_agent(
         llm_model=cfg.model,
         api_key=cfg.api_key or None,
         base_url=cfg.base_url or None,
+        checkpointer=await get_checkpointer(),
     )
 
-    # 加载历史消息
-    history = await storage.context.get_conversation_history(session_id, limit=50)
-    
-    messages = []
-    for m in history:
-        messages.append((m["role"], m["content"]))
-    messages.append(("user", user_message))
-
-    import logging
     from app.callbacks import get_prompt_logging_handler
 
     handler = get_prompt_logging_handler()
@@ -89,16 +111,263 @@ async def run(user_message: str, metadata: Dict[str, Any]) -> tuple[str, str, Li
         "configurable": {"thread_id": session_id},
         "callbacks": [handler],
     }
-    logging.getLogger("app.run").info("已注入 prompt/工具 日志 callback，请求 session=%s", session_id[:12] if session_id else "")
 
-    # 调用 agent（checkpoint 会自动恢复状态；callback 会打 prompt/工具 日志）
-    result = await graph.ainvoke({"messages": messages}, config=config)
-    all_messages = result.get("messages") or []
+    state = await graph.aget_state(config)
+    prior_messages = (state.values or {}).get("messages") or []
+    summary = ctx.metadata.get(SUMMARY_META_KEY) or ""
+    summary_turns = int(ctx.metadata.get(SUMMARY_TURNS_META_KEY) or 0)
+    if prior_messages:
+        history = list(prior_messages)
+    else:
+        # 无 checkpoint：从 storage 回放既往历史做种（不含本轮输入）
+        full = await storage.context.get_session(session_id)
+        stored = [m for m in (full.messages if full else []) if m["message_id"] < user_message_id]
+        history = messages_from_storage(stored, skip_turns=summary_turns)
+
+    window = await build_window(
+        history,
+        summary,
+        lambda: get_summary_model(cfg.model, cfg.api_key or None, cfg.base_url or None),
+    )
+    if window.compacted:
+        summary_turns += window.evicted_turns
+        await storage.context.update_session(
+            session_id,
+            metadata={SUMMARY_META_KEY: window.summary, SUMMARY_TURNS_META_KEY: summary_turns},
+        )
+
+    messages: List[Any] = []
+    if prior_messages and window.compacted:
+        # 用「摘要 + 最近轮次」整体替换 checkpoint 中的消息
+        messages.append(RemoveMessage(id=REMOVE_ALL_MESSAGES))
+    if not prior_messages or window.compacted:
+        if window.summary:
+            messages.append(summary_message(window.summary))
+        messages.extend(window.kept)
+    messages.append(HumanMessage(content=user_message))
+    logger.info(
+        "已注入 prompt/工具 日志 callback，请求 session=%s，checkpoint 消息数=%s，历史窗口消息数=%s，摘要轮数=%s",
+        session_id[:12] if session_id else "",
+        len(prior_messages),
+        len(window.kept),
+        summary_turns,
+    )
+    return _Turn(
+        session_id=session_id,
+        graph=graph,
+        config=config,
+        input={"messages": messages},
+        prior_messages=prior_messages,
+    )
+
+
+async def _finish_turn(turn: _Turn, all_messages: List[Any]) -> tuple[str, List[Dict[str, Any]]]:
+    """裁剪 checkpoint、解析本轮工具调用并写入 assistant 回复，返回 (reply, tool_calls)。"""
+    await prune_thread(turn.graph, turn.session_id)
 
     final_msg = all_messages[-1] if all_messages else None
     assistant_text = (final_msg.content if hasattr(final_msg, "content") else str(final_msg)) if final_msg else ""
 
-    tool_calls = _extract_tool_calls(all_messages)
+    tool_calls = _extract_tool_calls(_turn_messages(turn, all_messages))
+
+    await get_storage_manager().context.add_message(
+        turn.session_id, "assistant", assistant_text, _tool_calls_metadata(tool_calls)
+    )
+    return assistant_text, tool_calls
+
+
+def _tool_calls_metadata(tool_calls: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    return {"tool_calls": tool_calls} if tool_calls else None
+
+
+def _turn_messages(turn: _Turn, all_messages: List[Any]) -> List[Any]:
+    """只取本轮新增的消息（checkpoint 返回的是整段对话）。"""
+    prior_ids = {getattr(m, "id", None) for m in turn.prior_messages} - {None}
+    return [m for m in all_messages if getattr(m, "id", None) not in prior_ids]
+
+
+async def _persist_cancelled(
+    turn: _Turn,
+    partial_text: str = "",
+    finished_tools: Optional[List[str]] = None,
+) -> None:
+    """
+    对话被取消（客户端断开等）时保存已有的部分结果：
+    checkpoint 中已完成的步骤保持不变（悬空的 tool call 由 PatchToolCallsMiddleware 在下一轮补齐），
+    storage 写入一条带取消说明的 assistant 消息，内容为已生成的文本与已完成的工具调用。
+    finished_tools 为流式过程中已收到 tool_end 的工具：同一步的其他工具被取消时，
+    这一步的结果不会写入 checkpoint，以流式记录为准。
+    """
+    try:
+        state = await turn.graph.aget_state(turn.config)
+        new_messages = _turn_messages(turn, (state.values or {}).get("messages") or [])
+        if not partial_text:
+            partial_text = next(
+                (m.content for m in reversed(new_messages)
+                 if getattr(m, "type", "") == "ai" and isinstance(m.content, str) and m.content.strip()),
+                "",
+            )
+        tool_calls = _extract_tool_calls(new_messages)
+        done_tools = [c["tool"] for c in tool_calls]
+        if finished_tools and len(finished_tools) > len(done_tools):
+            done_tools = list(finished_tools)
+        parts = [partial_text.strip()] if partial_text.strip() else []
+        if done_tools:
+            parts.append(f"已完成的工具调用：{'、'.join(done_tools)}")
+        parts.append(CANCELLED_NOTE)
+        await prune_thread(turn.graph, turn.session_id)
+        await get_storage_manager().context.add_message(
+            turn.session_id, "assistant", "\n\n".join(parts), _tool_calls_metadata(tool_calls)
+        )
+        logger.info("对话已取消，保存部分结果 session=%s，完成工具 %d 个", turn.session_id[:12], len(done_tools))
+    except Exception:
+        logger.exception("保存已取消对话的部分结果失败 session=%s", turn.session_id[:12])
+
+
+async def run(user_message: str, metadata: Dict[str, Any]) -> tuple[str, str, List[Dict[str, Any]]]:
+    """
+    单次对话执行。
+    
+    - metadata 需含 session_id（可选）、user_id
+    - 若未提供 session_id 则创建新会话
+    - 使用 LangGraph checkpoint 持久化对话状态
+    - 返回 (session_id, reply, tool_calls)
+    """
+    turn = await _prepare_turn(user_message, metadata)
+    # 调用 agent（checkpoint 会自动恢复状态；callback 会打 prompt/工具 日志）
+    try:
+        result = await turn.graph.ainvoke(turn.input, config=turn.config)
+    except asyncio.CancelledError:
+        # 取消会一路传到正在执行的工具与 socket；保存部分结果时屏蔽后续取消
+        await asyncio.shield(_persist_cancelled(turn))
+        raise
+    reply, tool_calls = await _finish_turn(turn, result.get("messages") or [])
+    return turn.session_id, reply, tool_calls
+
+
+def _is_top_level(event: Dict[str, Any]) -> bool:
+    """主 agent 自身的事件（排除 task 子 agent 等嵌套图内部的模型输出）。"""
+    return "|" not in (event.get("metadata") or {}).get("checkpoint_ns", "")
+
+
+def _tool_output_text(output: Any) -> str:
+    content = getattr(output, "content", output)
+    return content if isinstance(content, str) else ("" if content is None else str(content))
+
+
+def _content_text_delta(chunk: Any) -> str:
+    content = getattr(chunk, "content", None)
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(p.get("text", "") for p in content if isinstance(p, dict) and p.get("type") == "text")
+    return ""
+
+
+async def run_stream(user_message: str, metadata: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    流式对话执行，基于 agent 的 astream_events 逐个产出事件（dict，含 event 与 data）：
+
+    - session：{"session_id"}，会话就绪后立即发出
+    - token：{"delta"}，主 agent 模型输出的增量文本
+    - tool_start：{"id", "tool", "input"}
+    - tool_progress：{"tool", "message", ...}，工具执行中上报的阶段性结果
+    - tool_end：{"id", "tool", "output"}
+    - done：{"session_id", "reply", "tool_calls"}，与 run() 的返回一致
+
+    对话状态、消息存储与 run() 完全相同；消费方提前关闭（客户端断开）时保存部分结果。
+    """
+    turn = await _prepare_turn(user_message, metadata)
+    yield {"event": "session", "data": {"session_id": turn.session_id}}
+
+    # 当前这次模型调用已输出的文本与已完成的工具，客户端断开时作为部分结果保存
+    partial: List[str] = []
+    finished_tools: List[str] = []
+    try:
+        async with aclosing(_iterate_in_task(_stream_turn_events(turn, partial, finished_tools))) as events:
+            async for ev in events:
+                yield ev
+    except (asyncio.CancelledError, GeneratorExit):
+        await asyncio.shield(_persist_cancelled(turn, "".join(partial), finished_tools))
+        raise
+
+    state = await turn.graph.aget_state(turn.config)
+    reply, tool_calls = await _finish_turn(turn, (state.values or {}).get("messages") or [])
+    yield {
+        "event": "done",
+        "data": {"session_id": turn.session_id, "reply": reply, "tool_calls": tool_calls},
+    }
+
+
+async def _iterate_in_task(source: AsyncIterator[Any]) -> AsyncIterator[Any]:
+    """
+    在独立 task 中消费 source，经容量为 1 的队列逐个转交给调用方。
+
+    在 Web 请求的 task（sse-starlette 的 anyio 任务组）里直接关闭 astream_events 时，
+    取消传不到内部的图执行 task，断开后工具仍会继续运行；这里关闭时对独立 task 做普通 cancel，
+    agent 与正在执行的工具可以及时停止。
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+    end = object()
+
+    async def pump() -> None:
+        async with aclosing(source):
+            async for item in source:
+                await queue.put(item)
+        await queue.put(end)
+
+    task = asyncio.create_task(pump())
+    getter: Optional[asyncio.Future] = None
+    try:
+        while True:
+            getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+            if getter not in done and task.exception() is not None:
+                # pump 异常结束，异常原样抛给调用方
+                raise task.exception()
+            item = await getter
+            if item is end:
+                break
+            yield item
+        await task
+    finally:
+        if getter is not None:
+            getter.cancel()
+        if not task.done():
+            task.cancel()
+            # 等待 agent 与工具的清理完成；调用方自身再次被取消时不中断这一等待
+            await asyncio.shield(asyncio.wait({task}))
+
+
+async def _stream_turn_events(
+    turn: _Turn,
+    partial: List[str],
+    finished_tools: List[str],
+) -> AsyncIterator[Dict[str, Any]]:
+    stream = turn.graph.astream_events(turn.input, config=turn.config, version="v2")
+    async with aclosing(stream):
+        async for ev in stream:
+            kind = ev["event"]
+            if kind == "on_chat_model_start" and _is_top_level(ev):
+                partial.clear()
+            elif kind == "on_chat_model_stream":
+                if not _is_top_level(ev):
+                    continue
+                delta = _content_text_delta(ev["data"].get("chunk"))
+                if delta:
+                    partial.append(delta)
+                    yield {"event": "token", "data": {"delta": delta}}
+            elif kind == "on_tool_start":
+                yield {
+                    "event": "tool_start",
+                    "data": {"id": ev["run_id"], "tool": ev["name"], "input": ev["data"].get("input")},
+                }
+            elif kind == "on_tool_end":
+                finished_tools.append(ev["name"])
+                yield {
+                    "event": "tool_end",
+                    "data": {"id": ev["run_id"], "tool": ev["name"], "output": _tool_output_text(ev["data"].get("output"))},
+                }
+            elif kind == "on_custom_event" and ev["name"] == TOOL_PROGRESS_EVENT:
+                yield {"event": "tool_progress", "data": ev["data"]}
 
-    await storage.context.add_message(session_id, "assistant", assistant_text)
-    return session_id, assistant_text, tool_calls
@@ -1,21 +1,34 @@
 """
 存储层：StorageManager + ContextManager + Backend。
 
-- Backend：持久化后端（本实现为 SQLite）
-- ContextManager：会话上下文（create_session, get_session, add_message, get_conversation_history）
+- Backend：持久化后端（SQLite，config.STORAGE_BACKEND 选择异步引擎或同步 ORM 实现；
+  DATABASE_URL 为 postgresql:// 时使用 PostgreSQL）
+- ContextManager：会话上下文（create_session, get_session, add_message, get_conversation_history），带 LRU 会话缓存
 - StorageManager：统一入口，持有 backend + context
 """
 
 from __future__ import annotations
 
 import asyncio
+import logging
 from typing import Any, Dict, List, Optional
 
-from app.db import SessionLocal, init_db
-from app.storage.backend import SQLiteBackend, SessionContext
-from app.storage.context_manager import ContextManager
+from app.config import DATABASE_DIALECT, STORAGE_BACKEND
+from app.db import init_db
+from app.storage.backend import (
+    AsyncSQLiteBackend,
+    PersistenceBackend,
+    PostgresBackend,
+    SQLiteBackend,
+    SessionContext,
+    SessionInfo,
+)
+from app.storage.context_manager import ContextManager, SessionCache
+from app.storage.search import SearchQueryError
 from app.storage.storage_manage import StorageManager
 
+logger = logging.getLogger(__name__)
+
 _storage: Optional[StorageManager] = None
 _storage_lock = asyncio.Lock()
 
@@ -27,12 +40,33 @@ async def initialize_storage() -> StorageManager:
         if _storage is not None:
             return _storage
         init_db()
-        backend = SQLiteBackend()
+        backend = _create_backend(STORAGE_BACKEND, DATABASE_DIALECT)
         await backend.initialize()
         _storage = StorageManager(backend=backend)
         return _storage
 
 
+def _create_backend(name: str, dialect: str = "sqlite") -> PersistenceBackend:
+    if dialect == "postgresql":
+        return PostgresBackend()
+    if name == "async":
+        return AsyncSQLiteBackend()
+    if name == "sync":
+        return SQLiteBackend()
+    raise ValueError(f"未知的 STORAGE_BACKEND: {name}（可选 async / sync）")
+
+
+async def close_storage() -> None:
+    """应用退出时调用，释放后端连接。"""
+    global _storage
+    async with _storage_lock:
+        if _storage is None:
+            return
+        logger.info("会话缓存统计：%s", _storage.context.cache_stats())
+        await _storage.backend.close()
+        _storage = None
+
+
 def get_storage_manager() -> StorageManager:
     """获取已初始化的 StorageManager（必须先调用 initialize_storage）。"""
     if _storage is None:
@@ -42,9 +76,15 @@ def get_storage_manager() -> StorageManager:
 
 __all__ = [
     "initialize_storage",
+    "close_storage",
     "get_storage_manager",
     "StorageManager",
     "ContextManager",
+    "SessionCache",
+    "SearchQueryError",
     "SessionContext",
+    "SessionInfo",
     "SQLiteBackend",
+    "AsyncSQLiteBackend",
+    "PostgresBackend",
 ]
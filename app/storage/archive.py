@@ -0,0 +1,62 @@
+"""
+会话归档文件（app.retention 写入，打开会话时读回）：每个会话一个 gzip 压缩的 JSONL 文件。
+
+- 第一行为文件头（format / session_id / user_id / archived_at），之后每行一条消息，
+  含 id、role、content、created_at 与该消息的工具调用（完整输出）
+- 文件名取 session_id 的哈希加随机后缀，存于 ARCHIVE_DIR 下按哈希前两位分目录；数据库中记录相对路径
+- 先写临时文件并 fsync 再改名，文件完整落盘后才删除数据库中的消息
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import os
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict
+
+from app.config import BASE_DIR
+
+ARCHIVE_DIR = Path(os.environ.get("ARCHIVE_DIR") or BASE_DIR / "archive")
+ARCHIVE_FORMAT = 1
+ARCHIVE_COMPRESS_LEVEL = 6
+
+
+def new_archive_path(session_id: str) -> str:
+    digest = hashlib.sha256(session_id.encode("utf-8")).hexdigest()
+    return f"{digest[:2]}/{digest}-{uuid.uuid4().hex[:8]}.jsonl.gz"
+
+
+def write_archive(path: str, snapshot: Dict[str, Any]) -> None:
+    target = ARCHIVE_DIR / path
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(target.name + ".tmp")
+    header = {
+        "format": ARCHIVE_FORMAT,
+        "session_id": snapshot["session_id"],
+        "user_id": snapshot["user_id"],
+        "archived_at": datetime.utcnow().isoformat(),
+    }
+    with open(tmp, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=ARCHIVE_COMPRESS_LEVEL) as gz:
+            for record in [header, *snapshot["messages"]]:
+                gz.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp, target)
+
+
+def read_archive(path: str) -> Dict[str, Any]:
+    """返回文件头各字段加 messages 列表。"""
+    with gzip.open(ARCHIVE_DIR / path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if header.get("format") != ARCHIVE_FORMAT:
+            raise ValueError(f"不支持的归档格式: {header.get('format')}（{path}）")
+        return {**header, "messages": [json.loads(line) for line in f if line.strip()]}
+
+
+def remove_archive(path: str) -> None:
+    (ARCHIVE_DIR / path).unlink(missing_ok=True)
@@ -1,33 +1,71 @@
 """
-持久化后端接口与 SQLite 实现。
+持久化后端接口与 SQLite / PostgreSQL 实现。
+
+- SQLiteBackend：同步 ORM，每个操作经 asyncio.to_thread 执行
+- AsyncSQLiteBackend：aiosqlite 异步引擎 + 连接池（默认，见 config.STORAGE_BACKEND）
+- PostgresBackend：psycopg 异步引擎 + 连接池（DATABASE_URL 为 postgresql:// 时使用）
+三者共用同一套查询实现，行为一致；消息写入可经 write_behind.MessageWriter 合并提交。
+add_message 的 metadata["tool_calls"] 与消息在同一事务写入 message_tool_calls，
+大输出按内容哈希存入 blobs（app.storage.blobs，相同输出只存一份、压缩保存），读历史时按需解压。
+archive_session / restore_session 把空闲会话的消息移到归档文件（app.storage.archive）与移回，会话行保留为存根。
 """
 
 from __future__ import annotations
 
+import asyncio
 import json
+from collections import Counter
 from abc import ABC, abstractmethod
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from sqlalchemy import case, delete, func, insert, select, tuple_, update
+from sqlalchemy.orm import Session
+
+from app.config import STORAGE_WRITE_BATCH, STORAGE_WRITE_BEHIND
+from app.db import SessionLocal, dispose_async_engine, get_async_session_factory
+from app.models import BlobModel, ConversationMessageModel, SessionModel, ToolCallModel
+from app.storage.archive import new_archive_path, read_archive, remove_archive, write_archive
+from app.storage.blobs import blob_key, load_blob, retain_blobs
+from app.storage.payload import CODEC_PLAIN, TOOL_PAYLOAD_COMPRESS_MIN, decode_payload
+from app.storage.search import search_messages
+from app.storage.write_behind import MessageWriter, PendingMessage
 
-from app.db import SessionLocal
-from app.models import ConversationMessageModel, SessionModel
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+_T = TypeVar("_T")
+
+# 会话列表中最后一条消息预览的长度
+SESSION_PREVIEW_CHARS = 80
+# 恢复归档时按 id 检查冲突的每批数量（SQL 参数个数上限）
+_RESTORE_ID_CHUNK = 500
 
 
 class PersistenceBackend(ABC):
-    """持久化后端抽象，此处用 SQLite 实现。"""
+    """持久化后端抽象，此处用 SQLite / PostgreSQL 实现。"""
 
     @abstractmethod
     async def initialize(self) -> None:
         pass
 
+    async def close(self) -> None:
+        """释放连接等资源，应用退出时调用。"""
+
     @abstractmethod
-    async def save_context(self, context: "SessionContext") -> None:
+    async def save_context(self, context: "SessionInfo") -> None:
+        """写入会话行（不涉及消息）。"""
         pass
 
     @abstractmethod
     async def load_context(self, session_id: str) -> Optional["SessionContext"]:
         pass
 
+    @abstractmethod
+    async def load_session_info(self, session_id: str) -> Optional["SessionInfo"]:
+        """只读会话行，代价与消息数无关。"""
+        pass
+
     @abstractmethod
     async def add_message(
         self,
@@ -38,6 +76,29 @@ class PersistenceBackend(ABC):
     ) -> int:
         pass
 
+    @abstractmethod
+    async def get_messages(
+        self,
+        session_id: str,
+        limit: int = 50,
+        before_id: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """按时间正序返回 message_id < before_id（不传则为最新）的最后 limit 条消息。"""
+        pass
+
+    @abstractmethod
+    async def get_tool_calls(self, message_ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+        """
+        各消息的工具调用（message_id -> 按调用顺序的列表）。压缩存储的输出不读取也不解压，
+        output 为 None，需要时经 get_tool_call 单独取。
+        """
+        pass
+
+    @abstractmethod
+    async def get_tool_call(self, tool_call_id: int) -> Optional[Dict[str, Any]]:
+        """单个工具调用（含解压后的完整输出与所属 session_id）。"""
+        pass
+
     @abstractmethod
     async def list_user_sessions(
         self,
@@ -47,15 +108,49 @@ class PersistenceBackend(ABC):
     ) -> tuple[List[Dict[str, Any]], int]:
         pass
 
+    @abstractmethod
+    async def search_messages(
+        self,
+        user_id: str,
+        query: str,
+        limit: int = 20,
+        offset: int = 0,
+    ) -> List[Dict[str, Any]]:
+        """全文检索该用户的消息，按相关度排序；搜索词无效时抛出 search.SearchQueryError。"""
+        pass
+
     @abstractmethod
     async def delete_session(self, session_id: str) -> bool:
-        """删除会话及其全部消息，彻底清除。返回是否删除成功（会话存在则成功）。"""
+        """删除会话及其全部消息（含归档文件），彻底清除。返回是否删除成功（会话存在则成功）。"""
+        pass
+
+    @abstractmethod
+    async def list_idle_sessions(
+        self,
+        idle_before: datetime,
+        after: Optional[Tuple[datetime, str]] = None,
+        limit: int = 20,
+    ) -> List[Dict[str, Any]]:
+        """
+        按 (updated_at, session_id) 顺序扫描 after 之后、updated_at 早于 idle_before 的未归档会话，最多 limit 行；
+        每行带 idle：最后一条消息也早于 idle_before。
+        """
+        pass
+
+    @abstractmethod
+    async def archive_session(self, session_id: str, idle_before: datetime) -> bool:
+        """会话仍空闲时把消息写入归档文件并从数据库删除，会话行改为存根。返回是否已归档。"""
+        pass
+
+    @abstractmethod
+    async def restore_session(self, session_id: str) -> bool:
+        """把存根会话的消息从归档文件写回数据库。返回是否由本次调用恢复（已被并发恢复则为 False）。"""
         pass
 
 
-class SessionContext:
-    """会话上下文，与 context_manager 中的 SessionContext 结构一致。"""
-    __slots__ = ("session_id", "user_id", "created_at", "updated_at", "messages", "metadata")
+class SessionInfo:
+    """会话元数据（不含消息），用于存在性与归属检查等只需会话行的场景；archive_path 非空表示消息已归档。"""
+    __slots__ = ("session_id", "user_id", "created_at", "updated_at", "metadata", "archive_path")
 
     def __init__(
         self,
@@ -63,143 +158,529 @@ class SessionContext:
         user_id: str,
         created_at: datetime,
         updated_at: datetime,
-        messages: Optional[List[Dict[str, Any]]] = None,
         metadata: Optional[Dict[str, Any]] = None,
+        archive_path: Optional[str] = None,
     ):
         self.session_id = session_id
         self.user_id = user_id
         self.created_at = created_at
         self.updated_at = updated_at
-        self.messages = messages or []
         self.metadata = metadata or {}
+        self.archive_path = archive_path
+
+
+class SessionContext(SessionInfo):
+    """会话上下文：会话元数据 + 全部消息。"""
+    __slots__ = ("messages",)
+
+    def __init__(
+        self,
+        session_id: str,
+        user_id: str,
+        created_at: datetime,
+        updated_at: datetime,
+        messages: Optional[List[Dict[str, Any]]] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        archive_path: Optional[str] = None,
+    ):
+        super().__init__(session_id, user_id, created_at, updated_at, metadata, archive_path)
+        self.messages = messages or []
+
+
+def _preview(content: Optional[str]) -> str:
+    text = " ".join((content or "").split())
+    return text if len(text) <= SESSION_PREVIEW_CHARS else text[:SESSION_PREVIEW_CHARS] + "…"
+
+
+# ---------- 查询实现（接收 ORM Session，由各后端决定在哪里执行与何时提交） ----------
+
+def _save_context(session: Session, context: SessionInfo) -> None:
+    row = session.get(SessionModel, context.session_id)
+    meta_str = json.dumps(context.metadata, ensure_ascii=False)
+    if row:
+        row.user_id = context.user_id
+        row.updated_at = context.updated_at
+        row.metadata_ = meta_str
+    else:
+        session.add(SessionModel(
+            session_id=context.session_id,
+            user_id=context.user_id,
+            created_at=context.created_at,
+            updated_at=context.updated_at,
+            metadata_=meta_str,
+        ))
+
+
+def _session_info(row: SessionModel) -> SessionInfo:
+    try:
+        meta = json.loads(row.metadata_ or "{}")
+    except Exception:
+        meta = {}
+    return SessionInfo(
+        session_id=row.session_id,
+        user_id=row.user_id,
+        created_at=row.created_at,
+        updated_at=row.updated_at,
+        metadata=meta,
+        archive_path=row.archive_path,
+    )
+
+
+def _load_session_info(session: Session, session_id: str) -> Optional[SessionInfo]:
+    row = session.get(SessionModel, session_id)
+    return _session_info(row) if row else None
+
+
+def _load_context(session: Session, session_id: str) -> Optional[SessionContext]:
+    info = _load_session_info(session, session_id)
+    if info is None:
+        return None
+    msgs = session.query(ConversationMessageModel).filter(
+        ConversationMessageModel.session_id == session_id
+    ).order_by(ConversationMessageModel.id.asc()).all()
+    return SessionContext(
+        session_id=info.session_id,
+        user_id=info.user_id,
+        created_at=info.created_at,
+        updated_at=info.updated_at,
+        messages=[_message_dict(m) for m in msgs],
+        metadata=info.metadata,
+        archive_path=info.archive_path,
+    )
+
+
+def _message_dict(m: ConversationMessageModel) -> Dict[str, Any]:
+    return {
+        "message_id": m.id,
+        "role": m.role,
+        "content": m.content,
+        "timestamp": m.created_at.isoformat() if m.created_at else "",
+    }
+
+
+def _get_messages(session: Session, session_id: str, limit: int, before_id: Optional[int]) -> List[Dict[str, Any]]:
+    """键集分页：沿 (session_id, id) 索引倒序取 limit 条再翻转，代价与会话总消息数无关。"""
+    msg = ConversationMessageModel
+    stmt = select(msg).where(msg.session_id == session_id)
+    if before_id is not None:
+        stmt = stmt.where(msg.id < before_id)
+    rows = session.scalars(stmt.order_by(msg.id.desc()).limit(limit)).all()
+    return [_message_dict(m) for m in reversed(rows)]
+
+
+def _insert_tool_calls(session: Session, message_ids: List[int], metadatas: List[Optional[Dict[str, Any]]]) -> None:
+    """
+    metadata["tool_calls"]（run._extract_tool_calls 的输出）写入 message_tool_calls：
+    小输出存在行内，超过 TOOL_PAYLOAD_COMPRESS_MIN 的存入 blobs，行内只记 hash。
+    """
+    rows: List[Dict[str, Any]] = []
+    refs: Counter[str] = Counter()
+    contents: Dict[str, str] = {}
+    for message_id, metadata in zip(message_ids, metadatas):
+        for seq, call in enumerate((metadata or {}).get("tool_calls") or []):
+            output = call.get("output")
+            output = output if isinstance(output, str) else ("" if output is None else str(output))
+            raw = output.encode("utf-8")
+            row = {
+                "message_id": message_id,
+                "seq": seq,
+                "tool": str(call.get("tool") or "")[:64],
+                "input": json.dumps(call.get("input") or {}, ensure_ascii=False, default=str),
+                "output": raw,
+                "output_codec": CODEC_PLAIN,
+                "output_size": len(raw),
+                "output_hash": None,
+            }
+            if len(raw) > TOOL_PAYLOAD_COMPRESS_MIN:
+                key = blob_key(raw)
+                refs[key] += 1
+                contents[key] = output
+                row.update(output=None, output_hash=key)
+            rows.append(row)
+    if rows:
+        retain_blobs(session, refs, contents)
+        session.execute(insert(ToolCallModel), rows)
+
+
+def _add_message(session: Session, session_id: str, role: str, content: str, metadata: Optional[Dict]) -> int:
+    msg = ConversationMessageModel(session_id=session_id, role=role, content=content)
+    session.add(msg)
+    session.flush()
+    _insert_tool_calls(session, [msg.id], [metadata])
+    return msg.id
+
+
+def _add_messages(session: Session, items: List[PendingMessage]) -> List[int]:
+    """批量插入同一事务，按 items 顺序返回 id（insertmanyvalues 一次 INSERT ... RETURNING）。"""
+    rows = [
+        ConversationMessageModel(session_id=i.session_id, role=i.role, content=i.content)
+        for i in items
+    ]
+    session.add_all(rows)
+    session.flush()
+    ids = [r.id for r in rows]
+    _insert_tool_calls(session, ids, [i.metadata for i in items])
+    return ids
+
+
+def _insert_messages(session: Session, items: List[PendingMessage]) -> List[int]:
+    """Core 批量插入（不构造 ORM 对象），一次往返写入整批并按 items 顺序返回 id。"""
+    stmt = insert(ConversationMessageModel).returning(
+        ConversationMessageModel.id, sort_by_parameter_order=True
+    )
+    ids = list(session.scalars(stmt, [
+        {"session_id": i.session_id, "role": i.role, "content": i.content}
+        for i in items
+    ]))
+    _insert_tool_calls(session, ids, [i.metadata for i in items])
+    return ids
+
+
+def _tool_call_input(raw: Optional[str]) -> Dict[str, Any]:
+    try:
+        return json.loads(raw or "{}")
+    except Exception:
+        return {}
+
+
+def _tool_call_dict(row: Any, output: Optional[str]) -> Dict[str, Any]:
+    return {
+        "id": row.id,
+        "tool": row.tool,
+        "input": _tool_call_input(row.input),
+        "output": output,
+        "output_size": row.output_size,
+        # 输出未随列表返回（存于 blobs 或行内压缩），需经 get_tool_call 取
+        "compressed": row.output_hash is not None or row.output_codec != CODEC_PLAIN,
+    }
+
+
+def _get_tool_calls(session: Session, message_ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+    """一次查询取一页消息的工具调用；blobs 与行内压缩的输出都不读取，历史列表不付解压与传输代价。"""
+    if not message_ids:
+        return {}
+    tc = ToolCallModel
+    stmt = (
+        select(
+            tc.id, tc.message_id, tc.tool, tc.input, tc.output_codec, tc.output_size, tc.output_hash,
+            case((tc.output_codec == CODEC_PLAIN, tc.output), else_=None).label("plain_output"),
+        )
+        .where(tc.message_id.in_(message_ids))
+        .order_by(tc.message_id, tc.seq)
+    )
+    out: Dict[int, List[Dict[str, Any]]] = {}
+    for row in session.execute(stmt):
+        inline = row.output_hash is None and row.output_codec == CODEC_PLAIN
+        output = decode_payload(row.plain_output, CODEC_PLAIN) if inline else None
+        out.setdefault(row.message_id, []).append(_tool_call_dict(row, output))
+    return out
+
+
+def _get_tool_call(session: Session, tool_call_id: int) -> Optional[Dict[str, Any]]:
+    tc, msg = ToolCallModel, ConversationMessageModel
+    row = session.execute(
+        select(tc, msg.session_id).join(msg, msg.id == tc.message_id).where(tc.id == tool_call_id)
+    ).first()
+    if row is None:
+        return None
+    call, session_id = row
+    if call.output_hash is not None:
+        output = load_blob(session, call.output_hash) or ""
+    else:
+        output = decode_payload(call.output, call.output_codec)
+    return {
+        **_tool_call_dict(call, output),
+        "message_id": call.message_id,
+        "session_id": session_id,
+    }
 
 
-class SQLiteBackend(PersistenceBackend):
-    """基于 SQLite + SQLAlchemy 的后端。"""
+def _list_user_sessions(session: Session, user_id: str, limit: int, offset: int) -> tuple[List[Dict], int]:
+    """
+    固定三条查询：总数、当前页会话、当前页各会话的消息数与最后一条消息（一次分组查询），
+    与会话数、消息数无关。
+    """
+    q = session.query(SessionModel).filter(SessionModel.user_id == user_id).order_by(
+        SessionModel.updated_at.desc()
+    )
+    total = q.count()
+    rows = q.offset(offset).limit(limit).all()
+    if not rows:
+        return [], total
+
+    msg = ConversationMessageModel
+    stats = (
+        select(
+            msg.session_id,
+            func.count(msg.id).label("message_count"),
+            func.max(msg.id).label("last_id"),
+        )
+        .where(msg.session_id.in_([r.session_id for r in rows]))
+        .group_by(msg.session_id)
+        .subquery()
+    )
+    last_by_session = {
+        sid: (cnt, role, content)
+        for sid, cnt, role, content in session.execute(
+            select(stats.c.session_id, stats.c.message_count, msg.role, msg.content)
+            .join(msg, msg.id == stats.c.last_id)
+        )
+    }
+    out = []
+    for r in rows:
+        cnt, role, content = last_by_session.get(r.session_id, (0, None, None))
+        last_message = {"role": role, "content": _preview(content)} if role is not None else None
+        if r.archive_path is not None:
+            # 存根：消息数与预览取归档时记录的值
+            cnt += r.archived_messages or 0
+            last_message = last_message or json.loads(r.archived_preview or "null")
+        out.append({
+            "session_id": r.session_id,
+            "user_id": r.user_id,
+            "created_at": r.created_at,
+            "updated_at": r.updated_at,
+            "message_count": cnt,
+            "last_message": last_message,
+            "archived": r.archive_path is not None,
+        })
+    return out, total
+
+
+def _delete_session(session: Session, session_id: str) -> Tuple[bool, Optional[str]]:
+    """
+    单条 DELETE；消息由 sessions 表上的触发器级联删除（见 app.db.init_db，SQLite 与 PostgreSQL 各有一份）。
+    返回 (是否删除, 归档文件路径)，归档文件由调用方在提交后删除。
+    """
+    archive_path = session.scalar(select(SessionModel.archive_path).where(SessionModel.session_id == session_id))
+    result = session.execute(delete(SessionModel).where(SessionModel.session_id == session_id))
+    return result.rowcount > 0, archive_path
+
+
+def _list_idle_sessions(
+    session: Session,
+    idle_before: datetime,
+    after: Optional[Tuple[datetime, str]],
+    limit: int,
+) -> List[Dict[str, Any]]:
+    s, msg = SessionModel, ConversationMessageModel
+    # 最后一条消息的时间：沿 (session_id, id) 索引取一行（add_message 不更新 sessions.updated_at）
+    last_at = (
+        select(msg.created_at)
+        .where(msg.session_id == s.session_id)
+        .order_by(msg.id.desc())
+        .limit(1)
+        .correlate(s)
+        .scalar_subquery()
+    )
+    stmt = select(s.session_id, s.updated_at, func.coalesce(last_at, s.updated_at).label("last_active")).where(
+        s.archive_path.is_(None), s.updated_at < idle_before
+    )
+    if after is not None:
+        stmt = stmt.where(tuple_(s.updated_at, s.session_id) > tuple_(*after))
+    rows = session.execute(stmt.order_by(s.updated_at, s.session_id).limit(limit)).all()
+    return [
+        {"session_id": r.session_id, "updated_at": r.updated_at, "idle": r.last_active < idle_before}
+        for r in rows
+    ]
+
+
+def _export_session(session: Session, session_id: str, idle_before: datetime) -> Optional[Dict[str, Any]]:
+    """读取待归档会话的全部消息与工具调用（解压出完整输出）；会话已归档或 idle_before 之后仍有活动时返回 None。"""
+    row = session.get(SessionModel, session_id)
+    if row is None or row.archive_path is not None or row.updated_at >= idle_before:
+        return None
+    msg, tc, blob = ConversationMessageModel, ToolCallModel, BlobModel
+    messages = session.scalars(select(msg).where(msg.session_id == session_id).order_by(msg.id)).all()
+    if messages and messages[-1].created_at >= idle_before:
+        return None
+    calls: Dict[int, List[Dict[str, Any]]] = {}
+    for call, data, codec in session.execute(
+        select(tc, blob.data, blob.codec)
+        .join(msg, msg.id == tc.message_id)
+        .outerjoin(blob, blob.hash == tc.output_hash)
+        .where(msg.session_id == session_id)
+        .order_by(tc.message_id, tc.seq)
+    ):
+        if call.output_hash is not None:
+            output = decode_payload(data, codec)
+        else:
+            output = decode_payload(call.output, call.output_codec)
+        calls.setdefault(call.message_id, []).append(
+            {"tool": call.tool, "input": _tool_call_input(call.input), "output": output}
+        )
+    return {
+        "session_id": row.session_id,
+        "user_id": row.user_id,
+        "last_message_id": messages[-1].id if messages else None,
+        "messages": [
+            {
+                "id": m.id,
+                "role": m.role,
+                "content": m.content,
+                "created_at": m.created_at.isoformat() if m.created_at else None,
+                "tool_calls": calls.get(m.id, []),
+            }
+            for m in messages
+        ],
+    }
+
+
+def _stub_session(
+    session: Session,
+    session_id: str,
+    idle_before: datetime,
+    archive_path: str,
+    snapshot: Dict[str, Any],
+) -> bool:
+    """
+    会话行改为存根并删除其消息（工具调用、blob 引用与全文索引由触发器清理）。
+    先更新会话行（SQLite 上取得写锁），再确认导出后没有新消息写入，否则回滚。
+    """
+    msg = ConversationMessageModel
+    messages = snapshot["messages"]
+    last = messages[-1] if messages else None
+    preview = {"role": last["role"], "content": _preview(last["content"])} if last else None
+    result = session.execute(
+        update(SessionModel)
+        .where(
+            SessionModel.session_id == session_id,
+            SessionModel.archive_path.is_(None),
+            SessionModel.updated_at < idle_before,
+        )
+        .values(
+            archive_path=archive_path,
+            archived_at=datetime.utcnow(),
+            archived_messages=len(messages),
+            archived_preview=json.dumps(preview, ensure_ascii=False),
+        )
+    )
+    if not result.rowcount:
+        return False
+    if session.scalar(select(func.max(msg.id)).where(msg.session_id == session_id)) != snapshot["last_message_id"]:
+        session.rollback()
+        return False
+    session.execute(delete(msg).where(msg.session_id == session_id))
+    return True
+
+
+def _restore_session(session: Session, session_id: str, archive_path: str, payload: Dict[str, Any]) -> bool:
+    """
+    先清除存根标记（只有一个并发调用能成功），再写回消息与工具调用。
+    原 id 未被占用时沿用原 id（与归档期间写入的消息保持顺序），否则分配新 id。
+    """
+    msg = ConversationMessageModel
+    result = session.execute(
+        update(SessionModel)
+        .where(SessionModel.session_id == session_id, SessionModel.archive_path == archive_path)
+        .values(archive_path=None, archived_at=None, archived_messages=None, archived_preview=None)
+    )
+    if not result.rowcount:
+        return False
+    messages = payload["messages"]
+    if not messages:
+        return True
+    ids = [m["id"] for m in messages]
+    keep_ids = not any(
+        session.execute(select(msg.id).where(msg.id.in_(ids[i:i + _RESTORE_ID_CHUNK])).limit(1)).first()
+        for i in range(0, len(ids), _RESTORE_ID_CHUNK)
+    )
+    rows = []
+    for m in messages:
+        row = {
+            "session_id": session_id,
+            "role": m["role"],
+            "content": m["content"],
+            "created_at": datetime.fromisoformat(m["created_at"]) if m.get("created_at") else datetime.utcnow(),
+        }
+        if keep_ids:
+            row["id"] = m["id"]
+        rows.append(row)
+    new_ids = list(session.scalars(insert(msg).returning(msg.id, sort_by_parameter_order=True), rows))
+    _insert_tool_calls(session, new_ids, [{"tool_calls": m.get("tool_calls")} for m in messages])
+    return True
+
+
+def _archive_path(session: Session, session_id: str) -> Optional[str]:
+    return session.scalar(select(SessionModel.archive_path).where(SessionModel.session_id == session_id))
+
+
+class _SessionBackend(PersistenceBackend):
+    """
+    把各操作交给 _execute 在一个事务里执行；子类决定 _execute 的方式（线程池 / 异步引擎）。
+    开启 STORAGE_WRITE_BEHIND 时 add_message 经 MessageWriter 合并提交。
+    """
 
     def __init__(self) -> None:
-        self._session_factory = SessionLocal
+        self._writer: Optional[MessageWriter] = None
+        if STORAGE_WRITE_BEHIND:
+            self._writer = MessageWriter(self._write_batch, max_batch=STORAGE_WRITE_BATCH)
 
-    async def initialize(self) -> None:
-        pass
+    async def _write_batch(self, items: List[PendingMessage]) -> List[int]:
+        return await self._execute(_add_messages, items)
 
-    @staticmethod
-    async def _run_sync(fn, *args, **kwargs):
-        import asyncio
-        return await asyncio.to_thread(lambda: fn(*args, **kwargs))
+    async def close(self) -> None:
+        if self._writer is not None:
+            await self._writer.close()
 
-    def _save_context_sync(self, context: SessionContext) -> None:
-        session = self._session_factory()
-        try:
-            row = session.query(SessionModel).get(context.session_id)
-            meta_str = json.dumps(context.metadata, ensure_ascii=False)
-            if row:
-                row.user_id = context.user_id
-                row.updated_at = context.updated_at
-                row.metadata_ = meta_str
-            else:
-                session.add(SessionModel(
-                    session_id=context.session_id,
-                    user_id=context.user_id,
-                    created_at=context.created_at,
-                    updated_at=context.updated_at,
-                    metadata_=meta_str,
-                ))
-            session.commit()
-        finally:
-            session.close()
+    @abstractmethod
+    async def _execute(self, fn: Callable[..., _T], *args: Any) -> _T:
+        """在一个事务中执行 fn(session, *args) 并提交，返回其结果。"""
 
-    def _load_context_sync(self, session_id: str) -> Optional[SessionContext]:
-        session = self._session_factory()
-        try:
-            row = session.query(SessionModel).get(session_id)
-            if not row:
-                return None
-            try:
-                meta = json.loads(row.metadata_ or "{}")
-            except Exception:
-                meta = {}
-            msgs = session.query(ConversationMessageModel).filter(
-                ConversationMessageModel.session_id == session_id
-            ).order_by(ConversationMessageModel.created_at.asc()).all()
-            messages = [
-                {
-                    "message_id": m.id,
-                    "role": m.role,
-                    "content": m.content,
-                    "timestamp": m.created_at.isoformat() if m.created_at else "",
-                }
-                for m in msgs
-            ]
-            return SessionContext(
-                session_id=row.session_id,
-                user_id=row.user_id,
-                created_at=row.created_at,
-                updated_at=row.updated_at,
-                messages=messages,
-                metadata=meta,
-            )
-        finally:
-            session.close()
+    async def delete_session(self, session_id: str) -> bool:
+        deleted, archive_path = await self._execute(_delete_session, session_id)
+        if archive_path:
+            await asyncio.to_thread(remove_archive, archive_path)
+        return deleted
 
-    def _add_message_sync(self, session_id: str, role: str, content: str, metadata: Optional[Dict]) -> int:
-        session = self._session_factory()
-        try:
-            msg = ConversationMessageModel(session_id=session_id, role=role, content=content)
-            session.add(msg)
-            session.commit()
-            session.refresh(msg)
-            return msg.id
-        finally:
-            session.close()
+    async def list_idle_sessions(
+        self,
+        idle_before: datetime,
+        after: Optional[Tuple[datetime, str]] = None,
+        limit: int = 20,
+    ) -> List[Dict[str, Any]]:
+        return await self._execute(_list_idle_sessions, idle_before, after, limit)
 
-    def _list_user_sessions_sync(self, user_id: str, limit: int, offset: int) -> tuple[List[Dict], int]:
-        session = self._session_factory()
+    async def archive_session(self, session_id: str, idle_before: datetime) -> bool:
+        snapshot = await self._execute(_export_session, session_id, idle_before)
+        if snapshot is None:
+            return False
+        # 文件读写与压缩在线程中执行，不占用事件循环
+        path = new_archive_path(session_id)
+        await asyncio.to_thread(write_archive, path, snapshot)
+        archived = False
         try:
-            q = session.query(SessionModel).filter(SessionModel.user_id == user_id).order_by(
-                SessionModel.updated_at.desc()
-            )
-            total = q.count()
-            rows = q.offset(offset).limit(limit).all()
-            out = []
-            for r in rows:
-                cnt = session.query(ConversationMessageModel).filter(
-                    ConversationMessageModel.session_id == r.session_id
-                ).count()
-                out.append({
-                    "session_id": r.session_id,
-                    "user_id": r.user_id,
-                    "created_at": r.created_at,
-                    "updated_at": r.updated_at,
-                    "message_count": cnt,
-                })
-            return out, total
+            archived = await self._execute(_stub_session, session_id, idle_before, path, snapshot)
         finally:
-            session.close()
+            if not archived:
+                await asyncio.to_thread(remove_archive, path)
+        return archived
 
-    def _delete_session_sync(self, session_id: str) -> bool:
-        session = self._session_factory()
+    async def restore_session(self, session_id: str) -> bool:
+        path = await self._execute(_archive_path, session_id)
+        if not path:
+            return False
         try:
-            row = session.query(SessionModel).get(session_id)
-            if not row:
+            payload = await asyncio.to_thread(read_archive, path)
+        except FileNotFoundError:
+            # 并发的恢复已完成并删除了文件
+            if await self._execute(_archive_path, session_id) != path:
                 return False
-            session.query(ConversationMessageModel).filter(
-                ConversationMessageModel.session_id == session_id
-            ).delete(synchronize_session=False)
-            session.delete(row)
-            session.commit()
-            return True
-        finally:
-            session.close()
-
-    async def delete_session(self, session_id: str) -> bool:
-        return await self._run_sync(self._delete_session_sync, session_id)
+            raise
+        if payload.get("session_id") != session_id:
+            raise ValueError(f"归档文件 {path} 不属于会话 {session_id}")
+        restored = await self._execute(_restore_session, session_id, path, payload)
+        if restored:
+            await asyncio.to_thread(remove_archive, path)
+        return restored
 
-    async def save_context(self, context: SessionContext) -> None:
-        await self._run_sync(self._save_context_sync, context)
+    async def save_context(self, context: SessionInfo) -> None:
+        await self._execute(_save_context, context)
 
     async def load_context(self, session_id: str) -> Optional[SessionContext]:
-        return await self._run_sync(self._load_context_sync, session_id)
+        return await self._execute(_load_context, session_id)
+
+    async def load_session_info(self, session_id: str) -> Optional[SessionInfo]:
+        return await self._execute(_load_session_info, session_id)
 
     async def add_message(
         self,
@@ -208,7 +689,23 @@ class SQLiteBackend(PersistenceBackend):
         content: str,
         metadata: Optional[Dict[str, Any]] = None,
     ) -> int:
-        return await self._run_sync(self._add_message_sync, session_id, role, content, metadata)
+        if self._writer is not None:
+            return await self._writer.add(session_id, role, content, metadata)
+        return await self._execute(_add_message, session_id, role, content, metadata)
+
+    async def get_messages(
+        self,
+        session_id: str,
+        limit: int = 50,
+        before_id: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        return await self._execute(_get_messages, session_id, limit, before_id)
+
+    async def get_tool_calls(self, message_ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+        return await self._execute(_get_tool_calls, message_ids)
+
+    async def get_tool_call(self, tool_call_id: int) -> Optional[Dict[str, Any]]:
+        return await self._execute(_get_tool_call, tool_call_id)
 
     async def list_user_sessions(
         self,
@@ -216,4 +713,73 @@ class SQLiteBackend(PersistenceBackend):
         limit: int = 10,
         offset: int = 0,
     ) -> tuple[List[Dict[str, Any]], int]:
-        return await self._run_sync(self._list_user_sessions_sync, user_id, limit, offset)
+        return await self._execute(_list_user_sessions, user_id, limit, offset)
+
+    async def search_messages(
+        self,
+        user_id: str,
+        query: str,
+        limit: int = 20,
+        offset: int = 0,
+    ) -> List[Dict[str, Any]]:
+        return await self._execute(search_messages, user_id, query, limit, offset)
+
+
+class SQLiteBackend(_SessionBackend):
+    """基于 SQLite + 同步 SQLAlchemy 的后端，每个操作经 asyncio.to_thread 在默认线程池中执行。"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._session_factory = SessionLocal
+
+    async def initialize(self) -> None:
+        pass
+
+    def _execute_sync(self, fn: Callable[..., _T], *args: Any) -> _T:
+        session = self._session_factory()
+        try:
+            result = fn(session, *args)
+            session.commit()
+            return result
+        finally:
+            session.close()
+
+    async def _execute(self, fn: Callable[..., _T], *args: Any) -> _T:
+        return await asyncio.to_thread(self._execute_sync, fn, *args)
+
+
+class _AsyncEngineBackend(_SessionBackend):
+    """经 SQLAlchemy 异步引擎（连接池）执行：查询实现与 SQLiteBackend 共用，经 AsyncSession.run_sync 在异步连接上执行。"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._session_factory: Optional[async_sessionmaker[AsyncSession]] = None
+
+    async def initialize(self) -> None:
+        self._session_factory = get_async_session_factory()
+
+    async def close(self) -> None:
+        await super().close()
+        await dispose_async_engine()
+
+    async def _execute(self, fn: Callable[..., _T], *args: Any) -> _T:
+        if self._session_factory is None:
+            await self.initialize()
+        async with self._session_factory() as session:
+            result = await session.run_sync(fn, *args)
+            await session.commit()
+            return result
+
+
+class AsyncSQLiteBackend(_AsyncEngineBackend):
+    """基于 aiosqlite + SQLAlchemy 异步引擎的后端：连接池复用连接，不占用事件循环的默认线程池。"""
+
+
+class PostgresBackend(_AsyncEngineBackend):
+    """
+    PostgreSQL 后端（DATABASE_URL 为 postgresql:// 时使用），多个 API 节点可共享同一数据库。
+    异步引擎 + psycopg 连接池（STORAGE_POOL_SIZE）；合并提交的消息用一条多行 INSERT ... RETURNING 写入。
+    """
+
+    async def _write_batch(self, items: List[PendingMessage]) -> List[int]:
+        return await self._execute(_insert_messages, items)
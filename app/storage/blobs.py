@@ -0,0 +1,52 @@
+"""
+内容寻址的载荷存储（blobs 表）：超过 TOOL_PAYLOAD_COMPRESS_MIN 的工具输出按 SHA-256 只存一份。
+
+- 写入：已有的 blob 只增加引用计数，不重复压缩与写入内容；新内容压缩后插入（app.storage.payload）
+- 释放：引用行（message_tool_calls）删除时由触发器减少计数，归零即删除（见 app.db），
+  delete_session 的一条 DELETE 即完成回收
+"""
+
+from __future__ import annotations
+
+import hashlib
+from typing import Any, Dict, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert as postgres_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.models import BlobModel
+from app.storage.payload import decode_payload, encode_payload
+
+
+def blob_key(raw: bytes) -> str:
+    return hashlib.sha256(raw).hexdigest()
+
+
+def _upsert(session: Session) -> Any:
+    return postgres_insert if session.get_bind().dialect.name == "postgresql" else sqlite_insert
+
+
+def retain_blobs(session: Session, refs: Dict[str, int], contents: Dict[str, str]) -> None:
+    """为每个 hash 增加 refs[hash] 个引用；不存在的先压缩写入。并发写入同一内容时按冲突合并计数。"""
+    for key, count in refs.items():
+        result = session.execute(
+            update(BlobModel).where(BlobModel.hash == key).values(refcount=BlobModel.refcount + count)
+        )
+        if result.rowcount:
+            continue
+        content = contents[key]
+        data, codec = encode_payload(content)
+        stmt = _upsert(session)(BlobModel).values(
+            hash=key, data=data, codec=codec, size=len(content.encode("utf-8")), refcount=count
+        )
+        session.execute(stmt.on_conflict_do_update(
+            index_elements=[BlobModel.hash],
+            set_={"refcount": BlobModel.refcount + stmt.excluded.refcount},
+        ))
+
+
+def load_blob(session: Session, key: str) -> Optional[str]:
+    row = session.execute(select(BlobModel.data, BlobModel.codec).where(BlobModel.hash == key)).first()
+    return decode_payload(row.data, row.codec) if row else None
@@ -1,22 +1,139 @@
 """
 会话上下文管理：create_session / get_session / add_message / get_conversation_history，
 会话与消息生命周期管理。
+
+进程内按 LRU + TTL 缓存会话（SESSION_CACHE_SIZE / SESSION_CACHE_TTL，大小为 0 时关闭）：
+- 缓存项为完整的 SessionContext，或只含元数据的 SessionInfo（归属检查时读入，不加载消息）
+- add_message / update_session 写穿：先写后端，再更新缓存中的同一对象
+- 加载期间同一会话有写入时，本次结果不入缓存，避免缓存旧快照
+- 缓存只感知本进程的写入，因此其他进程也写同一数据库时默认关闭：PostgreSQL（多节点共享）、
+  Web 设 JOB_WORKERS=0 把任务交给单独的 run_worker 进程，以及 run_worker 进程自身；
+  显式设置 SESSION_CACHE_SIZE 时以设置为准（其他进程的写入最多在 TTL 后可见）
+
+已归档的会话（app.retention）只剩存根：get_session / get_conversation_history 先从归档文件恢复消息再读取。
 """
 
 from __future__ import annotations
 
+import bisect
+import os
+import time
 import uuid
+from collections import OrderedDict
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.config import DATABASE_DIALECT
+from app.storage.backend import PersistenceBackend, SessionContext, SessionInfo
+
+
+
+def _default_cache_size() -> str:
+    # JOB_WORKERS=0：本进程不执行任务，agent 任务在其他进程中向同一数据库追加消息
+    if DATABASE_DIALECT == "postgresql" or int(os.environ.get("JOB_WORKERS", "4")) == 0:
+        return "0"
+    return "256"
+
 
-from app.storage.backend import PersistenceBackend, SessionContext
+SESSION_CACHE_SIZE = int(os.environ.get("SESSION_CACHE_SIZE") or _default_cache_size())
+SESSION_CACHE_TTL = float(os.environ.get("SESSION_CACHE_TTL", "60"))
+
+
+class SessionCache:
+    """session_id -> (过期时间, SessionInfo / SessionContext) 的 LRU，带命中统计。"""
+
+    def __init__(self, max_entries: int = SESSION_CACHE_SIZE, ttl: float = SESSION_CACHE_TTL) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, SessionInfo]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def peek(self, session_id: str) -> Optional[SessionInfo]:
+        """取缓存项（不计入统计）；过期则删除。"""
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires <= time.monotonic():
+            del self._entries[session_id]
+            return None
+        return value
+
+    def get(self, session_id: str, full: bool) -> Optional[SessionInfo]:
+        """full=True 时只有完整的 SessionContext 算命中。"""
+        value = self.peek(session_id)
+        if value is None or (full and not isinstance(value, SessionContext)):
+            self.misses += 1
+            return None
+        self._entries.move_to_end(session_id)
+        self.hits += 1
+        return value
+
+    def put(self, value: SessionInfo) -> None:
+        if not self.enabled:
+            return
+        self._entries[value.session_id] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(value.session_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, session_id: str) -> None:
+        self._entries.pop(session_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
 
 
 class ContextManager:
-    """会话上下文管理，委托给 PersistenceBackend。"""
+    """会话上下文管理，委托给 PersistenceBackend，读路径经 SessionCache。"""
 
-    def __init__(self, backend: PersistenceBackend) -> None:
+    def __init__(self, backend: PersistenceBackend, cache: Optional[SessionCache] = None) -> None:
         self._backend = backend
+        self.cache = cache if cache is not None else SessionCache()
+        # 正在从后端加载的会话（计数）及加载期间发生过写入的会话
+        self._loading: Dict[str, int] = {}
+        self._dirty: Set[str] = set()
+
+    async def _load(self, session_id: str, full: bool) -> Optional[SessionInfo]:
+        self._loading[session_id] = self._loading.get(session_id, 0) + 1
+        try:
+            if full:
+                value = await self._backend.load_context(session_id)
+            else:
+                value = await self._backend.load_session_info(session_id)
+        finally:
+            remaining = self._loading[session_id] - 1
+            if remaining:
+                self._loading[session_id] = remaining
+            else:
+                del self._loading[session_id]
+            stale = session_id in self._dirty
+            if not remaining:
+                self._dirty.discard(session_id)
+        if value is not None and not stale:
+            # 已缓存完整上下文时不用元数据覆盖
+            if full or not isinstance(self.cache.peek(session_id), SessionContext):
+                self.cache.put(value)
+        return value
+
+    def _mark_written(self, session_id: str) -> None:
+        if session_id in self._loading:
+            self._dirty.add(session_id)
 
     async def create_session(
         self,
@@ -35,10 +152,26 @@ class ContextManager:
             metadata=metadata or {},
         )
         await self._backend.save_context(ctx)
+        self._mark_written(sid)
+        self.cache.put(ctx)
         return ctx
 
     async def get_session(self, session_id: str) -> Optional[SessionContext]:
-        return await self._backend.load_context(session_id)
+        cached = self.cache.get(session_id, full=True)
+        if cached is not None:
+            return cached  # type: ignore[return-value]
+        ctx = await self._load(session_id, full=True)
+        if ctx is not None and ctx.archive_path:
+            await self._restore(session_id)
+            ctx = await self._load(session_id, full=True)
+        return ctx  # type: ignore[return-value]
+
+    async def get_session_info(self, session_id: str) -> Optional[SessionInfo]:
+        """只取会话元数据（不加载消息），用于存在性 / 归属检查。"""
+        cached = self.cache.get(session_id, full=False)
+        if cached is not None:
+            return cached
+        return await self._load(session_id, full=False)
 
     async def get_or_create_session(
         self,
@@ -57,13 +190,26 @@ class ContextManager:
         session_id: str,
         metadata: Optional[Dict[str, Any]] = None,
     ) -> None:
-        ctx = await self._backend.load_context(session_id)
-        if ctx is None:
+        current = await self.get_session_info(session_id)
+        if current is None:
             return
-        ctx.updated_at = datetime.utcnow()
-        if metadata is not None:
-            ctx.metadata.update(metadata)
-        await self._backend.save_context(ctx)
+        # 在副本上修改，后端写入成功后再替换缓存
+        info = SessionInfo(
+            session_id=current.session_id,
+            user_id=current.user_id,
+            created_at=current.created_at,
+            updated_at=datetime.utcnow(),
+            metadata={**current.metadata, **(metadata or {})},
+            archive_path=current.archive_path,
+        )
+        await self._backend.save_context(info)
+        self._mark_written(session_id)
+        cached = self.cache.peek(session_id)
+        if cached is not None:
+            cached.updated_at = info.updated_at
+            cached.metadata = info.metadata
+        else:
+            self.cache.put(info)
 
     async def add_message(
         self,
@@ -72,14 +218,71 @@ class ContextManager:
         content: str,
         metadata: Optional[Dict[str, Any]] = None,
     ) -> int:
-        return await self._backend.add_message(session_id, role, content, metadata)
+        message_id = await self._backend.add_message(session_id, role, content, metadata)
+        self._mark_written(session_id)
+        cached = self.cache.peek(session_id)
+        if isinstance(cached, SessionContext):
+            message = {
+                "message_id": message_id,
+                "role": role,
+                "content": content,
+                "timestamp": datetime.utcnow().isoformat(),
+            }
+            # 并发写入同一会话时按 id 有序插入
+            if cached.messages and cached.messages[-1]["message_id"] > message_id:
+                ids = [m["message_id"] for m in cached.messages]
+                cached.messages.insert(bisect.bisect(ids, message_id), message)
+            else:
+                cached.messages.append(message)
+        return message_id
 
     async def get_conversation_history(
         self,
         session_id: str,
         limit: int = 50,
+        before_id: Optional[int] = None,
     ) -> List[Dict[str, Any]]:
-        ctx = await self._backend.load_context(session_id)
-        if not ctx or not ctx.messages:
-            return []
-        return ctx.messages[-limit:]
+        """最近 limit 条消息（时间正序）；传 before_id 时取该消息之前的一页，用于向前翻页。"""
+        cached = self.cache.get(session_id, full=True)
+        if cached is None:
+            info = await self.get_session_info(session_id)
+            if info is not None and info.archive_path:
+                await self._restore(session_id)
+            return await self._backend.get_messages(session_id, limit=limit, before_id=before_id)
+        messages: List[Dict[str, Any]] = cached.messages  # type: ignore[attr-defined]
+        if before_id is not None:
+            end = bisect.bisect_left([m["message_id"] for m in messages], before_id)
+            messages = messages[:end]
+        return messages[-limit:] if limit > 0 else []
+
+    async def delete_session(self, session_id: str) -> bool:
+        """删除会话及其全部消息并清除缓存。"""
+        self.cache.pop(session_id)
+        deleted = await self._backend.delete_session(session_id)
+        self._mark_written(session_id)
+        self.cache.pop(session_id)
+        return deleted
+
+    async def archive_session(self, session_id: str, idle_before: datetime) -> bool:
+        """会话在 idle_before 之后没有活动时归档其消息（见 PersistenceBackend.archive_session）。"""
+        archived = await self._backend.archive_session(session_id, idle_before)
+        if archived:
+            self._mark_written(session_id)
+            self.cache.pop(session_id)
+        return archived
+
+    async def restore_session(self, session_id: str) -> bool:
+        """把已归档会话的消息写回数据库；会话未归档时不做任何事。返回是否执行了恢复。"""
+        info = await self.get_session_info(session_id)
+        if info is None or not info.archive_path:
+            return False
+        await self._restore(session_id)
+        return True
+
+    async def _restore(self, session_id: str) -> None:
+        await self._backend.restore_session(session_id)
+        self._mark_written(session_id)
+        self.cache.pop(session_id)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        return self.cache.stats()
@@ -0,0 +1,58 @@
+"""
+工具调用输出的存储编码：不超过 TOOL_PAYLOAD_COMPRESS_MIN 字节原样保存，更大的压缩后保存。
+
+- 安装了 zstandard（可选依赖 zstd）时用 zstd，否则用标准库 zlib；编码方式随行保存，读取时按行解码，两种数据可以并存
+- 压缩后没有变小时原样保存
+"""
+
+from __future__ import annotations
+
+import os
+import zlib
+from typing import Any, Optional, Tuple
+
+TOOL_PAYLOAD_COMPRESS_MIN = int(os.environ.get("TOOL_PAYLOAD_COMPRESS_MIN", "1024"))
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+CODEC_PLAIN = ""
+CODEC_ZLIB = "zlib"
+CODEC_ZSTD = "zstd"
+
+
+def _zstd() -> Optional[Any]:
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def encode_payload(text: str) -> Tuple[bytes, str]:
+    """返回 (存储字节, 编码方式)。"""
+    raw = text.encode("utf-8")
+    if len(raw) <= TOOL_PAYLOAD_COMPRESS_MIN:
+        return raw, CODEC_PLAIN
+    zstd = _zstd()
+    if zstd is not None:
+        data, codec = zstd.ZstdCompressor(level=ZSTD_LEVEL).compress(raw), CODEC_ZSTD
+    else:
+        data, codec = zlib.compress(raw, ZLIB_LEVEL), CODEC_ZLIB
+    if len(data) >= len(raw):
+        return raw, CODEC_PLAIN
+    return data, codec
+
+
+def decode_payload(data: Optional[bytes], codec: str) -> str:
+    if data is None:
+        return ""
+    if codec == CODEC_ZLIB:
+        data = zlib.decompress(data)
+    elif codec == CODEC_ZSTD:
+        zstd = _zstd()
+        if zstd is None:
+            raise RuntimeError("该工具输出以 zstd 压缩，读取需要安装 zstandard")
+        data = zstd.ZstdDecompressor().decompress(data)
+    elif codec != CODEC_PLAIN:
+        raise ValueError(f"未知的载荷编码: {codec}")
+    return bytes(data).decode("utf-8")
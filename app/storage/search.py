@@ -0,0 +1,183 @@
+"""
+会话消息全文检索：按用户过滤、按相关度排序、分页，返回高亮片段。
+
+- SQLite：FTS5 外部内容表 conversation_messages_fts（trigram 分词，中英文与 IP / CVE / banner 子串均可命中），
+  由触发器随 add_message / 删除增量维护；owner 列在索引内按用户过滤（见 app.db.SQLITE_FTS）。
+  FTS5 自带的 bm25() 按全库命中计算 IDF，常见词要上百毫秒；这里取该用户最近的
+  SEARCH_MAX_CANDIDATES 条命中，在该用户的消息范围内计算 BM25，代价与全库规模无关
+- PostgreSQL：pg_trgm GIN 索引加速 ILIKE，按 word_similarity 排序（未安装 pg_trgm 时按时间倒序）
+- 关键词按空白切分、全部命中（AND）；trigram 索引只能匹配不少于 3 个字符的词，更短的词用 LIKE 补充过滤
+"""
+
+from __future__ import annotations
+
+import html
+import math
+import os
+import re
+from typing import Any, Dict, List, Sequence, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# 参与排序的命中上限（按时间取最近的），更早的命中不出现在结果中
+SEARCH_MAX_CANDIDATES = int(os.environ.get("SEARCH_MAX_CANDIDATES", "1000"))
+# trigram 索引可检索的最短词；更短的词（如两字中文词）在该用户的消息内用 LIKE 过滤
+TRIGRAM_MIN_CHARS = 3
+# 片段：首个命中处前后保留的字符数
+SNIPPET_CONTEXT_CHARS = 40
+# BM25 参数
+_BM25_K1, _BM25_B = 1.2, 0.75
+# 高亮标记先用私用区字符占位，转义正文后再换成 <mark>，避免消息中的 HTML 被渲染
+_MARK_OPEN, _MARK_CLOSE = "\ue000", "\ue001"
+
+
+class SearchQueryError(ValueError):
+    """搜索词无法用于检索（为空）。"""
+
+
+def parse_terms(query: str) -> List[str]:
+    terms = query.split()
+    if not terms:
+        raise SearchQueryError("搜索词不能为空")
+    return terms
+
+
+def _fts_phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _fts_match(owner_key: str, terms: Sequence[str]) -> str:
+    """owner 列限定用户，每个词作为 content 列的短语（双引号转义）全部命中；用户输入中的 FTS 语法不生效。"""
+    return " AND ".join([f"owner : {_fts_phrase(owner_key)}"] + [f"content : {_fts_phrase(t)}" for t in terms])
+
+
+def _like_pattern(term: str) -> str:
+    return "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def _like_filter(terms: Sequence[str], params: Dict[str, Any], operator: str) -> str:
+    where = ""
+    for i, term in enumerate(terms):
+        params[f"p{i}"] = _like_pattern(term)
+        where += f" AND m.content {operator} :p{i} ESCAPE '\\'"
+    return where
+
+
+def _render_snippet(raw: str) -> str:
+    return html.escape(raw).replace(_MARK_OPEN, "<mark>").replace(_MARK_CLOSE, "</mark>")
+
+
+def _excerpt(content: str, terms: Sequence[str]) -> str:
+    """在首个命中处截取片段并标记所有命中。"""
+    pattern = re.compile("|".join(re.escape(t) for t in sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+    first = pattern.search(content)
+    start = max(0, first.start() - SNIPPET_CONTEXT_CHARS) if first else 0
+    end = min(len(content), (first.end() if first else 0) + SNIPPET_CONTEXT_CHARS)
+    window = pattern.sub(lambda m: _MARK_OPEN + m.group(0) + _MARK_CLOSE, content[start:end])
+    return ("…" if start > 0 else "") + window + ("…" if end < len(content) else "")
+
+
+def _bm25(contents: Sequence[str], terms: Sequence[str], total: int, doc_freq: Dict[str, int]) -> List[float]:
+    """BM25 打分（越大越相关）；词频按不区分大小写的子串计数，与 trigram 匹配一致，平均长度取自候选集。"""
+    lengths = [len(c) for c in contents]
+    avg_len = sum(lengths) / len(lengths) or 1.0
+    idf = {t: math.log(1 + (total - doc_freq[t] + 0.5) / (doc_freq[t] + 0.5)) for t in terms}
+    scores = []
+    for content, length in zip(contents, lengths):
+        folded = content.casefold()
+        norm = _BM25_K1 * (1 - _BM25_B + _BM25_B * length / avg_len)
+        score = 0.0
+        for t in terms:
+            tf = folded.count(t.casefold())
+            score += idf[t] * tf * (_BM25_K1 + 1) / (tf + norm)
+        scores.append(score)
+    return scores
+
+
+_FTS_COUNT = "SELECT count(*) FROM conversation_messages_fts WHERE conversation_messages_fts MATCH :match"
+
+# 只取 rowid 倒序的前若干条命中：owner 限定后 doclist 只含该用户的消息
+_FTS_CANDIDATES = """
+    SELECT m.id, m.session_id, m.role, m.created_at, m.content
+    FROM conversation_messages_fts f
+    JOIN conversation_messages m ON m.id = f.rowid
+    WHERE conversation_messages_fts MATCH :match{where}
+    ORDER BY f.rowid DESC
+    LIMIT :candidates
+"""
+
+# 只有短词（SQLite）或 PostgreSQL：沿 user_id / session_id 索引取该用户的消息，LIKE / ILIKE 过滤
+_LIKE_SEARCH = """
+    SELECT m.id, m.session_id, m.role, m.created_at, m.content, {score} AS score
+    FROM conversation_messages m
+    JOIN sessions s ON s.session_id = m.session_id
+    WHERE s.user_id = :user_id{where}
+    ORDER BY score DESC, m.id DESC
+    LIMIT :limit OFFSET :offset
+"""
+
+
+def _search_fts(
+    session: Session,
+    user_id: str,
+    indexed: List[str],
+    short: List[str],
+    limit: int,
+    offset: int,
+) -> List[Tuple[Any, float]]:
+    owner_key = session.execute(
+        text("SELECT owner_key FROM search_owners WHERE user_id = :user_id"), {"user_id": user_id}
+    ).scalar()
+    if owner_key is None:
+        return []
+    params: Dict[str, Any] = {"match": _fts_match(owner_key, indexed), "candidates": SEARCH_MAX_CANDIDATES}
+    where = _like_filter(short, params, "LIKE")
+    rows = session.execute(text(_FTS_CANDIDATES.format(where=where)), params).all()
+    if not rows:
+        return []
+    # 该用户的消息数与各词的命中数，只在 owner 限定的 doclist 内计数
+    count = text(_FTS_COUNT)
+    total = session.execute(count, {"match": _fts_match(owner_key, [])}).scalar() or 1
+    doc_freq = {t: session.execute(count, {"match": _fts_match(owner_key, [t])}).scalar() or 0 for t in indexed}
+    scores = _bm25([r.content or "" for r in rows], indexed, total, doc_freq)
+    ranked = sorted(zip(rows, scores), key=lambda item: (-item[1], -item[0].id))
+    return ranked[offset:offset + limit]
+
+
+def search_messages(
+    session: Session,
+    user_id: str,
+    query: str,
+    limit: int,
+    offset: int,
+) -> List[Dict[str, Any]]:
+    """按相关度返回 user_id 名下会话中匹配 query 的消息（score 越大越相关）。"""
+    terms = parse_terms(query)
+    postgres = session.get_bind().dialect.name == "postgresql"
+    indexed = [t for t in terms if len(t) >= TRIGRAM_MIN_CHARS]
+    if indexed and not postgres:
+        short = [t for t in terms if len(t) < TRIGRAM_MIN_CHARS]
+        ranked = _search_fts(session, user_id, indexed, short, limit, offset)
+    else:
+        params: Dict[str, Any] = {"user_id": user_id, "limit": limit, "offset": offset}
+        where = _like_filter(terms, params, "ILIKE" if postgres else "LIKE")
+        score = "0"
+        if postgres and session.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first():
+            # pg_trgm：GIN 索引加速 ILIKE，按各词的 word_similarity 之和排序
+            for i, term in enumerate(terms):
+                params[f"t{i}"] = term
+            score = " + ".join(f"word_similarity(:t{i}, m.content)" for i in range(len(terms)))
+        rows = session.execute(text(_LIKE_SEARCH.format(where=where, score=score)), params).all()
+        ranked = [(r, float(r.score)) for r in rows]
+    return [
+        {
+            "message_id": r.id,
+            "session_id": r.session_id,
+            "role": r.role,
+            "created_at": r.created_at,
+            "snippet": _render_snippet(_excerpt(r.content or "", terms)),
+            "score": round(score, 4),
+        }
+        for r, score in ranked
+    ]
@@ -0,0 +1,132 @@
+"""
+消息写入合并（group commit）：并发的 add_message 排队，由单个写入协程合并为一个事务提交。
+
+- 调用方仍等待所在批次提交完成并拿到消息 id，提交后立即可读，语义与逐条写入一致
+- 不设等待窗口：上一批提交期间到达的消息组成下一批，低负载时延迟与逐条写入相同
+- 批次提交失败时逐条重试，只有出错的那条消息向调用方抛出异常
+- 每个事件循环一个队列与写入协程；写入协程停止（关闭或异常退出）时，尚未提交的消息向调用方抛出异常，
+  不会有调用方永远等待
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import weakref
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PendingMessage:
+    session_id: str
+    role: str
+    content: str
+    metadata: Optional[Dict[str, Any]] = None
+    future: "asyncio.Future[int]" = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+
+
+# 把一批消息写入同一事务并按顺序返回 id
+WriteBatch = Callable[[List[PendingMessage]], Awaitable[List[int]]]
+# 一个事件循环的队列与写入协程
+_Lane = Tuple["asyncio.Queue[PendingMessage]", asyncio.Task]
+
+
+class _WriterStopped(RuntimeError):
+    """写入协程已停止，排队中的消息未提交。"""
+
+
+def _fail(items: List[PendingMessage], exc: BaseException) -> None:
+    for item in items:
+        if not item.future.done():
+            item.future.set_exception(exc)
+
+
+class MessageWriter:
+    """每个事件循环一个写入协程；max_batch 限制单个事务的消息数。"""
+
+    def __init__(self, write_batch: WriteBatch, max_batch: int = 200) -> None:
+        self._write_batch = write_batch
+        self.max_batch = max(1, max_batch)
+        # 事件循环 -> (队列, 写入协程)；循环被回收时条目随之消失
+        self._lanes: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _Lane]" = weakref.WeakKeyDictionary()
+
+    def _ensure_running(self) -> asyncio.Queue[PendingMessage]:
+        loop = asyncio.get_running_loop()
+        lane = self._lanes.get(loop)
+        if lane is not None and not lane[1].done():
+            return lane[0]
+        queue: asyncio.Queue[PendingMessage] = asyncio.Queue()
+        self._lanes[loop] = (queue, loop.create_task(self._run(queue), name="message-writer"))
+        return queue
+
+    async def add(
+        self,
+        session_id: str,
+        role: str,
+        content: str,
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> int:
+        item = PendingMessage(session_id, role, content, metadata)
+        self._ensure_running().put_nowait(item)
+        # 调用方被取消不影响消息落库（已在队列中）
+        return await asyncio.shield(item.future)
+
+    async def _run(self, queue: asyncio.Queue[PendingMessage]) -> None:
+        batch: List[PendingMessage] = []
+        try:
+            while True:
+                batch = [await queue.get()]
+                while len(batch) < self.max_batch and not queue.empty():
+                    batch.append(queue.get_nowait())
+                try:
+                    await self._commit(batch)
+                finally:
+                    for _ in batch:
+                        queue.task_done()
+                batch = []
+        except BaseException as e:
+            # 停止时（关闭取消或异常退出）让本批与仍在排队的消息失败，而不是让调用方永远等待
+            exc = _WriterStopped("消息写入协程已停止") if isinstance(e, asyncio.CancelledError) else e
+            pending = list(batch)
+            while not queue.empty():
+                pending.append(queue.get_nowait())
+                queue.task_done()
+            _fail(pending, exc)
+            raise
+
+    async def _commit(self, batch: List[PendingMessage]) -> None:
+        try:
+            ids = await self._write_batch(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                if not batch[0].future.done():
+                    batch[0].future.set_exception(e)
+                return
+            logger.warning("批量写入 %d 条消息失败，改为逐条写入：%s", len(batch), e)
+            for item in batch:
+                await self._commit([item])
+            return
+        for item, message_id in zip(batch, ids):
+            if not item.future.done():
+                item.future.set_result(message_id)
+
+    async def close(self) -> None:
+        """等待当前事件循环已排队的消息写完后停止写入协程；其他循环的写入协程取消，其排队消息失败。"""
+        current = asyncio.get_running_loop()
+        lanes = list(self._lanes.items())
+        self._lanes.clear()
+        for loop, (queue, task) in lanes:
+            if loop is not current:
+                if not loop.is_closed():
+                    loop.call_soon_threadsafe(task.cancel)
+                continue
+            if not task.done():
+                await queue.join()
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
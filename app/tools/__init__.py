@@ -3,7 +3,9 @@
 
 核心工具：
 - PortScanTool: TCP 端口扫描
+- BatchPortScanTool: 多主机 / CIDR 批量端口扫描（进程池分片）
 - HttpGetTool: HTTP 探测
+- HttpBatchProbeTool: 批量 HTTP 探测（全局 / 单主机并发限流）
 
 技能管理通过 deepagents.middleware.skills.SkillsMiddleware 自动处理，
 不需要单独的技能工具。
@@ -15,6 +17,8 @@ from typing import List
 
 from langchain_core.tools import BaseTool
 
+from app.tools.batch_scan import BatchPortScanTool
+from app.tools.http_batch import HttpBatchProbeTool
 from app.tools.http_get import HttpGetTool
 from app.tools.port_scan import PortScanTool
 
@@ -23,12 +27,16 @@ def build_vuln_scan_tools() -> List[BaseTool]:
     """构建漏洞扫描 Agent 的核心工具列表。"""
     return [
         PortScanTool(),
+        BatchPortScanTool(),
         HttpGetTool(),
+        HttpBatchProbeTool(),
     ]
 
 
 __all__ = [
     "PortScanTool",
+    "BatchPortScanTool",
     "HttpGetTool",
+    "HttpBatchProbeTool",
     "build_vuln_scan_tools",
 ]
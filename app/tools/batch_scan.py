@@ -0,0 +1,366 @@
+"""
+批量 TCP 端口扫描工具：一次调用扫描 CIDR / 主机列表，结果汇总为紧凑文本。
+
+- 目标在主进程展开与解析（共享 DNS 缓存），按主机分片后交给进程池
+- 每个工作进程运行独立的 asyncio 事件循环，跑 scan_engine 的并发扫描
+- 工作进程只回传精简结果（开放端口 + 计数），避免大量 PortResult 跨进程序列化
+- 调用方被取消时（如客户端断开），通过 Manager 共享的取消事件通知工作进程中止正在扫描的分片
+"""
+
+from __future__ import annotations
+
+import asyncio
+import ipaddress
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from multiprocessing.managers import SyncManager
+from typing import Any, List, Optional, Sequence, Tuple, Union
+
+from langchain_core.tools import BaseTool
+
+from app.tools.progress import report_progress
+from app.tools.resolver import ResolvedAddress, get_resolver
+from app.tools.scan_engine import (
+    DEFAULT_CONCURRENCY,
+    DEFAULT_RETRIES,
+    DEFAULT_TIMEOUT,
+    MAX_CONCURRENCY,
+    PortState,
+    parse_ports,
+    scan_ports,
+)
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_HOSTS = 4096
+MAX_BATCH_PROBES = 1_048_576  # 主机数 × 端口数上限
+HOSTS_PER_WORKER_LOOP = 64  # 单进程内同时扫描的主机数
+CANCEL_POLL_INTERVAL = 0.5  # 工作进程检查取消事件的间隔（秒）
+
+# (host, family, address)
+_ShardTarget = Tuple[str, int, str]
+
+
+@dataclass
+class HostSummary:
+    host: str
+    address: str
+    open_ports: List[int]
+    closed: int
+    filtered: int
+    errors: int = 0  # 本机资源不足未能探测的端口数
+
+
+def expand_targets(targets: Union[str, Sequence[str]]) -> List[str]:
+    """展开 CIDR / 逗号或空白分隔的主机列表，去重并保持顺序；超出上限抛 ValueError。"""
+    if isinstance(targets, str):
+        tokens = targets.replace(",", " ").split()
+    else:
+        tokens = [t for item in targets for t in str(item).replace(",", " ").split()]
+
+    out: List[str] = []
+    seen: set[str] = set()
+
+    def _add(h: str) -> None:
+        if h not in seen:
+            seen.add(h)
+            out.append(h)
+        if len(out) > MAX_BATCH_HOSTS:
+            raise ValueError(f"目标主机数超过上限 {MAX_BATCH_HOSTS}")
+
+    for tok in tokens:
+        if "/" in tok:
+            try:
+                net = ipaddress.ip_network(tok, strict=False)
+            except ValueError:
+                raise ValueError(f"无法解析网段: {tok!r}") from None
+            if net.num_addresses > MAX_BATCH_HOSTS + 2:
+                raise ValueError(f"网段 {tok} 过大（上限 {MAX_BATCH_HOSTS} 台主机）")
+            for ip in net.hosts():
+                _add(str(ip))
+        else:
+            _add(tok)
+    return out
+
+
+async def _scan_shard_async(
+    targets: List[_ShardTarget],
+    ports: List[int],
+    concurrency: int,
+    timeout: float,
+    retries: int,
+) -> List[HostSummary]:
+    conn_sem = asyncio.Semaphore(max(1, min(concurrency, MAX_CONCURRENCY)))
+    host_sem = asyncio.Semaphore(HOSTS_PER_WORKER_LOOP)
+
+    async def _one(host: str, family: int, address: str) -> HostSummary:
+        async with host_sem:
+            report = await scan_ports(
+                host,
+                ports,
+                address=ResolvedAddress(family, address),
+                semaphore=conn_sem,
+                concurrency=concurrency,
+                timeout=timeout,
+                retries=retries,
+            )
+        return HostSummary(
+            host=host,
+            address=address,
+            open_ports=report.ports_in(PortState.OPEN),
+            closed=len(report.ports_in(PortState.CLOSED)),
+            filtered=len(report.ports_in(PortState.FILTERED)),
+            errors=len(report.ports_in(PortState.ERROR)),
+        )
+
+    return list(await asyncio.gather(*(_one(*t) for t in targets)))
+
+
+async def _scan_shard_cancellable(
+    targets: List[_ShardTarget],
+    ports: List[int],
+    concurrency: int,
+    timeout: float,
+    retries: int,
+    cancel_event: Any,
+) -> List[HostSummary]:
+    task = asyncio.ensure_future(_scan_shard_async(targets, ports, concurrency, timeout, retries))
+
+    async def _watch() -> None:
+        while not task.done():
+            if cancel_event.is_set():
+                task.cancel()
+                return
+            await asyncio.sleep(CANCEL_POLL_INTERVAL)
+
+    watcher = asyncio.create_task(_watch())
+    try:
+        return await task
+    finally:
+        watcher.cancel()
+
+
+def _scan_shard(
+    targets: List[_ShardTarget],
+    ports: List[int],
+    concurrency: int,
+    timeout: float,
+    retries: int,
+    cancel_event: Any = None,
+) -> List[HostSummary]:
+    """进程池入口：在工作进程内起独立事件循环扫描一个分片；cancel_event 被置位时中止。"""
+    if cancel_event is None:
+        return asyncio.run(_scan_shard_async(targets, ports, concurrency, timeout, retries))
+    return asyncio.run(_scan_shard_cancellable(targets, ports, concurrency, timeout, retries, cancel_event))
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _pool_size() -> int:
+    return max(1, os.cpu_count() or 1)
+
+
+def get_scan_pool() -> ProcessPoolExecutor:
+    """进程内共享的扫描进程池（spawn 方式启动，避免 fork 带走事件循环与线程状态）。"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=_pool_size(),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+_manager: Optional[SyncManager] = None
+_manager_lock = threading.Lock()
+
+
+def _new_cancel_event() -> Any:
+    """创建可跨进程传递的取消事件；Manager 不可用时返回 None（只能取消尚未开始的分片）。"""
+    global _manager
+    try:
+        with _manager_lock:
+            if _manager is None:
+                _manager = multiprocessing.get_context("spawn").Manager()
+        return _manager.Event()
+    except (OSError, EOFError) as e:
+        logger.warning("取消事件不可用，运行中的扫描分片无法中途取消：%s", e)
+        return None
+
+
+def shutdown_scan_pool() -> None:
+    """应用退出时关闭进程池。"""
+    global _pool, _manager
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+    if _manager is not None:
+        _manager.shutdown()
+        _manager = None
+
+
+async def scan_batch(
+    hosts: List[str],
+    ports: List[int],
+    *,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    timeout: float = DEFAULT_TIMEOUT,
+    retries: int = DEFAULT_RETRIES,
+) -> Tuple[List[HostSummary], List[str], int]:
+    """
+    解析并分片扫描多台主机，返回 (主机结果, 解析失败的主机, 使用的进程数)。
+    concurrency 为每个工作进程的并发连接上限；timeout / retries 含义同 scan_ports，RTT 按主机各自估算。
+    """
+    resolver = get_resolver()
+    resolved = await asyncio.gather(*(resolver.resolve(h) for h in hosts), return_exceptions=True)
+    targets: List[_ShardTarget] = []
+    failed: List[str] = []
+    for host, res in zip(hosts, resolved):
+        if isinstance(res, BaseException):
+            failed.append(host)
+        else:
+            targets.append((host, res[0].family, res[0].address))
+    if not targets:
+        return [], failed, 0
+
+    n_shards = min(_pool_size(), len(targets))
+    shards = [targets[i::n_shards] for i in range(n_shards)]
+    loop = asyncio.get_running_loop()
+    done_hosts = 0
+    cancel_event = None
+
+    async def _run_shard(shard: List[_ShardTarget]) -> List[HostSummary]:
+        nonlocal done_hosts
+        part = await loop.run_in_executor(
+            pool, _scan_shard, shard, ports, concurrency, timeout, retries, cancel_event
+        )
+        done_hosts += len(part)
+        found = [f"{s.host}: {s.open_ports}" for s in part if s.open_ports]
+        await report_progress(
+            "tcp_batch_scan",
+            f"已完成 {done_hosts}/{len(targets)} 台主机" + (f"，开放端口 {'; '.join(found)}" if found else ""),
+            done=done_hosts,
+            total=len(targets),
+        )
+        return part
+
+    try:
+        pool = get_scan_pool()
+        cancel_event = await asyncio.to_thread(_new_cancel_event)
+        outcomes = await asyncio.gather(*(_run_shard(shard) for shard in shards), return_exceptions=True)
+    except asyncio.CancelledError:
+        # 未开始的分片随 future 取消；已在工作进程中运行的分片靠取消事件中止
+        if cancel_event is not None:
+            cancel_event.set()
+        raise
+    except (BrokenProcessPool, OSError) as e:
+        outcomes = [e] * len(shards)
+
+    parts: List[List[HostSummary]] = []
+    unfinished: List[_ShardTarget] = []
+    for shard, outcome in zip(shards, outcomes):
+        if isinstance(outcome, (BrokenProcessPool, OSError)):
+            unfinished.extend(shard)
+        elif isinstance(outcome, BaseException):
+            raise outcome
+        else:
+            parts.append(outcome)
+    if unfinished:
+        # 进程池不可用（如受限容器）或中途崩溃：已完成的分片保留，只把未完成的主机放到当前事件循环内并发扫描
+        error = next(o for o in outcomes if isinstance(o, BaseException))
+        logger.warning("扫描进程池不可用，%d 台未完成的主机改为单进程扫描：%s", len(unfinished), error)
+        shutdown_scan_pool()
+        parts.append(await _scan_shard_async(unfinished, ports, concurrency, timeout, retries))
+        if not parts[:-1]:
+            n_shards = 1
+
+    order = {t[0]: i for i, t in enumerate(targets)}
+    summaries = sorted((s for part in parts for s in part), key=lambda s: order[s.host])
+    return summaries, failed, n_shards
+
+
+def format_batch_report(
+    summaries: List[HostSummary],
+    failed: List[str],
+    n_ports: int,
+    elapsed: float,
+    workers: int,
+) -> str:
+    """汇总为紧凑文本：只逐台列出有开放端口的主机，其余给计数。"""
+    with_open = [s for s in summaries if s.open_ports]
+    responsive = [s for s in summaries if not s.open_ports and s.closed]
+    lines = [
+        f"批量扫描: {len(summaries)} 台主机 × {n_ports} 端口，耗时 {elapsed:.2f}s（{workers} 进程）",
+        f"有开放端口: {len(with_open)} 台",
+    ]
+    for s in with_open:
+        target = s.host if s.host == s.address else f"{s.host} ({s.address})"
+        lines.append(f"  {target}: {s.open_ports}")
+    lines.append(f"有响应但无开放端口: {len(responsive)} 台")
+    lines.append(f"无响应（全部过滤/超时）: {len(summaries) - len(with_open) - len(responsive)} 台")
+    incomplete = [s for s in summaries if s.errors]
+    if incomplete:
+        lines.append(
+            f"本机资源不足未能完整探测: {len(incomplete)} 台（共 {sum(s.errors for s in incomplete)} 个端口，"
+            "如文件描述符耗尽，请降低 concurrency 后重扫）"
+        )
+    if failed:
+        shown = ", ".join(failed[:20])
+        more = f" 等 {len(failed)} 个" if len(failed) > 20 else ""
+        lines.append(f"解析失败: {shown}{more}")
+    return "\n".join(lines)
+
+
+class BatchPortScanTool(BaseTool):
+    """对多台主机 / 网段批量 TCP 端口扫描，仅用于授权安全测试。"""
+
+    name: str = "tcp_batch_scan"
+    description: str = (
+        "批量 TCP 端口扫描：一次调用扫描多台主机或整个网段，只用于授权安全测试。"
+        "输入参数为 targets（list[str] 或字符串，支持 CIDR 如 \"192.168.1.0/24\"、IP、域名，逗号分隔）"
+        "和 ports（list[int] 或字符串，如 \"22,80,443\"、\"1-1024\"、\"top100\"（常用端口表最多 top100）），"
+        "可选 concurrency:int（每进程并发连接数）、timeout:float（初始超时秒数，之后按实测 RTT 自适应）"
+        "与 retries:int（filtered 端口重试次数）。"
+        "需要扫描多台主机时优先使用本工具，而不是多次调用 tcp_port_scan。"
+    )
+
+    async def _arun(  # type: ignore[override]
+        self,
+        targets: Union[List[str], str],
+        ports: Union[List[int], str],
+        concurrency: int = DEFAULT_CONCURRENCY,
+        timeout: float = DEFAULT_TIMEOUT,
+        retries: int = DEFAULT_RETRIES,
+    ) -> str:
+        try:
+            hosts = expand_targets(targets)
+            port_list = parse_ports(ports)
+        except ValueError as e:
+            return f"参数错误: {e}"
+        if not hosts or not port_list:
+            return "目标或端口列表为空。"
+        if len(hosts) * len(port_list) > MAX_BATCH_PROBES:
+            return f"参数错误: 主机数 × 端口数超过上限 {MAX_BATCH_PROBES}，请缩小网段或端口范围。"
+
+        start = time.perf_counter()
+        summaries, failed, workers = await scan_batch(
+            hosts, port_list, concurrency=concurrency, timeout=timeout, retries=retries
+        )
+        return format_batch_report(summaries, failed, len(port_list), time.perf_counter() - start, workers)
+
+    def _run(  # type: ignore[override]
+        self,
+        targets: Union[List[str], str],
+        ports: Union[List[int], str],
+        concurrency: int = DEFAULT_CONCURRENCY,
+        timeout: float = DEFAULT_TIMEOUT,
+        retries: int = DEFAULT_RETRIES,
+    ) -> str:
+        return asyncio.run(self._arun(targets, ports, concurrency, timeout, retries))
@@ -0,0 +1,192 @@
+"""
+批量 HTTP 探测工具：一次调用并发探测多个 URL（或扫描得到的 host + 端口），返回紧凑表格。
+
+- 全局并发与单主机并发分别限流，复用共享连接池
+- 每个 URL 只读取少量 Body（用于提取 <title>），内存占用有界
+- 输出：状态码、标题、Server 头、重定向链
+"""
+
+from __future__ import annotations
+
+import asyncio
+import html
+import re
+from typing import Dict, List, Optional, Sequence, Union
+from urllib.parse import urlsplit
+
+import httpx
+from langchain_core.tools import BaseTool
+
+from app.tools.http_client import http_client
+from app.tools.http_get import ProbeResult, fetch_bounded
+from app.tools.progress import report_progress
+from app.tools.scan_engine import parse_ports
+
+MAX_BATCH_URLS = 256
+DEFAULT_BATCH_CONCURRENCY = 32
+DEFAULT_PER_HOST_CONCURRENCY = 4
+TITLE_BODY_BYTES = 16 * 1024
+DEFAULT_BATCH_TIMEOUT = 8.0
+
+HTTPS_PORTS = frozenset({443, 4443, 8443, 9443})
+
+_TITLE_RE = re.compile(rb"<title[^>]*>(.*?)</title\s*>", re.IGNORECASE | re.DOTALL)
+
+
+def build_urls(
+    urls: Optional[Union[str, Sequence[str]]] = None,
+    host: Optional[str] = None,
+    ports: Optional[Union[str, Sequence[int]]] = None,
+) -> List[str]:
+    """合并显式 URL 与 host + 端口生成的 URL（443/8443 等用 https，其余 http），去重保序。"""
+    out: List[str] = []
+    seen: set[str] = set()
+
+    def _add(u: str) -> None:
+        u = u.strip()
+        if not u:
+            return
+        if "://" not in u:
+            u = f"http://{u}"
+        if u not in seen:
+            seen.add(u)
+            out.append(u)
+
+    if isinstance(urls, str):
+        for u in urls.replace(",", " ").split():
+            _add(u)
+    elif urls:
+        for u in urls:
+            _add(str(u))
+
+    if host:
+        h = host.strip()
+        if ":" in h and not h.startswith("["):
+            h = f"[{h}]"  # IPv6 字面量
+        port_list = parse_ports(ports if ports is not None else "80,443")
+        # 每个端口生成一个不同的 URL：先按端口数检查上限，超大的端口范围不必逐个拼出 URL
+        if len(port_list) > MAX_BATCH_URLS:
+            raise ValueError(f"URL 数量超过上限 {MAX_BATCH_URLS}")
+        for port in port_list:
+            scheme = "https" if port in HTTPS_PORTS else "http"
+            default = 443 if scheme == "https" else 80
+            _add(f"{scheme}://{h}" if port == default else f"{scheme}://{h}:{port}")
+
+    if len(out) > MAX_BATCH_URLS:
+        raise ValueError(f"URL 数量超过上限 {MAX_BATCH_URLS}")
+    return out
+
+
+def extract_title(body: bytes, encoding: str) -> str:
+    m = _TITLE_RE.search(body)
+    if not m:
+        return ""
+    title = m.group(1).decode(encoding, errors="replace")
+    return " ".join(html.unescape(title).split())[:80]
+
+
+def _host_key(url: str) -> str:
+    parts = urlsplit(url)
+    return (parts.hostname or "").lower()
+
+
+async def probe_urls(
+    urls: List[str],
+    *,
+    concurrency: int = DEFAULT_BATCH_CONCURRENCY,
+    per_host: int = DEFAULT_PER_HOST_CONCURRENCY,
+    timeout: float = DEFAULT_BATCH_TIMEOUT,
+) -> List[Union[ProbeResult, Exception]]:
+    """并发探测，结果顺序与 urls 一致；单个 URL 失败以异常对象返回。"""
+    global_sem = asyncio.Semaphore(max(1, concurrency))
+    host_sems: Dict[str, asyncio.Semaphore] = {}
+
+    done = 0
+
+    async def _fetch(client: httpx.AsyncClient, url: str) -> Union[ProbeResult, Exception]:
+        key = _host_key(url)
+        host_sem = host_sems.setdefault(key, asyncio.Semaphore(max(1, per_host)))
+        async with host_sem, global_sem:
+            try:
+                return await fetch_bounded(client, url, timeout=timeout, max_bytes=TITLE_BODY_BYTES)
+            except Exception as e:
+                return e
+
+    async def _one(client: httpx.AsyncClient, url: str) -> Union[ProbeResult, Exception]:
+        nonlocal done
+        r = await _fetch(client, url)
+        done += 1
+        status = "ERR" if isinstance(r, Exception) else str(r.status_code)
+        await report_progress("http_batch_probe", f"[{done}/{len(urls)}] {url} -> {status}", done=done, total=len(urls))
+        return r
+
+    async with http_client() as client:
+        return list(await asyncio.gather(*(_one(client, u) for u in urls)))
+
+
+def _cell(value: str) -> str:
+    return (value or "-").replace("|", "/")
+
+
+def format_probe_table(urls: List[str], results: List[Union[ProbeResult, Exception]]) -> str:
+    lines = [
+        "| URL | 状态 | 标题 | Server | 重定向 |",
+        "|---|---|---|---|---|",
+    ]
+    ok = 0
+    for url, r in zip(urls, results):
+        if isinstance(r, Exception):
+            err = str(r).strip() or type(r).__name__
+            lines.append(f"| {_cell(url)} | ERR | {_cell(err[:60])} | - | - |")
+            continue
+        ok += 1
+        chain = " -> ".join([str(code) for code, _ in r.redirects] + [r.url]) if r.redirects else "-"
+        status = f"{r.status_code}（超时截断）" if r.timed_out else str(r.status_code)
+        lines.append(
+            f"| {_cell(url)} | {status} | {_cell(extract_title(r.body, r.encoding))} "
+            f"| {_cell(r.headers.get('server', ''))} | {_cell(chain)} |"
+        )
+    lines.insert(0, f"批量 HTTP 探测: {len(urls)} 个 URL，成功 {ok}，失败 {len(urls) - ok}")
+    return "\n".join(lines)
+
+
+class HttpBatchProbeTool(BaseTool):
+    """并发探测多个 Web 服务，返回状态 / 标题 / Server / 重定向链汇总表。"""
+
+    name: str = "http_batch_probe"
+    description: str = (
+        "批量 HTTP 探测：一次调用并发 GET 多个 URL，返回状态码、页面标题、Server 头、重定向链的汇总表，用于安全分析。"
+        "入参 urls（list[str] 或逗号分隔字符串），或 host:str + ports（list[int] 或 \"80,443,8080\"，"
+        "可直接使用 tcp_port_scan 得到的开放端口），两者可同时给出；"
+        "可选 concurrency:int（全局并发）、per_host:int（单主机并发）、timeout:float。"
+        "需要探测多个 Web 端口时优先使用本工具，而不是多次调用 http_get。"
+    )
+
+    async def _arun(  # type: ignore[override]
+        self,
+        urls: Optional[Union[List[str], str]] = None,
+        host: Optional[str] = None,
+        ports: Optional[Union[List[int], str]] = None,
+        concurrency: int = DEFAULT_BATCH_CONCURRENCY,
+        per_host: int = DEFAULT_PER_HOST_CONCURRENCY,
+        timeout: float = DEFAULT_BATCH_TIMEOUT,
+    ) -> str:
+        try:
+            url_list = build_urls(urls, host, ports)
+        except ValueError as e:
+            return f"参数错误: {e}"
+        if not url_list:
+            return "参数错误: 需要提供 urls，或 host + ports。"
+        results = await probe_urls(url_list, concurrency=concurrency, per_host=per_host, timeout=timeout)
+        return format_probe_table(url_list, results)
+
+    def _run(  # type: ignore[override]
+        self,
+        urls: Optional[Union[List[str], str]] = None,
+        host: Optional[str] = None,
+        ports: Optional[Union[List[int], str]] = None,
+        concurrency: int = DEFAULT_BATCH_CONCURRENCY,
+        per_host: int = DEFAULT_PER_HOST_CONCURRENCY,
+        timeout: float = DEFAULT_BATCH_TIMEOUT,
+    ) -> str:
+        return asyncio.run(self._arun(urls, host, ports, concurrency, per_host, timeout))
@@ -0,0 +1,258 @@
+"""
+HTTP 探测共用的长生命周期客户端连接池。
+
+- 异步客户端在 FastAPI lifespan / 工作进程启动时创建、退出时关闭（init_http_client / close_http_client），
+  同一轮对话内对同一站点的多次探测复用 keep-alive 连接与 TLS 会话
+- 工具经 http_client() 取客户端：共享客户端属于当前事件循环时直接使用，否则（同步 _run 经 asyncio.run
+  新建的循环、脚本直接调用）创建短期客户端并在用完后关闭，不替换共享客户端
+- 域名解析走 app.tools.resolver 的共享缓存（CachedDnsBackend，在建立连接时解析，连接池与 TLS 仍按域名区分）
+- 每个主机的并发请求数有上限，避免单个目标占满连接池；只为进行中的主机保留名额
+- HTTP/2 可选：设置 HTTP_CLIENT_HTTP2=true 且已安装 h2 时启用
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Optional
+
+import httpcore
+import httpx
+
+from app.tools.resolver import DnsCache, get_resolver, parse_ip_literal
+
+logger = logging.getLogger(__name__)
+
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_CLIENT_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.environ.get("HTTP_CLIENT_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_CLIENT_KEEPALIVE_EXPIRY", "30"))
+HTTP_PER_HOST_LIMIT = int(os.environ.get("HTTP_CLIENT_PER_HOST_LIMIT", "6"))
+
+
+def _http2_enabled() -> bool:
+    if os.environ.get("HTTP_CLIENT_HTTP2", "false").lower() != "true":
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("HTTP_CLIENT_HTTP2=true 但未安装 h2，回退为 HTTP/1.1")
+        return False
+    return True
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+class _HostSlots:
+    """
+    每个主机的并发名额：同一主机同时进行中的请求不超过 limit。
+    只为有请求在等待或进行中的主机保留信号量，最后一个请求结束即删除，表的大小与历史主机数无关。
+    """
+
+    def __init__(self, limit: int) -> None:
+        self._limit = limit
+        # key -> [信号量, 等待与持有名额的请求数]
+        self._slots: Dict[str, list] = {}
+
+    async def acquire(self, key: str) -> Callable[[], None]:
+        """取得名额，返回只能调用一次的释放函数。"""
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._slots[key] = [asyncio.Semaphore(self._limit), 0]
+        slot[1] += 1
+        try:
+            await slot[0].acquire()
+        except BaseException:
+            self._leave(key, slot)
+            raise
+
+        def release() -> None:
+            slot[0].release()
+            self._leave(key, slot)
+
+        return release
+
+    def _leave(self, key: str, slot: list) -> None:
+        slot[1] -= 1
+        if slot[1] == 0 and self._slots.get(key) is slot:
+            del self._slots[key]
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """响应体关闭时归还主机并发名额（只归还一次）。"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]) -> None:
+        self._stream = stream
+        self._release: Optional[Callable[[], None]] = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._release is not None:
+                self._release()
+                self._release = None
+
+
+class CachedDnsBackend(httpcore.AsyncNetworkBackend):
+    """
+    建立 TCP 连接时用共享缓存解析主机：请求 URL 不变，连接池与 TLS（SNI、证书校验）
+    仍按原域名区分，同一 IP 上的不同虚拟主机不会复用彼此的连接。
+    多地址目标按顺序尝试，连接失败才换下一个地址。
+    """
+
+    def __init__(self, resolver: Optional[DnsCache] = None) -> None:
+        self._resolver = resolver or get_resolver()
+        self._inner = httpcore.AnyIOBackend()
+
+    async def connect_tcp(
+        self,
+        host: str,
+        port: int,
+        timeout: Optional[float] = None,
+        local_address: Optional[str] = None,
+        socket_options: Optional[Iterable[Any]] = None,
+    ) -> httpcore.AsyncNetworkStream:
+        if parse_ip_literal(host) is not None:
+            return await self._inner.connect_tcp(host, port, timeout, local_address, socket_options)
+        try:
+            addresses = await self._resolver.resolve(host)
+        except OSError as e:
+            raise httpcore.ConnectError(f"无法解析主机 {host}: {e}") from e
+        last_error: Optional[httpcore.ConnectError] = None
+        for addr in addresses:
+            try:
+                return await self._inner.connect_tcp(addr.address, port, timeout, local_address, socket_options)
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                last_error = e
+        assert last_error is not None
+        raise last_error
+
+    async def connect_unix_socket(
+        self,
+        path: str,
+        timeout: Optional[float] = None,
+        socket_options: Optional[Iterable[Any]] = None,
+    ) -> httpcore.AsyncNetworkStream:
+        return await self._inner.connect_unix_socket(path, timeout, socket_options)
+
+    async def sleep(self, seconds: float) -> None:
+        await self._inner.sleep(seconds)
+
+
+class CachedDnsTransport(httpx.AsyncHTTPTransport):
+    """
+    域名解析走共享缓存（CachedDnsBackend）的 httpx 传输层。
+    per_host_limit > 0 时，同一主机同时进行中的请求（直到响应体关闭）不超过该值。
+    """
+
+    def __init__(
+        self,
+        resolver: Optional[DnsCache] = None,
+        per_host_limit: int = 0,
+        *,
+        limits: httpx.Limits = httpx.Limits(),
+        http2: bool = False,
+    ) -> None:
+        ssl_context = httpx.create_ssl_context()
+        super().__init__(verify=ssl_context, limits=limits, http2=http2)
+        # httpx 不开放 network_backend 参数：按相同配置重建连接池并换上缓存解析的网络后端
+        self._pool = httpcore.AsyncConnectionPool(
+            ssl_context=ssl_context,
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=limits.keepalive_expiry,
+            http1=True,
+            http2=http2,
+            network_backend=CachedDnsBackend(resolver),
+        )
+        self._host_slots = _HostSlots(per_host_limit) if per_host_limit > 0 else None
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self._host_slots is None:
+            return await super().handle_async_request(request)
+
+        key = f"{request.url.scheme}://{request.url.host}:{request.url.port or ''}"
+        release = await self._host_slots.acquire(key)
+        try:
+            resp = await super().handle_async_request(request)
+        except BaseException:
+            release()
+            raise
+        return httpx.Response(
+            status_code=resp.status_code,
+            headers=resp.headers,
+            stream=_ReleasingStream(resp.stream, release),  # type: ignore[arg-type]
+            extensions=resp.extensions,
+        )
+
+
+_client: Optional[httpx.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _build_async_client() -> httpx.AsyncClient:
+    transport = CachedDnsTransport(
+        per_host_limit=HTTP_PER_HOST_LIMIT,
+        limits=_limits(),
+        http2=_http2_enabled(),
+    )
+    return httpx.AsyncClient(
+        transport=transport,
+        follow_redirects=True,
+    )
+
+
+@asynccontextmanager
+async def http_client() -> AsyncIterator[httpx.AsyncClient]:
+    """
+    当前事件循环可用的客户端（须在事件循环内使用）：
+    共享客户端已初始化且属于当前循环时直接使用；否则创建只用于本次调用的客户端，退出时关闭其连接池。
+    """
+    loop = asyncio.get_running_loop()
+    if _client is not None and not _client.is_closed and _client_loop is loop:
+        yield _client
+        return
+    async with _build_async_client() as client:
+        yield client
+
+
+async def init_http_client() -> httpx.AsyncClient:
+    """应用启动时调用，创建与当前事件循环绑定的共享客户端。"""
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is not None and not _client.is_closed:
+        if _client_loop is loop:
+            return _client
+        # 上一个循环退出前未调用 close_http_client：其连接无法在本循环中复用，尽力关闭后重建
+        logger.warning("共享 HTTP 客户端属于已结束的事件循环，重新创建")
+        try:
+            await _client.aclose()
+        except Exception:
+            pass
+    _client = _build_async_client()
+    _client_loop = loop
+    return _client
+
+
+async def close_http_client() -> None:
+    """应用退出时关闭连接池。"""
+    global _client, _client_loop
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+        _client_loop = None
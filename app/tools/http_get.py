@@ -1,16 +1,22 @@
 """
 HTTP GET 探测工具：对目标 URL 发起请求，返回状态码、响应头与片段，用于安全分析。
 网络异常时返回友好错误信息，避免未捕获异常导致 500。
+请求走 app.tools.http_client 的共享连接池（keep-alive 复用，域名解析与端口扫描共用缓存）。
+响应体流式读取，达到字节预算即停止，单次探测的内存占用与目标行为无关；
+整个请求（含重定向）受总时限约束，逐字节慢速发送的服务器也不能让工具无限占用。
 """
 
 from __future__ import annotations
 
 import asyncio
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
 
 import httpx
 from langchain_core.tools import BaseTool
 
+from app.tools.http_client import http_client
+
 
 def _format_http_error(url: str, e: Exception) -> str:
     """将网络/HTTP 异常格式化为工具返回的字符串。"""
@@ -18,35 +24,147 @@ def _format_http_error(url: str, e: Exception) -> str:
     return f"请求失败 [{url}]: {msg}\n（目标可能不可达、超时、或主动断开连接，请换目标或稍后重试。）"
 
 
+DEFAULT_MAX_BODY_BYTES = 4096
+MAX_BODY_BYTES_LIMIT = 1024 * 1024
+MAX_REDIRECTS = 10
+
+
+@dataclass
+class ProbeResult:
+    """一次有界 GET 探测的结果。"""
+    url: str  # 最终 URL（跟随重定向后）
+    status_code: int
+    headers: httpx.Headers
+    body: bytes
+    encoding: str
+    content_length: Optional[int]  # 响应头声明的长度，未声明为 None
+    truncated: bool
+    redirects: List[Tuple[int, str]] = field(default_factory=list)  # [(状态码, URL)]
+    timed_out: bool = False  # 读取 body 时到达总时限，body 为已收到的部分
+
+    @property
+    def text(self) -> str:
+        return self.body.decode(self.encoding, errors="replace")
+
+
+def _clamp_budget(max_bytes: int) -> int:
+    return max(0, min(int(max_bytes), MAX_BODY_BYTES_LIMIT))
+
+
+def _declared_length(resp: httpx.Response) -> Optional[int]:
+    try:
+        return int(resp.headers["content-length"])
+    except (KeyError, ValueError):
+        return None
+
+
+def _encoding_of(resp: httpx.Response) -> str:
+    # 流式读取时不能让 httpx 基于完整 body 猜编码，只看 charset，缺省 utf-8
+    return resp.charset_encoding or "utf-8"
+
+
+async def fetch_bounded(
+    client: httpx.AsyncClient,
+    url: str,
+    *,
+    timeout: float = 10.0,
+    max_bytes: int = DEFAULT_MAX_BODY_BYTES,
+    max_redirects: int = MAX_REDIRECTS,
+    deadline: Optional[float] = None,
+) -> ProbeResult:
+    """
+    流式 GET：手动跟随重定向（中间响应不读 body），最终响应最多读取 max_bytes 字节后关闭连接。
+    timeout 是 httpx 的单次操作超时；deadline（缺省同 timeout）是含重定向的总时限：
+    读取 body 时到达则返回已收到的部分（truncated、timed_out），尚未收到最终响应头则抛 TimeoutError。
+    """
+    budget = _clamp_budget(max_bytes)
+    total = timeout if deadline is None else deadline
+    request = client.build_request("GET", url, timeout=timeout)
+    redirects: List[Tuple[int, str]] = []
+    final: Optional[httpx.Response] = None
+    body = bytearray()
+    truncated = timed_out = False
+    try:
+        async with asyncio.timeout(total):
+            while True:
+                resp = await client.send(request, stream=True, follow_redirects=False)
+                try:
+                    if resp.next_request is not None and len(redirects) < max_redirects:
+                        redirects.append((resp.status_code, str(resp.url)))
+                        request = resp.next_request
+                        continue
+                    final = resp
+                    async for chunk in resp.aiter_bytes():
+                        room = budget - len(body)
+                        if len(chunk) > room:
+                            body += chunk[:room]
+                            truncated = True
+                            break
+                        body += chunk
+                    break
+                finally:
+                    await resp.aclose()
+    except TimeoutError:
+        if final is None:
+            raise TimeoutError(f"超过总时限 {total:g}s（含 {len(redirects)} 次重定向），未收到响应") from None
+        truncated = timed_out = True
+    return ProbeResult(
+        url=str(final.url),
+        status_code=final.status_code,
+        headers=final.headers,
+        body=bytes(body),
+        encoding=_encoding_of(final),
+        content_length=_declared_length(final),
+        truncated=truncated,
+        redirects=redirects,
+        timed_out=timed_out,
+    )
+
+
+def _format_response(url: str, result: ProbeResult) -> str:
+    lines = [f"URL: {url}"]
+    if result.redirects:
+        chain = " -> ".join(f"{code} {u}" for code, u in result.redirects)
+        lines.append(f"Redirects: {chain} -> {result.status_code} {result.url}")
+    declared = f"{result.content_length} 字节" if result.content_length is not None else "未声明"
+    state = "到达总时限，已截断" if result.timed_out else ("已截断" if result.truncated else "完整")
+    lines += [
+        f"Status: {result.status_code}",
+        f"Headers: {dict(result.headers)}",
+        f"Content-Length: {declared}",
+        f"Body snippet（读取 {len(result.body)} 字节，{state}）:\n{result.text}",
+    ]
+    return "\n".join(lines)
+
+
 class HttpGetTool(BaseTool):
     """对目标 URL 发起 HTTP GET 请求，返回状态码、响应头和部分 Body。"""
 
     name: str = "http_get"
     description: str = (
         "对目标 URL 发起 HTTP GET 请求，返回状态码、响应头和部分 Body，用于安全分析。"
-        "入参为 url:str，可选 timeout:float。"
+        "入参为 url:str，可选 timeout:float（含重定向的总时限，秒）、max_bytes:int（最多读取的 Body 字节数，默认 4096）。"
     )
 
-    async def _arun(self, url: str, timeout: float = 10.0) -> str:  # type: ignore[override]
+    async def _arun(  # type: ignore[override]
+        self,
+        url: str,
+        timeout: float = 10.0,
+        max_bytes: int = DEFAULT_MAX_BODY_BYTES,
+    ) -> str:
         try:
-            async with httpx.AsyncClient(follow_redirects=True) as client:
-                resp = await client.get(url, timeout=timeout)
-                body_snippet = resp.text[:2000]
-                return (
-                    f"URL: {url}\n"
-                    f"Status: {resp.status_code}\n"
-                    f"Headers: {dict(resp.headers)}\n"
-                    f"Body snippet (前 2000 字符):\n{body_snippet}"
-                )
+            async with http_client() as client:
+                result = await fetch_bounded(client, url, timeout=timeout, max_bytes=max_bytes)
+            return _format_response(url, result)
         except (httpx.HTTPError, OSError, asyncio.TimeoutError) as e:
             return _format_http_error(url, e)
         except Exception as e:
             return _format_http_error(url, e)
 
-    def _run(self, url: str, timeout: float = 10.0) -> str:  # type: ignore[override]
-        try:
-            return asyncio.run(self._arun(url, timeout))
-        except (httpx.HTTPError, OSError, asyncio.TimeoutError) as e:
-            return _format_http_error(url, e)
-        except Exception as e:
-            return _format_http_error(url, e)
+    def _run(  # type: ignore[override]
+        self,
+        url: str,
+        timeout: float = 10.0,
+        max_bytes: int = DEFAULT_MAX_BODY_BYTES,
+    ) -> str:
+        return asyncio.run(self._arun(url, timeout, max_bytes))
@@ -1,15 +1,26 @@
 """
 TCP 端口扫描工具：对目标主机进行基础端口探测，用于漏洞排查。
+扫描由 app.tools.scan_engine 的异步引擎完成，不占用线程池；
+目标经 app.tools.resolver 的共享缓存解析一次，支持 IPv6 与多地址目标。
 """
 
 from __future__ import annotations
 
 import asyncio
-import socket
-from typing import List
+from typing import List, Union
 
 from langchain_core.tools import BaseTool
 
+from app.tools.resolver import get_resolver
+from app.tools.scan_engine import (
+    DEFAULT_CONCURRENCY,
+    DEFAULT_RETRIES,
+    DEFAULT_TIMEOUT,
+    format_scan_report,
+    parse_ports,
+    scan_ports,
+)
+
 
 class PortScanTool(BaseTool):
     """对目标主机进行基础 TCP 端口扫描，仅用于授权安全测试。"""
@@ -17,22 +28,54 @@ class PortScanTool(BaseTool):
     name: str = "tcp_port_scan"
     description: str = (
         "对目标主机进行基础 TCP 端口扫描，用于漏洞排查。"
-        "输入参数为 target_host:str 和 ports:list[int]，只用于安全测试。"
+        "输入参数为 target_host:str 和 ports（list[int] 或字符串，如 \"22,80,443\"、\"1-1024\"、\"top100\"（常用端口表最多 top100）），"
+        "可选 concurrency:int（并发连接数）、timeout:float（初始超时秒数，之后按实测 RTT 自适应）、"
+        "retries:int（filtered 端口重试次数）、"
+        "all_addresses:bool（域名解析出多个地址时是否逐个扫描，默认只扫首个地址）。"
+        "返回开放端口、关闭/过滤端口统计与 RTT 计时，只用于安全测试。"
     )
 
-    def _run(self, target_host: str, ports: List[int]) -> str:  # type: ignore[override]
-        open_ports: List[int] = []
-        for port in ports:
-            try:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                    s.settimeout(0.5)
-                    s.connect((target_host, port))
-                    open_ports.append(port)
-            except OSError:
-                continue
-        if open_ports:
-            return f"开放端口: {sorted(open_ports)}"
-        return "未发现开放端口（在当前端口列表内）。"
-
-    async def _arun(self, target_host: str, ports: List[int]) -> str:  # type: ignore[override]
-        return await asyncio.to_thread(self._run, target_host, ports)
+    async def _arun(  # type: ignore[override]
+        self,
+        target_host: str,
+        ports: Union[List[int], str],
+        concurrency: int = DEFAULT_CONCURRENCY,
+        timeout: float = DEFAULT_TIMEOUT,
+        retries: int = DEFAULT_RETRIES,
+        all_addresses: bool = False,
+    ) -> str:
+        try:
+            port_list = parse_ports(ports)
+        except ValueError as e:
+            return f"端口参数错误: {e}"
+        if not port_list:
+            return "端口列表为空。"
+        try:
+            addresses = await get_resolver().resolve(target_host)
+        except OSError as e:
+            return f"扫描失败 [{target_host}]: 无法解析主机（{e}）"
+        if not all_addresses:
+            addresses = addresses[:1]
+        reports = await asyncio.gather(*(
+            scan_ports(
+                target_host,
+                port_list,
+                concurrency=concurrency,
+                timeout=timeout,
+                retries=retries,
+                address=addr,
+            )
+            for addr in addresses
+        ))
+        return "\n\n".join(format_scan_report(r) for r in reports)
+
+    def _run(  # type: ignore[override]
+        self,
+        target_host: str,
+        ports: Union[List[int], str],
+        concurrency: int = DEFAULT_CONCURRENCY,
+        timeout: float = DEFAULT_TIMEOUT,
+        retries: int = DEFAULT_RETRIES,
+        all_addresses: bool = False,
+    ) -> str:
+        return asyncio.run(self._arun(target_host, ports, concurrency, timeout, retries, all_addresses))
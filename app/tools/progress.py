@@ -0,0 +1,21 @@
+"""
+工具执行进度上报：长耗时工具在执行中通过 LangChain 自定义事件发出阶段性结果，
+流式对话（run_stream）将其转发给前端；不在 agent 运行上下文中调用时静默忽略。
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+from langchain_core.callbacks.manager import adispatch_custom_event
+
+TOOL_PROGRESS_EVENT = "tool_progress"
+
+
+async def report_progress(tool: str, message: str, **data: Any) -> None:
+    """上报一条进度（message 为可直接展示的文本，data 为附加的结构化字段）。"""
+    try:
+        await adispatch_custom_event(TOOL_PROGRESS_EVENT, {"tool": tool, "message": message, **data})
+    except RuntimeError:
+        # 脚本中直接调用工具（无父 run）时没有事件可发
+        pass
@@ -0,0 +1,159 @@
+"""
+共享的异步 DNS 解析缓存：端口扫描与 HTTP 探测共用，同一主机在 TTL 内只解析一次。
+
+- 支持 IPv4 / IPv6，多地址目标按 getaddrinfo 的顺序返回全部地址
+- 并发解析同一主机时合并为一次查询（in-flight 去重）
+- 解析失败做短时负缓存，避免对不存在的域名反复查询
+- getaddrinfo 在独立的小线程池中执行，不占用事件循环的默认线程池
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import ipaddress
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, Union
+
+DNS_CACHE_TTL = 300.0
+DNS_NEGATIVE_TTL = 30.0
+DNS_CACHE_MAX_ENTRIES = 1024
+DNS_RESOLVER_THREADS = int(os.environ.get("DNS_RESOLVER_THREADS", "8"))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _resolver_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=DNS_RESOLVER_THREADS,
+                    thread_name_prefix="dns",
+                )
+    return _executor
+
+
+@dataclass(frozen=True)
+class ResolvedAddress:
+    family: int
+    address: str
+
+    @property
+    def is_ipv6(self) -> bool:
+        return self.family == socket.AF_INET6
+
+
+def _strip_brackets(host: str) -> str:
+    host = host.strip()
+    if host.startswith("[") and host.endswith("]"):
+        return host[1:-1]
+    return host
+
+
+def parse_ip_literal(host: str) -> Optional[ResolvedAddress]:
+    """host 为 IP 字面量时直接返回地址，否则返回 None。"""
+    try:
+        ip = ipaddress.ip_address(_strip_brackets(host))
+    except ValueError:
+        return None
+    family = socket.AF_INET6 if ip.version == 6 else socket.AF_INET
+    return ResolvedAddress(family, str(ip))
+
+
+class DnsCache:
+    """带 TTL 的异步解析缓存（LRU 淘汰）。"""
+
+    def __init__(
+        self,
+        ttl: float = DNS_CACHE_TTL,
+        negative_ttl: float = DNS_NEGATIVE_TTL,
+        max_entries: int = DNS_CACHE_MAX_ENTRIES,
+    ) -> None:
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        # host -> (过期时间, 地址列表或解析异常)
+        self._entries: "OrderedDict[str, Tuple[float, Union[List[ResolvedAddress], OSError]]]" = OrderedDict()
+        self._inflight: Dict[str, "asyncio.Future[List[ResolvedAddress]]"] = {}
+
+    async def resolve(self, host: str) -> List[ResolvedAddress]:
+        """解析主机为地址列表；失败抛出 OSError（socket.gaierror）。"""
+        literal = parse_ip_literal(host)
+        if literal is not None:
+            return [literal]
+
+        key = host.strip().lower().rstrip(".")
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires, value = entry
+            if expires > now:
+                self._entries.move_to_end(key)
+                if isinstance(value, OSError):
+                    raise value
+                return list(value)
+            del self._entries[key]
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._lookup_and_store(key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _t, k=key: self._inflight.pop(k, None))
+        # shield：单个调用方被取消时不影响其他等待同一解析结果的协程
+        return list(await asyncio.shield(task))
+
+    async def _lookup_and_store(self, key: str) -> List[ResolvedAddress]:
+        try:
+            addrs = await self._lookup(key)
+        except OSError as e:
+            self._store(key, e, self.negative_ttl)
+            raise
+        self._store(key, addrs, self.ttl)
+        return addrs
+
+    async def _lookup(self, host: str) -> List[ResolvedAddress]:
+        loop = asyncio.get_running_loop()
+        infos = await loop.run_in_executor(
+            _resolver_executor(),
+            functools.partial(socket.getaddrinfo, host, None, type=socket.SOCK_STREAM),
+        )
+        out: List[ResolvedAddress] = []
+        seen: set[str] = set()
+        for family, _, _, _, sockaddr in infos:
+            addr = str(sockaddr[0])
+            if addr in seen:
+                continue
+            seen.add(addr)
+            out.append(ResolvedAddress(family, addr))
+        if not out:
+            raise socket.gaierror(socket.EAI_NONAME, f"无法解析主机: {host}")
+        return out
+
+    def _store(self, key: str, value: Union[List[ResolvedAddress], OSError], ttl: float) -> None:
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+_resolver: Optional[DnsCache] = None
+
+
+def get_resolver() -> DnsCache:
+    """进程内共享的解析缓存。"""
+    global _resolver
+    if _resolver is None:
+        _resolver = DnsCache()
+    return _resolver
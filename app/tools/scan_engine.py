@@ -0,0 +1,344 @@
+"""
+异步 TCP 扫描引擎：基于非阻塞 connect + asyncio，并发探测端口状态。
+
+- 端口规格解析：支持 [22, 80]、"22,80,8000-8100"、"top100"（最多 top100）等写法
+- 端口状态：open（握手成功）/ closed（RST 拒绝）/ filtered（超时或不可达）/
+  error（本机资源不足未能探测，如文件描述符耗尽；降低并发重试后仍失败时如实报告）
+- 并发由 Semaphore 控制，不占用默认线程池
+- 超时自适应：按已响应端口的 RTT 估算每台主机的超时，filtered 端口有限次重试
+"""
+
+from __future__ import annotations
+
+import asyncio
+import errno
+import socket
+import time
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Iterable, List, Optional, Sequence, Union
+
+from app.tools.resolver import ResolvedAddress, get_resolver
+
+DEFAULT_CONCURRENCY = 256
+DEFAULT_TIMEOUT = 1.0  # 尚无 RTT 样本时的初始超时
+DEFAULT_RETRIES = 1
+MIN_TIMEOUT = 0.1
+MAX_TIMEOUT = 3.0
+MAX_CONCURRENCY = 2000
+# 本机资源不足（文件描述符 / 缓冲区 / 临时端口耗尽）的端口：每轮并发减半后重试（直到单个协程）的间隔
+LOCAL_ERROR_BACKOFF = 0.2
+_LOCAL_RESOURCE_ERRNOS = frozenset({errno.EMFILE, errno.ENFILE, errno.ENOBUFS, errno.ENOMEM, errno.EADDRNOTAVAIL})
+
+# nmap 统计的最常见 100 个 TCP 端口
+TOP_100_PORTS: tuple[int, ...] = (
+    7, 9, 13, 21, 22, 23, 25, 26, 37, 53, 79, 80, 81, 88, 106, 110, 111, 113, 119, 135,
+    139, 143, 144, 179, 199, 389, 427, 443, 444, 445, 465, 513, 514, 515, 543, 544, 548, 554,
+    587, 631, 646, 873, 990, 993, 995, 1025, 1026, 1027, 1028, 1029, 1110, 1433, 1720, 1723,
+    1755, 1900, 2000, 2001, 2049, 2121, 2717, 3000, 3128, 3306, 3389, 3986, 4899, 5000, 5009,
+    5051, 5060, 5101, 5190, 5357, 5432, 5631, 5666, 5800, 5900, 6000, 6001, 6646, 7070, 8000,
+    8008, 8009, 8080, 8081, 8443, 8888, 9100, 9999, 10000, 32768, 49152, 49153, 49154, 49155,
+    49156, 49157,
+)
+
+PortSpec = Union[str, int, Iterable[Union[int, str]]]
+
+
+class PortState(str, Enum):
+    OPEN = "open"
+    CLOSED = "closed"
+    FILTERED = "filtered"
+    ERROR = "error"  # 本机资源不足，未能探测
+
+
+@dataclass
+class PortResult:
+    port: int
+    state: PortState
+    rtt: Optional[float] = None  # 秒，仅 open/closed 有值
+
+
+@dataclass
+class ScanStats:
+    """单主机扫描的计时统计。"""
+    probes: int = 0
+    retried: int = 0
+    recovered: int = 0  # 重试后确认为 open/closed 的端口数
+    local_errors: int = 0  # 因本机资源不足失败的探测次数
+    rtt_samples: int = 0
+    rtt_min: Optional[float] = None
+    rtt_avg: Optional[float] = None
+    rtt_max: Optional[float] = None
+    final_timeout: float = DEFAULT_TIMEOUT
+
+
+@dataclass
+class ScanReport:
+    """单主机扫描结果。"""
+    host: str
+    address: str
+    results: List[PortResult] = field(default_factory=list)
+    elapsed: float = 0.0
+    stats: ScanStats = field(default_factory=ScanStats)
+
+    def ports_in(self, state: PortState) -> List[int]:
+        return sorted(r.port for r in self.results if r.state is state)
+
+
+class _PortSpecError(ValueError):
+    """端口规格可以解析但取值不被支持（原样报告给调用方）。"""
+
+
+def _parse_port_token(token: str) -> List[int]:
+    token = token.strip().lower()
+    if not token:
+        return []
+    if token.startswith("top"):
+        n = int(token[3:] or len(TOP_100_PORTS))
+        if not 1 <= n <= len(TOP_100_PORTS):
+            raise _PortSpecError(
+                f"{token!r} 超出内置常用端口表（最多 top{len(TOP_100_PORTS)}），更多端口请写范围，如 \"1-1024\""
+            )
+        return list(TOP_100_PORTS[:n])
+    if "-" in token:
+        lo_s, hi_s = token.split("-", 1)
+        lo = int(lo_s) if lo_s.strip() else 1
+        hi = int(hi_s) if hi_s.strip() else 65535
+        if lo > hi:
+            lo, hi = hi, lo
+        return list(range(lo, hi + 1))
+    return [int(token)]
+
+
+def parse_ports(spec: PortSpec) -> List[int]:
+    """将端口规格解析为去重、升序的端口列表，非法端口抛 ValueError。"""
+    if isinstance(spec, bool):
+        raise ValueError(f"无法解析端口规格: {spec!r}")
+    if isinstance(spec, int):
+        tokens: List[Union[int, str]] = [spec]
+    elif isinstance(spec, str):
+        tokens = list(spec.split(","))
+    else:
+        tokens = list(spec)
+
+    ports: set[int] = set()
+    for tok in tokens:
+        # bool 是 int 的子类，True / False 不能当作端口 1 / 0
+        if isinstance(tok, bool):
+            raise ValueError(f"无法解析端口规格: {tok!r}")
+        if isinstance(tok, int):
+            ports.add(tok)
+            continue
+        try:
+            ports.update(_parse_port_token(str(tok)))
+        except _PortSpecError:
+            raise
+        except ValueError:
+            raise ValueError(f"无法解析端口规格: {tok!r}") from None
+
+    bad = [p for p in ports if not 1 <= p <= 65535]
+    if bad:
+        raise ValueError(f"端口超出范围 1-65535: {sorted(bad)[:5]}")
+    return sorted(ports)
+
+
+class RttEstimator:
+    """
+    按 TCP RTO 算法（RFC 6298）估算单台主机的探测超时：
+    timeout = srtt + 4 * rttvar，限制在 [min_timeout, max_timeout]；
+    尚无样本时使用 initial_timeout。open 与 closed（RST）都算作一次 RTT 样本。
+    """
+
+    def __init__(
+        self,
+        initial_timeout: float = DEFAULT_TIMEOUT,
+        min_timeout: float = MIN_TIMEOUT,
+        max_timeout: float = MAX_TIMEOUT,
+    ) -> None:
+        self.initial_timeout = initial_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max(max_timeout, min_timeout)
+        self.srtt: Optional[float] = None
+        self.rttvar = 0.0
+        self.samples = 0
+        self.rtt_min: Optional[float] = None
+        self.rtt_max: Optional[float] = None
+        self._rtt_sum = 0.0
+
+    def observe(self, rtt: float) -> None:
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.samples += 1
+        self._rtt_sum += rtt
+        self.rtt_min = rtt if self.rtt_min is None else min(self.rtt_min, rtt)
+        self.rtt_max = rtt if self.rtt_max is None else max(self.rtt_max, rtt)
+
+    @property
+    def timeout(self) -> float:
+        if self.srtt is None:
+            return min(self.initial_timeout, self.max_timeout)
+        return min(max(self.srtt + 4 * self.rttvar, self.min_timeout), self.max_timeout)
+
+    def retry_timeout(self, attempt: int) -> float:
+        """第 attempt 次重试（从 1 开始）的超时：指数退避，不超过 max_timeout。"""
+        return min(self.timeout * (2 ** attempt), self.max_timeout)
+
+    @property
+    def rtt_avg(self) -> Optional[float]:
+        return self._rtt_sum / self.samples if self.samples else None
+
+
+def _new_socket(family: int) -> socket.socket:
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    return sock
+
+
+async def probe_port(family: int, address: str, port: int, timeout: float) -> PortResult:
+    """对单个端口发起一次非阻塞 connect；本机资源不足（含创建 socket 失败）时返回 error 而不是 filtered。"""
+    loop = asyncio.get_running_loop()
+    sock: Optional[socket.socket] = None
+    start = time.perf_counter()
+    try:
+        sock = _new_socket(family)
+        start = time.perf_counter()
+        await asyncio.wait_for(loop.sock_connect(sock, (address, port)), timeout)
+        return PortResult(port, PortState.OPEN, time.perf_counter() - start)
+    except ConnectionRefusedError:
+        return PortResult(port, PortState.CLOSED, time.perf_counter() - start)
+    except asyncio.TimeoutError:
+        return PortResult(port, PortState.FILTERED)
+    except OSError as e:
+        if e.errno in _LOCAL_RESOURCE_ERRNOS:
+            return PortResult(port, PortState.ERROR)
+        return PortResult(port, PortState.FILTERED)
+    finally:
+        if sock is not None:
+            sock.close()
+
+
+async def scan_ports(
+    host: str,
+    ports: Sequence[int],
+    *,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    timeout: float = DEFAULT_TIMEOUT,
+    retries: int = DEFAULT_RETRIES,
+    max_timeout: float = MAX_TIMEOUT,
+    address: Optional[ResolvedAddress] = None,
+    semaphore: Optional[asyncio.Semaphore] = None,
+) -> ScanReport:
+    """
+    并发扫描单个主机的端口列表。
+    address 为空时经共享解析缓存解析一次 host，取首个地址；全程不再逐端口解析。
+    semaphore 用于多主机共享同一并发上限；concurrency 同时决定本主机的探测协程数。
+    timeout 为尚无 RTT 样本时的初始超时，之后按 RttEstimator 自适应；
+    本机资源不足（error）的端口每轮把本主机的探测协程数减半后重试，减到 1 仍失败则如实报告；
+    首轮为 filtered 的端口最多重试 retries 次，超时按指数退避放宽。
+    """
+    if address is None:
+        address = (await get_resolver().resolve(host))[0]
+    family = address.family
+    sem = semaphore or asyncio.Semaphore(max(1, min(concurrency, MAX_CONCURRENCY)))
+    # 首轮超时与重试退避都以它为基数，过小（如 0）会把所有端口判为 filtered
+    rtt = RttEstimator(initial_timeout=max(MIN_TIMEOUT, timeout), max_timeout=max_timeout)
+    stats = ScanStats()
+
+    async def _one(port: int, attempt: int) -> PortResult:
+        async with sem:
+            # 在拿到并发名额时再取超时，后发的探测即可用上先到的 RTT 样本
+            t = rtt.timeout if attempt == 0 else rtt.retry_timeout(attempt)
+            stats.probes += 1
+            result = await probe_port(family, address.address, port, t)
+        if result.state is PortState.ERROR:
+            stats.local_errors += 1
+        if result.rtt is not None:
+            rtt.observe(result.rtt)
+        return result
+
+    async def _round(port_list: Sequence[int], attempt: int, workers: int) -> List[PortResult]:
+        # 固定数量的协程共享一个端口迭代器，而不是每个端口一个任务：
+        # 内存与取消开销只与并发数相关，大端口范围被取消时也能立即停下
+        it = iter(port_list)
+        out: List[PortResult] = []
+
+        async def _worker() -> None:
+            for p in it:
+                out.append(await _one(p, attempt))
+
+        await asyncio.gather(*(_worker() for _ in range(max(1, min(len(port_list), workers)))))
+        return out
+
+    start = time.perf_counter()
+    workers = max(1, min(concurrency, MAX_CONCURRENCY))
+    results = {r.port: r for r in await _round(ports, 0, workers)}
+    while workers > 1:
+        failed = [p for p, r in results.items() if r.state is PortState.ERROR]
+        if not failed:
+            break
+        workers //= 2
+        await asyncio.sleep(LOCAL_ERROR_BACKOFF)
+        for r in await _round(failed, 0, workers):
+            results[r.port] = r
+    for attempt in range(1, max(0, retries) + 1):
+        pending = [p for p, r in results.items() if r.state is PortState.FILTERED]
+        if not pending:
+            break
+        stats.retried += len(pending)
+        for r in await _round(pending, attempt, workers):
+            if r.state is not PortState.FILTERED:
+                stats.recovered += 1
+            results[r.port] = r
+
+    stats.rtt_samples = rtt.samples
+    stats.rtt_min, stats.rtt_avg, stats.rtt_max = rtt.rtt_min, rtt.rtt_avg, rtt.rtt_max
+    stats.final_timeout = rtt.timeout
+    return ScanReport(
+        host=host,
+        address=address.address,
+        results=[results[p] for p in ports],
+        elapsed=time.perf_counter() - start,
+        stats=stats,
+    )
+
+
+def _format_stats(stats: ScanStats) -> str:
+    if stats.rtt_samples:
+        rtt = (
+            f"RTT min/avg/max {stats.rtt_min * 1000:.1f}/{stats.rtt_avg * 1000:.1f}/"
+            f"{stats.rtt_max * 1000:.1f} ms（{stats.rtt_samples} 样本）"
+        )
+    else:
+        rtt = "无 RTT 样本"
+    return (
+        f"计时: {rtt}，自适应超时 {stats.final_timeout:.2f}s，"
+        f"探测 {stats.probes} 次（重试 {stats.retried}，重试后确认 {stats.recovered}"
+        + (f"，本机资源不足 {stats.local_errors} 次" if stats.local_errors else "")
+        + "）"
+    )
+
+
+def format_scan_report(report: ScanReport) -> str:
+    """将扫描结果格式化为紧凑的工具输出。"""
+    open_ports = report.ports_in(PortState.OPEN)
+    closed = len(report.ports_in(PortState.CLOSED))
+    filtered = len(report.ports_in(PortState.FILTERED))
+    target = report.host if report.host == report.address else f"{report.host} ({report.address})"
+    lines = [
+        f"目标: {target}",
+        f"扫描端口数: {len(report.results)}，耗时 {report.elapsed:.2f}s",
+    ]
+    if open_ports:
+        lines.append(f"开放端口: {open_ports}")
+    else:
+        lines.append("未发现开放端口（在当前端口列表内）。")
+    lines.append(f"关闭: {closed}，过滤/超时: {filtered}")
+    errors = len(report.ports_in(PortState.ERROR))
+    if errors:
+        lines.append(f"本机资源不足未能探测: {errors} 个端口（如文件描述符耗尽，请降低 concurrency 后重扫）")
+    lines.append(_format_stats(report.stats))
+    return "\n".join(lines)
@@ -1,19 +1,23 @@
 """
 对话后端：FastAPI + 完整 Agent UI（frontend/ 静态页）。
-存储与对话走 run()；API：/api/chat、/api/sessions、/api/history。
+存储与对话走 run()；API：/api/chat、/api/chat/stream（SSE）、/api/jobs（后台任务）、/api/sessions、/api/history。
 """
 
 from __future__ import annotations
 
+import asyncio
+import json
 import logging
 import os
-from contextlib import asynccontextmanager
+from contextlib import aclosing, asynccontextmanager
 from pathlib import Path
 from typing import Optional
 
-from fastapi import Depends, FastAPI, HTTPException, Response, status
+from fastapi import Depends, FastAPI, HTTPException, Request, Response, status
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
+from starlette.background import BackgroundTask
+from sse_starlette.sse import EventSourceResponse
 
 from app.auth import (
     PASSWORD_MIN_LENGTH,
@@ -24,9 +28,21 @@ from app.auth import (
     set_auth_cookie,
     verify_password,
 )
+from app.checkpoint import close_checkpointer, delete_thread, get_checkpointer
 from app.db import get_db_session, init_db
-from app.run import run
-from app.storage import get_storage_manager, initialize_storage
+from app.jobs import (
+    FINISHED_STATUSES,
+    JobKind,
+    JobQuotaError,
+    get_job_queue,
+    start_job_queue,
+    stop_job_queue,
+)
+from app.retention import start_retention, stop_retention
+from app.run import run, run_stream
+from app.storage import SearchQueryError, close_storage, get_storage_manager, initialize_storage
+from app.tools.batch_scan import shutdown_scan_pool
+from app.tools.http_client import close_http_client, init_http_client
 import yaml
 from app.models import UserModel
 
@@ -40,11 +56,29 @@ for _name in ("app.callbacks", "app.run"):
 
 FRONTEND_DIR = Path(__file__).resolve().parent.parent / "frontend" / "dist"
 
+DISCONNECT_POLL_INTERVAL = 0.5
+# 客户端已断开、请求被放弃（沿用 nginx 的非标准状态码）
+CLIENT_CLOSED_REQUEST = 499
+# /api/history 单页消息数上限
+HISTORY_PAGE_MAX = 200
+# /api/search 单页结果数上限
+SEARCH_PAGE_MAX = 50
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await initialize_storage()
+    await get_checkpointer()
+    await init_http_client()
+    await start_job_queue()
+    await start_retention()
     yield
+    await stop_retention()
+    await stop_job_queue()
+    await close_http_client()
+    await close_checkpointer()
+    await close_storage()
+    shutdown_scan_pool()
 
 
 app = FastAPI(
@@ -56,6 +90,7 @@ app = FastAPI(
 
 class ChatRequest(BaseModel):
     message: str
+    session_id: Optional[str] = None  # 仅流式接口使用；为空时新建会话
 
 
 class ChatResponse(BaseModel):
@@ -76,18 +111,142 @@ class LlmConfigUpdate(BaseModel):
     api_key: Optional[str] = None
 
 
+async def _cancel_on_disconnect(request: Request, task: asyncio.Task) -> bool:
+    """客户端断开时取消 task（取消会传到 agent、工具与 socket），返回是否因断开而取消。"""
+    while not task.done():
+        if await request.is_disconnected():
+            task.cancel()
+            return True
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+    return False
+
+
+async def _require_own_session(session_id: str, user: UserModel) -> None:
+    """会话不存在或不属于当前用户时返回 404（只查会话行，不加载消息）。"""
+    info = await get_storage_manager().context.get_session_info(session_id)
+    if not info or info.user_id != user.username:
+        raise HTTPException(status_code=404, detail="会话不存在")
+
+
 @app.post("/api/chat", response_model=ChatResponse)
-async def chat(body: ChatRequest, current_user: UserModel = Depends(get_current_user)):
+async def chat(body: ChatRequest, request: Request, current_user: UserModel = Depends(get_current_user)):
     if not (body.message or "").strip():
         raise HTTPException(status_code=400, detail="message 不能为空")
     metadata = {
         "session_id": None,
         "user_id": current_user.username,
     }
-    session_id, reply, tool_calls = await run(body.message.strip(), metadata)
+    task = asyncio.create_task(run(body.message.strip(), metadata))
+    watcher = asyncio.create_task(_cancel_on_disconnect(request, task))
+    try:
+        session_id, reply, tool_calls = await task
+    except asyncio.CancelledError:
+        if not (watcher.done() and not watcher.cancelled() and watcher.result()):
+            raise  # 请求本身被取消（如服务关闭），取消已随 await 传给 task
+        # 客户端已断开：部分结果已由 run() 保存，这里只结束请求
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    finally:
+        watcher.cancel()
     return ChatResponse(session_id=session_id, reply=reply, tool_calls=tool_calls)
 
 
+@app.post("/api/chat/stream")
+async def chat_stream(body: ChatRequest, current_user: UserModel = Depends(get_current_user)):
+    """
+    流式对话（Server-Sent Events）：边执行边推送 session / token / tool_start / tool_progress /
+    tool_end 事件，结束时推送 done（内容同 /api/chat 的返回），出错时推送 error。
+    """
+    message = (body.message or "").strip()
+    if not message:
+        raise HTTPException(status_code=400, detail="message 不能为空")
+    if body.session_id:
+        await _require_own_session(body.session_id, current_user)
+    metadata = {
+        "session_id": body.session_id,
+        "user_id": current_user.username,
+    }
+
+    async def _events():
+        try:
+            async with aclosing(run_stream(message, metadata)) as stream:
+                async for ev in stream:
+                    yield {
+                        "event": ev["event"],
+                        "data": json.dumps(ev["data"], ensure_ascii=False, default=str),
+                    }
+        except Exception as e:
+            logging.getLogger("app.web").exception("流式对话失败")
+            yield {"event": "error", "data": json.dumps({"detail": str(e)}, ensure_ascii=False)}
+
+    events = _events()
+    # 客户端断开时 EventSourceResponse 只取消发送、不关闭生成器；响应结束后显式 aclose，
+    # 以取消仍在执行的 agent 与工具并保存部分结果（正常结束时为空操作）
+    return EventSourceResponse(events, background=BackgroundTask(events.aclose))
+
+
+class JobSubmitRequest(BaseModel):
+    """kind=tool 时需 tool + args；kind=agent 时需 message，可选 session_id 续聊。"""
+    kind: JobKind
+    tool: Optional[str] = None
+    args: dict = {}
+    message: Optional[str] = None
+    session_id: Optional[str] = None
+
+
+@app.post("/api/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def submit_job(body: JobSubmitRequest, current_user: UserModel = Depends(get_current_user)):
+    """提交后台任务，立即返回 job_id；之后轮询 /api/jobs/{job_id} 查看状态。"""
+    if body.session_id:
+        await _require_own_session(body.session_id, current_user)
+    if body.kind == JobKind.TOOL:
+        if not body.tool:
+            raise HTTPException(status_code=400, detail="tool 不能为空")
+        name, params = body.tool, body.args
+    else:
+        name, params = "", {"message": (body.message or "").strip()}
+    try:
+        return await get_job_queue().submit(
+            current_user.username, body.kind, name, params, session_id=body.session_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except JobQuotaError as e:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e))
+
+
+@app.get("/api/jobs")
+async def list_jobs(limit: int = 20, offset: int = 0, current_user: UserModel = Depends(get_current_user)):
+    jobs, total = await get_job_queue().list(current_user.username, limit=limit, offset=offset)
+    return {"total": total, "jobs": jobs}
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, current_user: UserModel = Depends(get_current_user)):
+    job = await get_job_queue().get(job_id, current_user.username)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+
+@app.get("/api/jobs/{job_id}/result")
+async def get_job_result(job_id: str, current_user: UserModel = Depends(get_current_user)):
+    """任务结果（工具任务为 {"output"}，agent 任务同 /api/chat 返回）；未结束时返回 409。"""
+    job = await get_job_queue().get(job_id, current_user.username, include_result=True)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    if job["status"] not in FINISHED_STATUSES:
+        raise HTTPException(status_code=409, detail=f"任务尚未结束（{job['status']}）")
+    return job
+
+
+@app.post("/api/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str, current_user: UserModel = Depends(get_current_user)):
+    job = await get_job_queue().cancel(job_id, current_user.username)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+
 @app.get("/api/config", response_model=LlmConfigResponse)
 async def get_config():
     """获取当前模型配置（api_key 只返回是否已设置）。"""
@@ -216,26 +375,86 @@ async def list_sessions(limit: int = 20, offset: int = 0, current_user: UserMode
 @app.delete("/api/sessions/{session_id}")
 async def delete_session(session_id: str, current_user: UserModel = Depends(get_current_user)):
     """删除该会话及其全部消息，彻底清除。仅当会话属于当前用户时允许删除。"""
-    storage = get_storage_manager()
-    ctx = await storage.context.get_session(session_id)
-    if not ctx or ctx.user_id != current_user.username:
-        raise HTTPException(status_code=404, detail="会话不存在")
-    ok = await storage.backend.delete_session(session_id)
+    await _require_own_session(session_id, current_user)
+    ok = await get_storage_manager().context.delete_session(session_id)
     if not ok:
         raise HTTPException(status_code=404, detail="会话不存在")
+    await delete_thread(session_id)
     return {"deleted": session_id}
 
 
 @app.get("/api/history")
-async def history(session_id: str, limit: int = 50, current_user: UserModel = Depends(get_current_user)):
+async def history(
+    session_id: str,
+    limit: int = 50,
+    before: Optional[int] = None,
+    include_tool_calls: bool = False,
+    current_user: UserModel = Depends(get_current_user),
+):
+    """
+    会话历史，按时间正序返回最近 limit 条；向前翻页时把上一页返回的 next_before 作为 before 传入。
+    has_more 表示更早的消息是否还有。
+    include_tool_calls=true 时每条消息带 tool_calls；压缩存储的大输出 output 为 null，经 /api/tool-calls/{id} 取。
+    """
+    limit = max(1, min(limit, HISTORY_PAGE_MAX))
+    await _require_own_session(session_id, current_user)
     storage = get_storage_manager()
-    ctx = await storage.context.get_session(session_id)
-    if not ctx or ctx.user_id != current_user.username:
-        raise HTTPException(status_code=404, detail="会话不存在")
-    messages = await storage.context.get_conversation_history(session_id, limit=limit)
+    # 多取一条判断是否还有更早的消息
+    messages = await storage.context.get_conversation_history(session_id, limit=limit + 1, before_id=before)
+    has_more = len(messages) > limit
+    if has_more:
+        messages = messages[1:]
+    out = [{"message_id": m["message_id"], "role": m["role"], "content": m["content"]} for m in messages]
+    if include_tool_calls:
+        calls = await storage.backend.get_tool_calls(
+            [m["message_id"] for m in messages if m["role"] == "assistant"]
+        )
+        for m in out:
+            m["tool_calls"] = calls.get(m["message_id"], [])
     return {
         "session_id": session_id,
-        "messages": [{"role": m["role"], "content": m["content"]} for m in messages],
+        "messages": out,
+        "has_more": has_more,
+        "next_before": messages[0]["message_id"] if has_more and messages else None,
+    }
+
+
+@app.get("/api/tool-calls/{tool_call_id}")
+async def get_tool_call(tool_call_id: int, current_user: UserModel = Depends(get_current_user)):
+    """单个工具调用的完整记录（入参与解压后的输出）。"""
+    call = await get_storage_manager().backend.get_tool_call(tool_call_id)
+    if call is None:
+        raise HTTPException(status_code=404, detail="工具调用不存在")
+    await _require_own_session(call["session_id"], current_user)
+    return call
+
+
+@app.get("/api/search")
+async def search(
+    q: str,
+    limit: int = 20,
+    offset: int = 0,
+    current_user: UserModel = Depends(get_current_user),
+):
+    """
+    在当前用户的全部会话中全文检索消息，按相关度排序；snippet 为已转义的 HTML 片段，命中处以 <mark> 标记。
+    翻页时把 next_offset 作为 offset 传入。
+    """
+    limit = max(1, min(limit, SEARCH_PAGE_MAX))
+    offset = max(0, offset)
+    try:
+        # 多取一条判断是否还有下一页
+        results = await get_storage_manager().backend.search_messages(
+            current_user.username, q, limit=limit + 1, offset=offset
+        )
+    except SearchQueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    has_more = len(results) > limit
+    return {
+        "query": q,
+        "results": results[:limit],
+        "has_more": has_more,
+        "next_offset": offset + limit if has_more else None,
     }
 
 
@@ -10,6 +10,7 @@ import {
   logout,
   me,
   register,
+  searchMessages,
   sendChat,
   updateConfig,
 } from "./api";
@@ -17,6 +18,7 @@ import type {
   AuthUser,
   ChatMessage,
   LlmConfig,
+  SearchResult,
   SessionSummary,
   SkillSummary,
 } from "./types";
@@ -32,7 +34,14 @@ const App: React.FC = () => {
   const [sessions, setSessions] = useState<SessionSummary[]>([]);
   const [currentSessionId, setCurrentSessionId] = useState<string>("");
   const [messages, setMessages] = useState<ChatMessage[]>([]);
+  // 向前翻页的游标（更早一页的 before），null 表示已到最早
+  const [historyBefore, setHistoryBefore] = useState<number | null>(null);
   const [input, setInput] = useState("");
+  // 全文检索：searchResults 为 null 时侧栏显示会话列表
+  const [searchQuery, setSearchQuery] = useState("");
+  const [searchResults, setSearchResults] = useState<SearchResult[] | null>(null);
+  const [searchNextOffset, setSearchNextOffset] = useState<number | null>(null);
+  const [searchError, setSearchError] = useState("");
   const [sending, setSending] = useState(false);
 
   const [config, setConfig] = useState<LlmConfig | null>(null);
@@ -62,8 +71,48 @@ const App: React.FC = () => {
   }
 
   async function loadHistory(sessionId: string) {
-    const msgs = await fetchHistory(sessionId);
-    setMessages(msgs);
+    const page = await fetchHistory(sessionId);
+    setMessages(page.messages);
+    setHistoryBefore(page.has_more ? page.next_before : null);
+  }
+
+  async function loadEarlierHistory() {
+    if (!currentSessionId || historyBefore == null) return;
+    const page = await fetchHistory(currentSessionId, historyBefore);
+    setMessages((prev) => [...page.messages, ...prev]);
+    setHistoryBefore(page.has_more ? page.next_before : null);
+  }
+
+  async function handleSearch() {
+    const q = searchQuery.trim();
+    if (!q) {
+      clearSearch();
+      return;
+    }
+    try {
+      const page = await searchMessages(q);
+      setSearchResults(page.results);
+      setSearchNextOffset(page.next_offset);
+      setSearchError("");
+    } catch (err: any) {
+      setSearchResults([]);
+      setSearchNextOffset(null);
+      setSearchError(err?.message || String(err));
+    }
+  }
+
+  async function loadMoreSearch() {
+    if (searchNextOffset == null) return;
+    const page = await searchMessages(searchQuery.trim(), searchNextOffset);
+    setSearchResults((prev) => [...(prev || []), ...page.results]);
+    setSearchNextOffset(page.next_offset);
+  }
+
+  function clearSearch() {
+    setSearchQuery("");
+    setSearchResults(null);
+    setSearchNextOffset(null);
+    setSearchError("");
   }
 
   async function handleSelectSession(sessionId: string) {
@@ -84,6 +133,7 @@ const App: React.FC = () => {
     if (currentSessionId === sessionId) {
       setCurrentSessionId("");
       setMessages([]);
+      setHistoryBefore(null);
     }
     await loadSessions();
   }
@@ -182,6 +232,7 @@ const App: React.FC = () => {
   function handleNewChat() {
     setCurrentSessionId("");
     setMessages([]);
+    setHistoryBefore(null);
     loadSessions();
   }
 
@@ -223,6 +274,8 @@ const App: React.FC = () => {
     setCurrentUser(null);
     setSessions([]);
     setMessages([]);
+    setHistoryBefore(null);
+    clearSearch();
   }
 
   return (
@@ -308,6 +361,14 @@ const App: React.FC = () => {
             onRefreshSessions={loadSessions}
             onSelectSession={handleSelectSession}
             onDeleteSession={handleDeleteSession}
+            searchQuery={searchQuery}
+            searchResults={searchResults}
+            searchHasMore={searchNextOffset != null}
+            searchError={searchError}
+            onSearchQueryChange={setSearchQuery}
+            onSearch={handleSearch}
+            onLoadMoreSearch={loadMoreSearch}
+            onClearSearch={clearSearch}
           />
 
           <main className="flex-1 flex flex-col min-w-0">
@@ -318,6 +379,15 @@ const App: React.FC = () => {
               </code>
             </div>
 
+            {historyBefore != null && (
+              <button
+                type="button"
+                onClick={loadEarlierHistory}
+                className="mx-auto mt-2 text-xs text-cyan-400 hover:underline"
+              >
+                加载更早的消息
+              </button>
+            )}
             <MessageList messages={messages} />
             <MessageInput
               value={input}
@@ -1,7 +1,9 @@
 import type {
   AuthUser,
   ChatMessage,
+  HistoryPage,
   LlmConfig,
+  SearchPage,
   SessionSummary,
   SkillSummary,
   ToolCall,
@@ -30,11 +32,38 @@ export async function fetchSessions(): Promise<SessionSummary[]> {
   return data.sessions || [];
 }
 
-export async function fetchHistory(sessionId: string): Promise<ChatMessage[]> {
-  const data = await fetchJson<{ messages: { role: "user" | "assistant"; content: string }[] }>(
-    `/api/history?session_id=${encodeURIComponent(sessionId)}`,
-  );
-  return (data.messages || []) as ChatMessage[];
+export async function fetchHistory(
+  sessionId: string,
+  before?: number | null,
+): Promise<HistoryPage> {
+  const params = new URLSearchParams({
+    session_id: sessionId,
+    include_tool_calls: "true",
+  });
+  if (before != null) params.set("before", String(before));
+  const data = await fetchJson<HistoryPage>(`/api/history?${params.toString()}`);
+  return {
+    messages: (data.messages || []) as ChatMessage[],
+    has_more: Boolean(data.has_more),
+    next_before: data.next_before ?? null,
+  };
+}
+
+export async function fetchToolCall(id: number): Promise<ToolCall> {
+  return fetchJson<ToolCall>(`/api/tool-calls/${id}`);
+}
+
+export async function searchMessages(
+  query: string,
+  offset = 0,
+): Promise<SearchPage> {
+  const params = new URLSearchParams({ q: query, offset: String(offset) });
+  const data = await fetchJson<SearchPage>(`/api/search?${params.toString()}`);
+  return {
+    results: data.results || [],
+    has_more: Boolean(data.has_more),
+    next_offset: data.next_offset ?? null,
+  };
 }
 
 export async function deleteSessionApi(sessionId: string): Promise<void> {
@@ -1,10 +1,64 @@
-import React from "react";
-import type { ChatMessage } from "../types";
+import React, { useState } from "react";
+import { fetchToolCall } from "../api";
+import type { ChatMessage, ToolCall } from "../types";
 
 export interface MessageListProps {
   messages: ChatMessage[];
 }
 
+function truncate(text: string): string {
+  return text.length > 500 ? text.slice(0, 500) + "…" : text;
+}
+
+// 历史中压缩存储的大输出不随列表返回，点击后再取
+const ToolOutput: React.FC<{ call: ToolCall }> = ({ call }) => {
+  const [output, setOutput] = useState<string | null>(null);
+  const [loading, setLoading] = useState(false);
+  const [error, setError] = useState<string | null>(null);
+
+  if (call.output == null && call.id != null && call.compressed) {
+    if (output != null) {
+      return (
+        <div className="text-slate-300 whitespace-pre-wrap break-words">
+          结果: {truncate(output)}
+        </div>
+      );
+    }
+    const load = async () => {
+      setLoading(true);
+      setError(null);
+      try {
+        const full = await fetchToolCall(call.id as number);
+        setOutput(String(full.output ?? ""));
+      } catch (e) {
+        setError((e as Error).message);
+      } finally {
+        setLoading(false);
+      }
+    };
+    return (
+      <div className="text-slate-400">
+        结果:{" "}
+        <button
+          type="button"
+          className="text-cyan-300 hover:underline disabled:opacity-50"
+          onClick={load}
+          disabled={loading}
+        >
+          {loading ? "加载中…" : `加载（${call.output_size ?? 0} 字节）`}
+        </button>
+        {error && <span className="text-red-400 ml-2">{error}</span>}
+      </div>
+    );
+  }
+  if (call.output == null || String(call.output) === "") return null;
+  return (
+    <div className="text-slate-300 whitespace-pre-wrap break-words">
+      结果: {truncate(String(call.output))}
+    </div>
+  );
+};
+
 const MessageList: React.FC<MessageListProps> = ({ messages }) => {
   return (
     <div className="flex-1 overflow-y-auto p-4 space-y-4">
@@ -50,15 +104,7 @@ const MessageList: React.FC<MessageListProps> = ({ messages }) => {
                               {JSON.stringify(tc.input).slice(0, 500)}
                             </div>
                           )}
-                        {tc.output != null &&
-                          String(tc.output || "") !== "" && (
-                            <div className="text-slate-300 whitespace-pre-wrap break-words">
-                              结果:{" "}
-                              {String(tc.output).length > 500
-                                ? String(tc.output).slice(0, 500) + "…"
-                                : String(tc.output)}
-                            </div>
-                          )}
+                        <ToolOutput call={tc} />
                       </div>
                     ))}
                   </div>
@@ -1,5 +1,5 @@
 import React from "react";
-import type { SessionSummary } from "../types";
+import type { SearchResult, SessionSummary } from "../types";
 
 export type SidebarProps = {
   sessions: SessionSummary[];
@@ -8,6 +8,14 @@ export type SidebarProps = {
   onRefreshSessions: () => void;
   onSelectSession: (sessionId: string) => void;
   onDeleteSession: (sessionId: string) => void;
+  searchQuery: string;
+  searchResults: SearchResult[] | null;
+  searchHasMore: boolean;
+  searchError: string;
+  onSearchQueryChange: (query: string) => void;
+  onSearch: () => void;
+  onLoadMoreSearch: () => void;
+  onClearSearch: () => void;
 };
 
 export const Sidebar: React.FC<SidebarProps> = ({
@@ -17,10 +25,44 @@ export const Sidebar: React.FC<SidebarProps> = ({
   onRefreshSessions,
   onSelectSession,
   onDeleteSession,
+  searchQuery,
+  searchResults,
+  searchHasMore,
+  searchError,
+  onSearchQueryChange,
+  onSearch,
+  onLoadMoreSearch,
+  onClearSearch,
 }) => {
   return (
     <aside className="w-72 border-r border-slate-700 flex flex-col shrink-0 bg-slate-800/50">
-      <div className="p-3 border-b border-slate-700 space-y-2"></div>
+      <div className="p-3 border-b border-slate-700 space-y-2">
+        <form
+          onSubmit={(e) => {
+            e.preventDefault();
+            onSearch();
+          }}
+          className="flex gap-1"
+        >
+          <input
+            type="search"
+            value={searchQuery}
+            onChange={(e) => onSearchQueryChange(e.target.value)}
+            placeholder="搜索历史消息（主机、CVE、banner…）"
+            className="flex-1 min-w-0 rounded-lg bg-slate-900 border border-slate-600 px-2 py-1.5 text-sm focus:outline-none focus:border-cyan-500"
+          />
+          {searchResults !== null && (
+            <button
+              type="button"
+              onClick={onClearSearch}
+              title="清除搜索"
+              className="shrink-0 rounded-lg px-2 text-slate-400 hover:text-slate-100 hover:bg-slate-700"
+            >
+              ×
+            </button>
+          )}
+        </form>
+      </div>
 
       <div className="p-3 border-b border-slate-700">
         <button
@@ -39,41 +81,83 @@ export const Sidebar: React.FC<SidebarProps> = ({
         </button>
       </div>
 
-      <div className="flex-1 overflow-y-auto p-3">
-        <div className="text-xs text-slate-400 mb-2">会话列表</div>
-        {sessions.length === 0 ? (
-          <p className="text-slate-500 text-sm">
-            暂无会话，发送消息将自动创建
-          </p>
-        ) : (
-          <ul className="space-y-1">
-            {sessions.map((s) => (
-              <li key={s.session_id} className="flex items-center gap-1 group">
-                <button
-                  type="button"
-                  onClick={() => onSelectSession(s.session_id)}
-                  className={
-                    "flex-1 min-w-0 rounded-lg px-3 py-2 text-sm text-left hover:bg-slate-700 truncate " +
-                    (s.session_id === currentSessionId
-                      ? "bg-slate-700 text-cyan-400"
-                      : "")
-                  }
-                >
-                  {s.session_id.slice(0, 8)}… ({s.message_count || 0} 条)
-                </button>
-                <button
-                  type="button"
-                  title="删除会话"
-                  onClick={() => onDeleteSession(s.session_id)}
-                  className="shrink-0 rounded p-1.5 text-slate-400 hover:text-red-400 hover:bg-slate-700 opacity-0 group-hover:opacity-100 transition-opacity text-lg leading-none"
-                >
-                  ×
-                </button>
-              </li>
-            ))}
-          </ul>
-        )}
-      </div>
+      {searchResults !== null ? (
+        <div className="flex-1 overflow-y-auto p-3">
+          <div className="text-xs text-slate-400 mb-2">搜索结果</div>
+          {searchError ? (
+            <p className="text-red-400 text-sm">{searchError}</p>
+          ) : searchResults.length === 0 ? (
+            <p className="text-slate-500 text-sm">没有匹配的消息</p>
+          ) : (
+            <ul className="space-y-1">
+              {searchResults.map((r) => (
+                <li key={r.message_id}>
+                  <button
+                    type="button"
+                    onClick={() => onSelectSession(r.session_id)}
+                    className="w-full rounded-lg px-3 py-2 text-left text-sm hover:bg-slate-700"
+                  >
+                    <div className="text-xs text-slate-400">
+                      {r.session_id.slice(0, 8)}… · {r.role === "user" ? "用户" : "助手"}
+                    </div>
+                    {/* snippet 由后端转义，只含 <mark> 标签 */}
+                    <div
+                      className="break-words [&_mark]:bg-cyan-700 [&_mark]:text-slate-100"
+                      dangerouslySetInnerHTML={{ __html: r.snippet }}
+                    />
+                  </button>
+                </li>
+              ))}
+            </ul>
+          )}
+          {searchHasMore && (
+            <button
+              type="button"
+              onClick={onLoadMoreSearch}
+              className="w-full mt-2 rounded-lg bg-slate-600 hover:bg-slate-500 px-3 py-2 text-sm"
+            >
+              更多结果
+            </button>
+          )}
+        </div>
+      ) : (
+        <div className="flex-1 overflow-y-auto p-3">
+          <div className="text-xs text-slate-400 mb-2">会话列表</div>
+          {sessions.length === 0 ? (
+            <p className="text-slate-500 text-sm">
+              暂无会话，发送消息将自动创建
+            </p>
+          ) : (
+            <ul className="space-y-1">
+              {sessions.map((s) => (
+                <li key={s.session_id} className="flex items-center gap-1 group">
+                  <button
+                    type="button"
+                    onClick={() => onSelectSession(s.session_id)}
+                    title={s.last_message?.content}
+                    className={
+                      "flex-1 min-w-0 rounded-lg px-3 py-2 text-sm text-left hover:bg-slate-700 truncate " +
+                      (s.session_id === currentSessionId
+                        ? "bg-slate-700 text-cyan-400"
+                        : "")
+                    }
+                  >
+                    {s.session_id.slice(0, 8)}… ({s.message_count || 0} 条){s.archived ? " · 已归档" : ""}
+                  </button>
+                  <button
+                    type="button"
+                    title="删除会话"
+                    onClick={() => onDeleteSession(s.session_id)}
+                    className="shrink-0 rounded p-1.5 text-slate-400 hover:text-red-400 hover:bg-slate-700 opacity-0 group-hover:opacity-100 transition-opacity text-lg leading-none"
+                  >
+                    ×
+                  </button>
+                </li>
+              ))}
+            </ul>
+          )}
+        </div>
+      )}
     </aside>
   );
 };
@@ -1,21 +1,50 @@
 export type ToolCall = {
+  // 历史记录中的工具调用带 id；压缩存储的大输出 output 为 null，经 fetchToolCall 按需获取
+  id?: number;
   tool?: string;
   input?: Record<string, unknown>;
   output?: unknown;
+  output_size?: number;
+  compressed?: boolean;
 };
 
 export type ChatMessage = {
+  message_id?: number;
   role: "user" | "assistant";
   content: string;
   tool_calls?: ToolCall[];
 };
 
+export type HistoryPage = {
+  messages: ChatMessage[];
+  has_more: boolean;
+  next_before: number | null;
+};
+
 export type SessionSummary = {
   session_id: string;
   user_id: string;
   created_at: string;
   updated_at: string;
   message_count: number;
+  last_message?: { role: "user" | "assistant"; content: string } | null;
+  archived?: boolean;
+};
+
+export type SearchResult = {
+  message_id: number;
+  session_id: string;
+  role: "user" | "assistant";
+  created_at: string;
+  // 已转义的 HTML 片段，命中处以 <mark> 标记
+  snippet: string;
+  score: number;
+};
+
+export type SearchPage = {
+  results: SearchResult[];
+  has_more: boolean;
+  next_offset: number | null;
 };
 
 export type LlmConfig = {
@@ -0,0 +1,56 @@
+"""
+独立的后台任务工作进程：与 Web 进程共享数据库中的 jobs 表，按 JOB_WORKERS 配置并发数。
+用 uv 运行：uv run worker 或 uv run python run_worker.py
+
+Web 进程可设 JOB_WORKERS=0 只负责提交与查询，扫描等重活全部交给工作进程。
+"""
+import asyncio
+import logging
+import os
+import signal
+
+
+async def _serve() -> None:
+    from app.checkpoint import close_checkpointer, get_checkpointer
+    from app.jobs import start_job_queue, stop_job_queue
+    from app.storage import close_storage, initialize_storage
+    from app.tools.batch_scan import shutdown_scan_pool
+    from app.tools.http_client import close_http_client, init_http_client
+
+    await initialize_storage()
+    await get_checkpointer()
+    await init_http_client()
+    queue = await start_job_queue()
+    if queue.workers == 0:
+        logging.getLogger("app.jobs").warning("JOB_WORKERS=0，工作进程不会执行任何任务")
+    # SIGTERM / SIGINT 时正常退出：本进程运行中的工具任务重新排队（agent 任务置为失败）
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+    try:
+        await stop.wait()
+    finally:
+        await stop_job_queue()
+        await close_http_client()
+        await close_checkpointer()
+        await close_storage()
+        shutdown_scan_pool()
+
+
+def main() -> None:
+    # Web 进程也会写同一数据库中的会话，本进程的会话缓存会读到旧消息，默认关闭（见 app.storage.context_manager）
+    os.environ.setdefault("SESSION_CACHE_SIZE", "0")
+    level = logging.DEBUG if os.environ.get("LOG_LEVEL") == "DEBUG" else logging.INFO
+    logging.basicConfig(level=level, format="%(levelname)s %(name)s %(message)s")
+    try:
+        asyncio.run(_serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+测试共用配置：数据库、checkpoint 与归档目录指向临时目录（须在导入 app 之前设置环境变量）。
+"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+
+_TMP_DIR = tempfile.mkdtemp(prefix="skill-demo-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_TMP_DIR, 'data.db')}"
+os.environ["ARCHIVE_DIR"] = os.path.join(_TMP_DIR, "archive")
+os.environ["CHECKPOINT_DB_PATH"] = os.path.join(_TMP_DIR, "checkpoints.db")
+os.environ.setdefault("JOB_WORKERS", "0")
+
+import pytest  # noqa: E402
+
+from app.db import init_db  # noqa: E402
+from app.storage import close_storage, initialize_storage  # noqa: E402
+
+
+def pytest_sessionstart(session):
+    init_db()
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_TMP_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def with_storage():
+    """在新的事件循环中初始化存储并执行 fn(storage)，结束后关闭存储。"""
+    def run(fn):
+        async def main():
+            storage = await initialize_storage()
+            try:
+                return await fn(storage)
+            finally:
+                await close_storage()
+        return asyncio.run(main())
+    return run
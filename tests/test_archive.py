@@ -0,0 +1,49 @@
+"""会话归档与恢复：恢复后的消息顺序与本轮新写入的消息。"""
+
+import uuid
+from datetime import datetime, timedelta
+
+
+def _idle_before() -> datetime:
+    return datetime.utcnow() + timedelta(seconds=1)
+
+
+def test_archive_round_trip_keeps_messages_and_tool_calls(with_storage):
+    async def scenario(storage):
+        ctx = await storage.context.create_session(user_id=f"u-{uuid.uuid4()}")
+        sid = ctx.session_id
+        await storage.context.add_message(sid, "user", "扫描 example.com")
+        await storage.context.add_message(
+            sid, "assistant", "发现 80 端口开放",
+            {"tool_calls": [{"tool": "port_scan", "input": {"host": "example.com"}, "output": "80/tcp open"}]},
+        )
+        before = await storage.context.get_conversation_history(sid)
+        assert await storage.context.archive_session(sid, _idle_before())
+        assert (await storage.context.get_session_info(sid)).archive_path
+
+        assert await storage.context.restore_session(sid)
+        after = await storage.context.get_conversation_history(sid)
+        assert [(m["role"], m["content"]) for m in after] == [(m["role"], m["content"]) for m in before]
+        calls = await storage.backend.get_tool_calls([after[-1]["message_id"]])
+        assert [c["tool"] for c in calls[after[-1]["message_id"]]] == ["port_scan"]
+        assert not await storage.context.restore_session(sid)
+
+    with_storage(scenario)
+
+
+def test_restore_before_new_message_keeps_order(with_storage):
+    """归档删除的是表中最大的 id，SQLite 会复用；先恢复再写入，新消息必须排在既往历史之后。"""
+    async def scenario(storage):
+        ctx = await storage.context.create_session(user_id=f"u-{uuid.uuid4()}")
+        sid = ctx.session_id
+        for i in range(3):
+            await storage.context.add_message(sid, "user" if i % 2 == 0 else "assistant", f"历史消息 {i}")
+        assert await storage.context.archive_session(sid, _idle_before())
+
+        assert await storage.context.restore_session(sid)
+        new_id = await storage.context.add_message(sid, "user", "本轮输入")
+        history = await storage.context.get_conversation_history(sid)
+        assert [m["content"] for m in history] == ["历史消息 0", "历史消息 1", "历史消息 2", "本轮输入"]
+        assert all(m["message_id"] < new_id for m in history[:-1])
+
+    with_storage(scenario)
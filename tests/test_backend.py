@@ -0,0 +1,13 @@
+"""持久化后端的抽象约束。"""
+
+import pytest
+
+from app.storage.backend import _SessionBackend
+
+
+def test_session_backend_without_execute_fails_at_construction():
+    class Incomplete(_SessionBackend):
+        pass
+
+    with pytest.raises(TypeError, match="_execute"):
+        Incomplete()
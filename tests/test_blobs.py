@@ -0,0 +1,72 @@
+"""工具调用大输出的 blob 存储：相同内容只存一份，删除 / 归档引用行时按引用计数回收。"""
+
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from app.db import get_session
+from app.models import BlobModel
+from app.storage.blobs import blob_key
+from app.storage.payload import TOOL_PAYLOAD_COMPRESS_MIN
+
+
+def _refcount(key: str) -> Optional[int]:
+    with get_session() as session:
+        row = session.get(BlobModel, key)
+        return None if row is None else row.refcount
+
+
+def _large_output() -> str:
+    line = f"{uuid.uuid4()} 80/tcp open http\n"
+    return line * (TOOL_PAYLOAD_COMPRESS_MIN // len(line) + 2)
+
+
+async def _session_with_output(storage, user_id: str, output: str, calls: int = 1) -> str:
+    ctx = await storage.context.create_session(user_id=user_id)
+    await storage.context.add_message(
+        ctx.session_id, "assistant", "扫描完成",
+        {"tool_calls": [{"tool": "port_scan", "input": {"host": "example.com"}, "output": output}] * calls},
+    )
+    return ctx.session_id
+
+
+def test_blob_shared_across_sessions_and_released_on_delete(with_storage):
+    output = _large_output()
+    key = blob_key(output.encode("utf-8"))
+
+    async def scenario(storage):
+        user = f"u-{uuid.uuid4()}"
+        first = await _session_with_output(storage, user, output, calls=2)
+        second = await _session_with_output(storage, user, output)
+        assert _refcount(key) == 3
+
+        assert await storage.context.delete_session(first)
+        assert _refcount(key) == 1
+        history = await storage.context.get_conversation_history(second)
+        call = (await storage.backend.get_tool_calls([history[-1]["message_id"]]))[history[-1]["message_id"]][0]
+        assert call["compressed"] and call["output"] is None
+        assert (await storage.backend.get_tool_call(call["id"]))["output"] == output
+
+        assert await storage.context.delete_session(second)
+        assert _refcount(key) is None
+
+    with_storage(scenario)
+
+
+def test_blob_reference_released_on_archive_and_retained_on_restore(with_storage):
+    output = _large_output()
+    key = blob_key(output.encode("utf-8"))
+
+    async def scenario(storage):
+        sid = await _session_with_output(storage, f"u-{uuid.uuid4()}", output)
+        assert _refcount(key) == 1
+        assert await storage.context.archive_session(sid, datetime.utcnow() + timedelta(seconds=1))
+        assert _refcount(key) is None
+
+        assert await storage.context.restore_session(sid)
+        assert _refcount(key) == 1
+        history = await storage.context.get_conversation_history(sid)
+        call = (await storage.backend.get_tool_calls([history[-1]["message_id"]]))[history[-1]["message_id"]][0]
+        assert (await storage.backend.get_tool_call(call["id"]))["output"] == output
+
+    with_storage(scenario)
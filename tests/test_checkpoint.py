@@ -0,0 +1,97 @@
+"""checkpoint 裁剪：压缩为一个 checkpoint 后状态不变，子图命名空间一并清除，之后的对话照常续接。"""
+
+import asyncio
+import uuid
+from typing import Annotated, TypedDict
+
+import pytest
+from langgraph.channels import DeltaChannel
+from langgraph.graph import END, START, StateGraph
+
+from app import checkpoint
+
+
+def _concat(state, writes):
+    out = list(state)
+    for w in writes:
+        out.extend(w)
+    return out
+
+
+class _State(TypedDict):
+    messages: Annotated[list, DeltaChannel(_concat)]
+    turns: int
+
+
+class _SubState(TypedDict):
+    turns: int
+
+
+def _build(saver):
+    sub = StateGraph(_SubState)
+    sub.add_node("count", lambda s: {"turns": s["turns"]})
+    sub.add_edge(START, "count")
+    sub.add_edge("count", END)
+
+    graph = StateGraph(_State)
+    graph.add_node("reply", lambda s: {"messages": [f"reply:{len(s['messages'])}"], "turns": s.get("turns", 0) + 1})
+    graph.add_node("sub", sub.compile())
+    graph.add_edge(START, "reply")
+    graph.add_edge("reply", "sub")
+    graph.add_edge("sub", END)
+    return graph.compile(checkpointer=saver)
+
+
+async def _checkpoints(saver, config):
+    return [t.config["configurable"]["checkpoint_ns"] async for t in saver.alist(config)]
+
+
+@pytest.fixture
+def run_with_saver():
+    def run(fn):
+        async def main():
+            try:
+                saver = await checkpoint.get_checkpointer()
+                return await fn(saver, _build(saver))
+            finally:
+                await checkpoint.close_checkpointer()
+        return asyncio.run(main())
+    return run
+
+
+def test_prune_round_trip_keeps_state(run_with_saver, monkeypatch):
+    monkeypatch.setattr(checkpoint, "CHECKPOINT_PRUNE_AFTER", 3)
+    thread_id = str(uuid.uuid4())
+    config = {"configurable": {"thread_id": thread_id}}
+
+    async def scenario(saver, graph):
+        for i in range(4):
+            await graph.ainvoke({"messages": [f"user:{i}"]}, config)
+        namespaces = await _checkpoints(saver, config)
+        assert len(namespaces) > 3 and any(ns for ns in namespaces)
+        before = (await graph.aget_state(config)).values
+
+        await checkpoint.prune_thread(graph, thread_id)
+        assert await _checkpoints(saver, config) == [""]
+        assert (await graph.aget_state(config)).values == before
+
+        await graph.ainvoke({"messages": ["user:4"]}, config)
+        after = (await graph.aget_state(config)).values
+        assert after["messages"] == before["messages"] + ["user:4", "reply:9"]
+        assert after["turns"] == 5
+
+    run_with_saver(scenario)
+
+
+def test_prune_skips_threads_under_the_limit(run_with_saver, monkeypatch):
+    monkeypatch.setattr(checkpoint, "CHECKPOINT_PRUNE_AFTER", 100)
+    thread_id = str(uuid.uuid4())
+    config = {"configurable": {"thread_id": thread_id}}
+
+    async def scenario(saver, graph):
+        await graph.ainvoke({"messages": ["user:0"]}, config)
+        before = await _checkpoints(saver, config)
+        await checkpoint.prune_thread(graph, thread_id)
+        assert await _checkpoints(saver, config) == before
+
+    run_with_saver(scenario)
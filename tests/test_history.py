@@ -0,0 +1,107 @@
+"""对话历史窗口：按 token 预算淘汰整轮，摘要增量合并，未超预算时不创建摘要模型。"""
+
+import asyncio
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from app.history import build_window, estimate_tokens, is_summary_message, split_for_budget, summary_message
+
+
+class _FakeModel:
+    def __init__(self, reply: str = "合并后的摘要") -> None:
+        self.reply = reply
+        self.prompts = []
+
+    async def ainvoke(self, messages):
+        self.prompts.append(messages[0].content)
+        return AIMessage(content=self.reply)
+
+
+def _turn(i: int, size: int = 400):
+    return [
+        HumanMessage(content=f"问题{i} " + "x" * size),
+        AIMessage(content="", tool_calls=[{"name": "port_scan", "args": {"host": f"10.0.0.{i}"}, "id": f"c{i}"}]),
+        ToolMessage(content=f"结果{i} " + "y" * size, tool_call_id=f"c{i}", name="port_scan"),
+        AIMessage(content=f"回答{i}"),
+    ]
+
+
+def _history(n: int):
+    return [m for i in range(n) for m in _turn(i)]
+
+
+def _factory(model, calls):
+    def make():
+        calls.append(1)
+        return model
+
+    return make
+
+
+def test_split_keeps_whole_recent_turns_within_budget():
+    history = _history(5)
+    turn_cost = estimate_tokens(_turn(0))
+    evicted, kept = split_for_budget(history, keep_tokens=turn_cost * 2)
+    assert len(evicted) == 3
+    assert [m for t in evicted for m in t] + kept == history
+    # 保留部分从用户消息开始，工具调用与结果不被拆开
+    assert isinstance(kept[0], HumanMessage) and kept[0].content.startswith("问题3")
+    assert estimate_tokens(kept) <= turn_cost * 2
+
+
+def test_split_always_keeps_latest_turn():
+    history = _history(3)
+    evicted, kept = split_for_budget(history, keep_tokens=1)
+    assert len(evicted) == 2
+    assert kept == _turn(2)
+
+
+def test_split_folds_leading_non_user_messages_into_first_turn():
+    history = [AIMessage(content="开场")] + _history(2)
+    evicted, kept = split_for_budget(history, keep_tokens=1)
+    assert evicted == [[AIMessage(content="开场")] + _turn(0)]
+    assert kept == _turn(1)
+
+
+def test_under_budget_returns_history_without_building_model():
+    history = _history(2)
+    calls = []
+    window = asyncio.run(build_window(history, "旧摘要", _factory(_FakeModel(), calls), budget=10_000, keep_tokens=5_000))
+    assert not calls
+    assert not window.compacted
+    assert window.summary == "旧摘要" and window.kept == history
+
+
+def test_over_budget_folds_evicted_turns_into_previous_summary():
+    history = _history(6)
+    turn_cost = estimate_tokens(_turn(0))
+    model, calls = _FakeModel(), []
+    # 存量历史开头的旧摘要消息以 summary 参数为准，不再计入窗口
+    messages = [summary_message("过期摘要")] + history
+    window = asyncio.run(
+        build_window(messages, "旧摘要", _factory(model, calls), budget=turn_cost * 4, keep_tokens=turn_cost * 2)
+    )
+    assert len(calls) == 1
+    assert window.compacted and window.evicted_turns == 4
+    assert window.summary == "合并后的摘要"
+    assert window.kept == history[-8:]
+    assert not any(is_summary_message(m) for m in window.kept)
+    # 增量合并：提示只包含旧摘要与本次淘汰的轮次
+    (prompt,) = model.prompts
+    assert "旧摘要" in prompt and "过期摘要" not in prompt
+    assert "问题0" in prompt and "问题3" in prompt and "port_scan" in prompt
+    assert "问题4" not in prompt and "问题5" not in prompt
+
+
+def test_summary_failure_keeps_full_history():
+    class _Broken:
+        async def ainvoke(self, messages):
+            raise RuntimeError("模型不可用")
+
+    history = _history(6)
+    turn_cost = estimate_tokens(_turn(0))
+    window = asyncio.run(
+        build_window(history, "旧摘要", lambda: _Broken(), budget=turn_cost * 4, keep_tokens=turn_cost * 2)
+    )
+    assert not window.compacted
+    assert window.summary == "旧摘要" and window.kept == history
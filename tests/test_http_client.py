@@ -0,0 +1,50 @@
+"""共享 HTTP 客户端：只在所属事件循环内复用，其他循环使用短期客户端且不替换共享客户端。"""
+
+import asyncio
+import threading
+
+from app.tools import http_client as hc
+
+
+def test_other_loops_get_a_short_lived_client():
+    async def lifespan_loop(ready: threading.Event, release: threading.Event):
+        shared = await hc.init_http_client()
+        async with hc.http_client() as client:
+            assert client is shared
+        ready.set()
+        while not release.is_set():
+            await asyncio.sleep(0.01)
+        async with hc.http_client() as client:
+            assert client is shared and not shared.is_closed
+        await hc.close_http_client()
+        return shared
+
+    async def other_loop():
+        async with hc.http_client() as client:
+            assert client is not hc._client
+        assert client.is_closed
+        return client
+
+    ready, release = threading.Event(), threading.Event()
+    result = {}
+    t = threading.Thread(target=lambda: result.setdefault("shared", asyncio.run(lifespan_loop(ready, release))))
+    t.start()
+    assert ready.wait(5)
+    try:
+        short_lived = asyncio.run(other_loop())
+        assert hc._client is not short_lived
+    finally:
+        release.set()
+        t.join(5)
+    assert result["shared"].is_closed
+    assert hc._client is None
+
+
+def test_without_init_every_call_closes_its_client():
+    async def scenario():
+        async with hc.http_client() as client:
+            pass
+        return client
+
+    assert asyncio.run(scenario()).is_closed
+    assert hc._client is None
@@ -0,0 +1,68 @@
+"""有界 GET：总时限覆盖 body 读取与重定向链。"""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app.tools.http_get import fetch_bounded
+
+
+async def _drip(reader, writer):
+    # 先发响应头，之后每 50ms 发一个字节，永不结束
+    await reader.readuntil(b"\r\n\r\n")
+    writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\nTransfer-Encoding: chunked\r\n\r\n")
+    try:
+        while True:
+            writer.write(b"1\r\nx\r\n")
+            await writer.drain()
+            await asyncio.sleep(0.05)
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+    finally:
+        writer.close()
+
+
+async def _slow_redirect(reader, writer):
+    # 每一跳都在单次读超时之内响应，但重定向链没有尽头
+    await reader.readuntil(b"\r\n\r\n")
+    await asyncio.sleep(0.1)
+    writer.write(b"HTTP/1.1 302 Found\r\nLocation: /again\r\nContent-Length: 0\r\n\r\n")
+    await writer.drain()
+    writer.close()
+
+
+async def _serve_and_fetch(handler, **kwargs):
+    server = await asyncio.start_server(handler, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        async with httpx.AsyncClient() as client:
+            started = time.perf_counter()
+            try:
+                return await fetch_bounded(client, f"http://127.0.0.1:{port}/", **kwargs), time.perf_counter() - started
+            except TimeoutError as e:
+                return e, time.perf_counter() - started
+    finally:
+        server.close()
+
+
+def test_drip_fed_body_stops_at_the_deadline():
+    result, elapsed = asyncio.run(_serve_and_fetch(_drip, timeout=1.0, deadline=0.4, max_bytes=4096))
+    assert elapsed < 1.0
+    assert result.status_code == 200
+    assert result.timed_out and result.truncated
+    assert 0 < len(result.body) < 4096
+
+
+def test_redirect_chain_is_bounded_by_the_deadline():
+    result, elapsed = asyncio.run(_serve_and_fetch(_slow_redirect, timeout=1.0, deadline=0.5, max_redirects=100))
+    assert isinstance(result, TimeoutError)
+    assert "总时限" in str(result)
+    assert elapsed < 1.0
+
+
+def test_body_budget_still_applies_without_timeout():
+    result, _ = asyncio.run(_serve_and_fetch(_drip, timeout=1.0, deadline=5.0, max_bytes=3))
+    assert result.body == b"xxx"
+    assert result.truncated and not result.timed_out
@@ -0,0 +1,165 @@
+"""后台任务：中断恢复、排队配额与 worker 唤醒。"""
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import pytest
+from sqlalchemy import delete, select
+
+from app import jobs
+from app.db import get_session
+from app.jobs import JobKind, JobQueue, JobQuotaError, JobStatus
+from app.models import JobModel
+
+
+@pytest.fixture(autouse=True)
+def _empty_jobs():
+    # 认领按全表最早的任务，各用例从空表开始
+    with get_session() as session:
+        session.execute(delete(JobModel))
+
+
+def _user() -> str:
+    return f"u-{uuid.uuid4()}"
+
+
+def _claim(worker_id: str, job_id: str) -> dict:
+    job = jobs._claim_next_sync(worker_id, 100)
+    assert job is not None and job["job_id"] == job_id
+    return job
+
+
+def test_agent_job_gets_session_id_at_submit():
+    async def scenario():
+        queue = JobQueue(workers=0)
+        job = await queue.submit(_user(), JobKind.AGENT, "", {"message": "你好"})
+        assert job["session_id"]
+        kept = await queue.submit(_user(), JobKind.AGENT, "", {"message": "你好"}, session_id="s-1")
+        assert kept["session_id"] == "s-1"
+
+    asyncio.run(scenario())
+
+
+def test_interrupted_agent_job_fails_instead_of_retrying():
+    user = _user()
+    job = asyncio.run(JobQueue(workers=0).submit(user, JobKind.AGENT, "", {"message": "扫描 example.com"}))
+    _claim("w-agent", job["job_id"])
+
+    assert jobs._recover_jobs_sync("w-agent", None, 3) == 1
+    row = jobs._get_job_sync(job["job_id"], user, False)
+    assert row["status"] == JobStatus.FAILED.value
+    assert row["session_id"] == job["session_id"]
+    assert row["error"]
+    assert jobs._claim_next_sync("w-other", 100) is None
+
+
+def test_interrupted_tool_job_is_requeued_until_attempts_run_out():
+    user = _user()
+    job = jobs._insert_job_sync(user, JobKind.TOOL.value, "port_scan", {"host": "127.0.0.1"}, None, 10)
+    for attempt in range(1, 3):
+        _claim(f"w-{attempt}", job["job_id"])
+        jobs._recover_jobs_sync(f"w-{attempt}", None, 2)
+        status = jobs._get_job_sync(job["job_id"], user, False)["status"]
+        assert status == (JobStatus.QUEUED.value if attempt < 2 else JobStatus.FAILED.value)
+
+
+def test_claim_rechecks_limits_in_the_update():
+    """预选结果过期时（另一进程刚认领了同会话 / 同用户的任务），条件 UPDATE 仍拒绝认领。"""
+    user = _user()
+    first = jobs._insert_job_sync(user, JobKind.AGENT.value, "agent", {"message": "a"}, "s-1", 10)
+    second = jobs._insert_job_sync(user, JobKind.AGENT.value, "agent", {"message": "b"}, "s-1", 10)
+    _claim("w-1", first["job_id"])
+    assert jobs._try_claim_sync("w-2", second["job_id"], user, 100) is None
+
+    tool = jobs._insert_job_sync(user, JobKind.TOOL.value, "port_scan", {}, None, 10)
+    assert jobs._try_claim_sync("w-2", tool["job_id"], user, 1) is None
+    assert jobs._try_claim_sync("w-2", tool["job_id"], user, 2)["status"] == JobStatus.RUNNING.value
+
+
+_CLAIMER = """
+import json, sys, time
+from app import jobs
+start, worker_id = float(sys.argv[1]), sys.argv[2]
+while time.time() < start:
+    time.sleep(0.001)
+claimed, idle = [], 0
+while idle < 20:
+    job = jobs._claim_next_sync(worker_id, 2)
+    if job is None:
+        idle += 1
+    else:
+        idle = 0
+        claimed.append(job["job_id"])
+print(json.dumps(claimed))
+"""
+
+
+def test_two_processes_respect_session_and_user_limits():
+    """两个工作进程共享同一个数据库文件并发认领：同一会话只运行一个 agent 任务，每用户运行数不超过上限。"""
+    agent_user, tool_user = _user(), _user()
+    for i in range(6):
+        jobs._insert_job_sync(agent_user, JobKind.AGENT.value, "agent", {"message": str(i)}, "s-shared", 20)
+        jobs._insert_job_sync(tool_user, JobKind.TOOL.value, "port_scan", {}, None, 20)
+
+    start = time.time() + 2
+    procs = [
+        subprocess.Popen(
+            [sys.executable, "-c", _CLAIMER, str(start), f"w-{i}"],
+            cwd=Path(__file__).resolve().parent.parent, env=os.environ.copy(),
+            stdout=subprocess.PIPE, text=True,
+        )
+        for i in range(2)
+    ]
+    claimed = [json.loads(p.communicate(timeout=60)[0]) for p in procs]
+    assert all(p.returncode == 0 for p in procs)
+
+    all_claimed = claimed[0] + claimed[1]
+    assert len(all_claimed) == len(set(all_claimed))
+    with get_session() as session:
+        running = session.execute(
+            select(JobModel.job_id, JobModel.user_id).where(JobModel.status == JobStatus.RUNNING.value)
+        ).all()
+    assert sorted(job_id for job_id, _ in running) == sorted(all_claimed)
+    assert sum(user_id == agent_user for _, user_id in running) == 1
+    assert sum(user_id == tool_user for _, user_id in running) == 2
+
+
+def test_pending_quota_holds_under_concurrent_submits():
+    user, limit = _user(), 3
+    inserted, rejected = [], []
+
+    def submit():
+        try:
+            inserted.append(jobs._insert_job_sync(user, JobKind.TOOL.value, "port_scan", {}, None, limit))
+        except JobQuotaError:
+            rejected.append(True)
+
+    threads = [threading.Thread(target=submit) for _ in range(12)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(inserted) == limit
+    assert len(rejected) == 12 - limit
+    with pytest.raises(JobQuotaError):
+        jobs._insert_job_sync(user, JobKind.TOOL.value, "port_scan", {}, None, limit)
+
+
+def test_notify_wakes_every_waiting_worker():
+    async def scenario():
+        queue = JobQueue(workers=0)
+        captured = [queue._wakeup for _ in range(3)]
+        waiters = [asyncio.create_task(e.wait()) for e in captured]
+        await asyncio.sleep(0)
+        queue._notify()
+        await asyncio.wait_for(asyncio.gather(*waiters), 1)
+        assert not queue._wakeup.is_set()
+
+    asyncio.run(scenario())
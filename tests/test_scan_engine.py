@@ -0,0 +1,139 @@
+"""扫描引擎：端口规格解析、RTT 超时估算，以及本机资源不足（EMFILE）时的降级与报告。"""
+
+import asyncio
+import errno
+import socket
+
+import pytest
+
+from app.tools import scan_engine
+from app.tools.resolver import ResolvedAddress
+from app.tools.scan_engine import (
+    TOP_100_PORTS,
+    PortState,
+    RttEstimator,
+    _PortSpecError,
+    format_scan_report,
+    parse_ports,
+    scan_ports,
+)
+
+
+@pytest.mark.parametrize(
+    "spec, expected",
+    [
+        (80, [80]),
+        ("443, 22,80,22", [22, 80, 443]),
+        ([8080, "20-22"], [20, 21, 22, 8080]),
+        ("25-23", [23, 24, 25]),
+        ("65534-", [65534, 65535]),
+        ("-3", [1, 2, 3]),
+        ("TOP5", sorted(TOP_100_PORTS[:5])),
+        ("top", sorted(TOP_100_PORTS)),
+        ("top100,1-2", sorted({1, 2, *TOP_100_PORTS})),
+    ],
+)
+def test_parse_ports(spec, expected):
+    assert parse_ports(spec) == expected
+
+
+@pytest.mark.parametrize("spec", ["top0", "top101", "top1000"])
+def test_parse_ports_rejects_top_beyond_builtin_table(spec):
+    with pytest.raises(_PortSpecError, match="top100"):
+        parse_ports(spec)
+
+
+@pytest.mark.parametrize("spec", [True, False, [80, True], "http", "80,abc", "1-x", 0, "65536", [70000]])
+def test_parse_ports_rejects_invalid_specs(spec):
+    with pytest.raises(ValueError):
+        parse_ports(spec)
+
+
+def test_rtt_estimator_uses_initial_timeout_until_first_sample():
+    est = RttEstimator(initial_timeout=1.0, min_timeout=0.1, max_timeout=3.0)
+    assert est.timeout == 1.0 and est.rtt_avg is None
+    assert RttEstimator(initial_timeout=5.0, max_timeout=3.0).timeout == 3.0
+
+
+def test_rtt_estimator_follows_rfc6298():
+    est = RttEstimator(min_timeout=0.01, max_timeout=3.0)
+    est.observe(0.1)
+    # 首个样本：srtt = r，rttvar = r / 2
+    assert est.timeout == pytest.approx(0.1 + 4 * 0.05)
+    est.observe(0.3)
+    rttvar = 0.75 * 0.05 + 0.25 * abs(0.1 - 0.3)
+    srtt = 0.875 * 0.1 + 0.125 * 0.3
+    assert est.timeout == pytest.approx(srtt + 4 * rttvar)
+    assert (est.samples, est.rtt_min, est.rtt_max) == (2, 0.1, 0.3)
+    assert est.rtt_avg == pytest.approx(0.2)
+
+
+def test_rtt_estimator_clamps_timeout():
+    fast = RttEstimator(min_timeout=0.1, max_timeout=3.0)
+    fast.observe(0.001)
+    assert fast.timeout == 0.1
+    slow = RttEstimator(min_timeout=0.1, max_timeout=3.0)
+    slow.observe(2.0)
+    assert slow.timeout == 3.0
+
+
+def test_retry_timeout_backs_off_exponentially_up_to_max():
+    est = RttEstimator(initial_timeout=0.2, min_timeout=0.1, max_timeout=3.0)
+    assert [est.retry_timeout(a) for a in (1, 2, 3, 4, 5)] == pytest.approx([0.4, 0.8, 1.6, 3.0, 3.0])
+
+
+@pytest.fixture
+def listener():
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    server.listen(16)
+    yield server.getsockname()[1]
+    server.close()
+
+
+def _free_ports(n: int) -> list:
+    socks = [socket.socket() for _ in range(n)]
+    for s in socks:
+        s.bind(("127.0.0.1", 0))
+    ports = [s.getsockname()[1] for s in socks]
+    for s in socks:
+        s.close()
+    return ports
+
+
+def _failing_socket(monkeypatch, failures: float):
+    real = scan_engine._new_socket
+    calls = {"n": 0}
+
+    def fake(family):
+        calls["n"] += 1
+        if calls["n"] <= failures:
+            raise OSError(errno.EMFILE, "Too many open files")
+        return real(family)
+
+    monkeypatch.setattr(scan_engine, "_new_socket", fake)
+    monkeypatch.setattr(scan_engine, "LOCAL_ERROR_BACKOFF", 0)
+
+
+def _scan(ports):
+    return asyncio.run(scan_ports(
+        "127.0.0.1", ports, address=ResolvedAddress(socket.AF_INET, "127.0.0.1"), concurrency=8, retries=0,
+    ))
+
+
+def test_socket_exhaustion_is_retried_with_lower_concurrency(monkeypatch, listener):
+    closed = _free_ports(5)
+    _failing_socket(monkeypatch, failures=4)
+    report = _scan([listener] + closed)
+    assert report.ports_in(PortState.OPEN) == [listener]
+    assert report.ports_in(PortState.CLOSED) == sorted(closed)
+    assert report.ports_in(PortState.ERROR) == []
+    assert report.stats.local_errors == 4
+
+
+def test_persistent_socket_exhaustion_is_reported_not_filtered(monkeypatch, listener):
+    _failing_socket(monkeypatch, failures=float("inf"))
+    report = _scan([listener, listener + 1])
+    assert report.ports_in(PortState.ERROR) == [listener, listener + 1]
+    assert report.ports_in(PortState.FILTERED) == []
+    assert "本机资源不足未能探测: 2" in format_scan_report(report)
@@ -0,0 +1,58 @@
+"""消息搜索按用户隔离：trigram 索引（长词）与 LIKE（短词）两条路径都只返回本人会话中的消息。"""
+
+import uuid
+
+import pytest
+
+from app.storage.search import SearchQueryError
+
+
+async def _seed(storage, user_id: str, *contents: str) -> str:
+    ctx = await storage.context.create_session(user_id=user_id)
+    for content in contents:
+        await storage.context.add_message(ctx.session_id, "user", content)
+    return ctx.session_id
+
+
+@pytest.mark.parametrize("query", ["nginx 1.18", "80 端口", "CVE-2021-41773"])
+def test_search_only_returns_own_sessions(with_storage, query):
+    async def scenario(storage):
+        alice, mallory = f"alice-{uuid.uuid4()}", f"mallory-{uuid.uuid4()}"
+        own = await _seed(storage, alice, "目标 80 端口 nginx 1.18 存在 CVE-2021-41773")
+        await _seed(storage, mallory, "另一目标 80 端口 nginx 1.18 同样存在 CVE-2021-41773")
+        await _seed(storage, mallory, "nginx 1.18 80 端口 CVE-2021-41773 第二个会话")
+
+        hits = await storage.backend.search_messages(alice, query)
+        assert [h["session_id"] for h in hits] == [own]
+        assert len(await storage.backend.search_messages(mallory, query)) == 2
+
+    with_storage(scenario)
+
+
+def test_search_prefix_user_ids_and_fts_syntax_do_not_leak(with_storage):
+    async def scenario(storage):
+        base = f"u-{uuid.uuid4()}"
+        await _seed(storage, base, "banner: OpenSSH_8.2p1 Ubuntu")
+        await _seed(storage, base + "x", "banner: OpenSSH_8.2p1 Debian")
+        await _seed(storage, "x" + base, "banner: OpenSSH_8.2p1 CentOS")
+
+        hits = await storage.backend.search_messages(base, "OpenSSH_8.2p1")
+        assert len(hits) == 1 and "Ubuntu" in hits[0]["snippet"]
+        # 查询中的 FTS 语法按字面匹配，不能绕开 owner 限定
+        assert await storage.backend.search_messages(base, 'OpenSSH" OR "Debian') == []
+        assert await storage.backend.search_messages(f"nobody-{uuid.uuid4()}", "OpenSSH_8.2p1") == []
+        with pytest.raises(SearchQueryError):
+            await storage.backend.search_messages(base, "   ")
+
+    with_storage(scenario)
+
+
+def test_search_drops_deleted_sessions(with_storage):
+    async def scenario(storage):
+        user = f"u-{uuid.uuid4()}"
+        sid = await _seed(storage, user, "weblogic 反序列化 CVE-2020-14882")
+        assert len(await storage.backend.search_messages(user, "CVE-2020-14882")) == 1
+        assert await storage.context.delete_session(sid)
+        assert await storage.backend.search_messages(user, "CVE-2020-14882") == []
+
+    with_storage(scenario)
@@ -0,0 +1,50 @@
+"""会话缓存：其他进程也写同一数据库时默认关闭，另一进程写入的回复立即可见。"""
+
+import os
+import subprocess
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+from app.storage import ContextManager, SessionCache
+
+
+def _default_size(**env) -> int:
+    full_env = {k: v for k, v in os.environ.items() if k not in ("SESSION_CACHE_SIZE", "JOB_WORKERS")}
+    full_env.update(env)
+    out = subprocess.run(
+        [sys.executable, "-c", "from app.storage.context_manager import SESSION_CACHE_SIZE as n; print(n)"],
+        cwd=Path(__file__).resolve().parent.parent, env=full_env, capture_output=True, text=True, check=True,
+    )
+    return int(out.stdout)
+
+
+@pytest.mark.parametrize("env, expected", [
+    ({}, 256),
+    ({"JOB_WORKERS": "2"}, 256),
+    ({"JOB_WORKERS": "0"}, 0),
+    ({"JOB_WORKERS": "0", "SESSION_CACHE_SIZE": "32"}, 32),
+])
+def test_cache_defaults_off_when_jobs_run_elsewhere(env, expected):
+    assert _default_size(**env) == expected
+
+
+def test_uncached_reader_sees_writes_from_another_process(with_storage):
+    async def scenario(storage):
+        web = ContextManager(storage.backend, SessionCache(max_entries=0))
+        cached_web = ContextManager(storage.backend, SessionCache(max_entries=16))
+        worker = ContextManager(storage.backend, SessionCache(max_entries=0))
+
+        ctx = await web.create_session(user_id=f"u-{uuid.uuid4()}")
+        await web.add_message(ctx.session_id, "user", "扫描 example.com")
+        assert len((await cached_web.get_session(ctx.session_id)).messages) == 1
+
+        await worker.add_message(ctx.session_id, "assistant", "扫描完成")
+        assert [m["content"] for m in await web.get_conversation_history(ctx.session_id)][-1] == "扫描完成"
+        assert len((await web.get_session(ctx.session_id)).messages) == 2
+        # 开着缓存的进程在 TTL 内仍返回旧快照，这正是默认关闭的原因
+        assert len((await cached_web.get_session(ctx.session_id)).messages) == 1
+
+    with_storage(scenario)
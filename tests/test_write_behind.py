@@ -0,0 +1,68 @@
+"""消息写入合并：每个事件循环一个写入协程，写入协程停止时排队的消息不会让调用方永远等待。"""
+
+import asyncio
+import itertools
+import threading
+
+import pytest
+
+from app.storage.write_behind import MessageWriter
+
+
+def _writer(delay: float = 0.0) -> MessageWriter:
+    ids = itertools.count(1)
+
+    async def write_batch(batch):
+        await asyncio.sleep(delay)
+        return [next(ids) for _ in batch]
+
+    return MessageWriter(write_batch)
+
+
+def test_each_loop_gets_its_own_writer():
+    writer = _writer(delay=0.2)
+    started, result = threading.Event(), {}
+
+    async def slow_loop():
+        task = asyncio.ensure_future(writer.add("s", "user", "来自线程循环"))
+        await asyncio.sleep(0.05)
+        started.set()
+        result["thread"] = await task
+
+    t = threading.Thread(target=lambda: asyncio.run(slow_loop()))
+    t.start()
+    assert started.wait(5)
+    # 另一个循环在线程循环的消息提交前开始写入：线程循环中排队的消息仍正常提交
+    main_id = asyncio.run(writer.add("s", "user", "来自主循环"))
+    t.join(5)
+    assert isinstance(main_id, int) and isinstance(result["thread"], int)
+    assert main_id != result["thread"]
+
+
+def test_stopped_writer_fails_queued_messages_and_restarts():
+    async def scenario():
+        writer = _writer(delay=0.1)
+        first = asyncio.ensure_future(writer.add("s", "user", "一"))
+        second = asyncio.ensure_future(writer.add("s", "user", "二"))
+        await asyncio.sleep(0.01)
+        (_, task), = writer._lanes.values()
+        task.cancel()
+        for fut in (first, second):
+            with pytest.raises(RuntimeError, match="已停止"):
+                await asyncio.wait_for(fut, 1)
+        # 之后的写入启动新的写入协程
+        assert isinstance(await asyncio.wait_for(writer.add("s", "user", "三"), 1), int)
+        await writer.close()
+
+    asyncio.run(scenario())
+
+
+def test_close_flushes_queued_messages():
+    async def scenario():
+        writer = _writer(delay=0.01)
+        pending = [asyncio.ensure_future(writer.add("s", "user", str(i))) for i in range(5)]
+        await asyncio.sleep(0)
+        await writer.close()
+        return [p.result() for p in pending]
+
+    assert sorted(asyncio.run(scenario())) == [1, 2, 3, 4, 5]